@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""Time each stage of the evaluation, and main.run end to end, on synthetic
+inputs (see synthetic.py), and write the results as JSON:
+
+    python benchmarks/bench.py -o results.json [--terms 5000 ...]
+
+Each stage is run once to compile its kernels and fill caches (reported as
+"first"), then repeat times. Peak memory is measured in an extra run with
+tracemalloc, which traces the arrays allocated by numpy but not the ones
+allocated inside numba kernels. Compare two result files with compare.py.
+"""
+import os
+import sys
+import gc
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+
+import numpy as np
+import numba as nb
+
+BENCHMARKS_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, '..'))
+
+from catool import main
+from catool import onto
+from catool import inou
+from catool import utils
+from catool import metrics
+from catool import parallel
+from catool.conversion import mapper
+
+import synthetic
+
+def measure(fn, setup=None, repeat=5):
+    """Return the timings and the peak memory of fn(*setup())."""
+    def call():
+        args = setup() if setup is not None else ()
+        gc.collect()
+        start = time.perf_counter()
+        fn(*args)
+        return time.perf_counter() - start
+
+    first = call()
+    times = [ call() for _ in range(repeat) ]
+
+    args = setup() if setup is not None else ()
+    gc.collect()
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'first': first,
+        'times': times,
+        'min': min(times),
+        'median': float(np.median(times)),
+        'peak_memory': peak,
+    }
+
+def _commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=BENCHMARKS_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(args, tmp_dir):
+    namespace = args.namespace
+    obo_file = os.path.join(tmp_dir, 'go.obo')
+    true_fin = os.path.join(tmp_dir, 'true_y.tsv.gz')
+    pred_fin = os.path.join(tmp_dir, 'pred.tsv.gz')
+    terms = synthetic.make_obo(obo_file, args.terms, args.depth, args.fan_in, args.seed)
+    proteins = synthetic.make_benchmark(true_fin, terms, args.proteins,
+                                        args.annotations, args.seed)
+    synthetic.make_predictions(pred_fin, terms, proteins, args.predictions,
+                               args.coverage, args.seed)
+
+    # point catool at the synthetic inputs, so that caches are written next to
+    # them instead of in the package
+    onto.OBO_FILE = obo_file
+    onto.__GO__[0] = None
+    main.TRUE_FIN = true_fin
+    utils.CACHE_DIR = tmp_dir
+
+    stages = {}
+    def stage(name, fn, setup=None):
+        stages[name] = measure(fn, setup, args.repeat)
+        print('{:<28}{:>10.4f}s{:>12.1f}MB'.format(
+            name, stages[name]['median'], stages[name]['peak_memory'] / 2 ** 20),
+            file=sys.stderr)
+
+    stage('Ontology.load_data',
+          lambda: onto.Ontology(obo_file, with_rels=True, include_alt_ids=False))
+    go = main.get_go()
+    stage('create_parents_cache',
+          lambda: utils.create_parents_cache(
+              go, namespace, os.path.join(tmp_dir, 'parents.cache')))
+
+    stage('read_groundtruth', lambda: inou.read_groundtruth(true_fin, go, namespace, None))
+    _, benchmark_prots, y_true = inou.read_groundtruth(true_fin, go, namespace, None)
+
+    pred = inou.cast_predictions_into_dict(pred_fin, namespace)
+    mapped_pred = mapper.map(pred)
+    stage('predictions_into_a_matrix',
+          lambda: utils.predictions_into_a_matrix(mapped_pred, benchmark_prots, namespace))
+    n_predicted, y_pred = utils.predictions_into_a_matrix(mapped_pred, benchmark_prots,
+                                                          namespace)
+
+    parents = utils.load_parents(namespace)
+    stage('propagate_terms', lambda m: utils.propagate_terms(m, *parents),
+          lambda: (y_pred.copy(),))
+    utils.propagate_terms(y_pred, *parents)
+
+    thresholds = metrics.get_thresholds(None)
+    out = np.empty((len(thresholds), 4))
+    stage('precision_recall_curve',
+          lambda: metrics.precision_recall_curve(y_true, y_pred, n_predicted, out,
+                                                 thresholds))
+
+    stage('main.run', lambda: main.run(pred, 'full', namespace))
+    stage('main.run (sparse)', lambda: main.run(pred, 'full', namespace, sparse=True))
+
+    return stages
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-o', '--output', help='JSON file (default: stdout)')
+    parser.add_argument('--terms', type=int, default=5000, help='number of GO terms')
+    parser.add_argument('--depth', type=int, default=12, help='levels below the roots')
+    parser.add_argument('--fan-in', type=int, default=3, help='maximum number of parents')
+    parser.add_argument('--proteins', type=int, default=5000, help='benchmark proteins')
+    parser.add_argument('--annotations', type=int, default=5,
+                        help='mean annotations per protein and namespace')
+    parser.add_argument('--predictions', type=int, default=50,
+                        help='mean predictions per predicted protein')
+    parser.add_argument('--coverage', type=float, default=0.8,
+                        help='fraction of benchmark proteins with predictions')
+    parser.add_argument('--namespace', default='biological_process')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--threads', type=int, help='thread budget (default: all)')
+    args = parser.parse_args()
+    parallel.set_threads(args.threads)
+
+    tmp_dir = tempfile.mkdtemp(prefix='catool-bench-')
+    try:
+        stages = run_benchmarks(args, tmp_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    results = {
+        'params': dict(vars(args)),
+        'environment': {
+            'commit': _commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'numba': nb.__version__,
+            'n_threads': parallel.get_threads(),
+            'machine': platform.machine(),
+        },
+        'stages': stages,
+    }
+    results['params'].pop('output')
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    cli()
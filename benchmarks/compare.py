@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""Compare two result files of bench.py (e.g. of two commits):
+
+    python benchmarks/compare.py old.json new.json [--tolerance 0.1]
+
+For each stage, print the median times, their ratio and the peak memory.
+Exit with status 1 if a stage is slower than tolerance (10% by default) or
+uses more memory.
+"""
+import sys
+import json
+import argparse
+
+def compare(old, new, tolerance=0.1):
+    """Return the rows (stage, old median, new median, ratio, old peak, new
+peak, regression) for the stages of both results."""
+    rows = []
+    for name, stats in new['stages'].items():
+        if name not in old['stages']:
+            continue
+        ref = old['stages'][name]
+        ratio = stats['median'] / ref['median'] if ref['median'] > 0 else float('inf')
+        regression = ratio > 1. + tolerance \
+            or stats['peak_memory'] > (1. + tolerance) * ref['peak_memory']
+        rows.append((name, ref['median'], stats['median'], ratio,
+                     ref['peak_memory'], stats['peak_memory'], regression))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args()
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    if old['params'] != new['params']:
+        print('warning: results were obtained with different parameters', file=sys.stderr)
+
+    rows = compare(old, new, args.tolerance)
+    print('{:<28}{:>10}{:>10}{:>8}{:>10}{:>10}'.format(
+        'stage', 'old (s)', 'new (s)', 'ratio', 'old MB', 'new MB'))
+    for name, t_old, t_new, ratio, m_old, m_new, regression in rows:
+        print('{:<28}{:>10.4f}{:>10.4f}{:>8.2f}{:>10.1f}{:>10.1f}{}'.format(
+            name, t_old, t_new, ratio, m_old / 2 ** 20, m_new / 2 ** 20,
+            '  <- regression' if regression else ''))
+
+    sys.exit(1 if any(row[-1] for row in rows) else 0)
+
+if __name__ == '__main__':
+    main()
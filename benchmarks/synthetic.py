@@ -0,0 +1,131 @@
+"""Generators of synthetic inputs for the benchmarks: an OBO ontology with a
+given number of terms, depth and fan-in, a benchmark (groundtruth) file and a
+prediction file.
+
+Benchmark proteins are CAFA ids and predicted proteins are UniProt accessions
+taken from the mapping files of catool.conversion, so that predictions are
+mapped as real ones (at most one protein per entry of the mapping files).
+"""
+import os
+import gzip
+import random
+
+CONVERSION_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                              '..', 'catool', 'conversion')
+
+ROOTS = {
+    'biological_process': 'GO:0008150',
+    'molecular_function': 'GO:0003674',
+    'cellular_component': 'GO:0005575',
+}
+# fraction of the terms of each namespace, as in the GO
+SIZES = {
+    'biological_process': 0.6,
+    'molecular_function': 0.25,
+    'cellular_component': 0.15,
+}
+
+def make_obo(fout, n_terms=5000, depth=12, fan_in=3, seed=0):
+    """
+    Write an ontology with about n_terms terms. In each namespace, terms
+    are spread over depth levels below the root: a term has a parent in the
+    level above it (so that the deepest terms are depth levels below the
+    root), plus up to fan_in - 1 parents in any level above it. A third of
+    the extra parents are part_of relationships.
+
+    Return a dict namespace -> list of GO ids (the root first).
+    """
+    rng = random.Random(seed)
+    ids = iter(rng.sample(range(1, 10000000), n_terms + 3 * depth + 3))
+    terms = {}
+    lines = ['format-version: 1.2', '']
+    for namespace, root in ROOTS.items():
+        levels = [ [root] ]
+        lines += [ '[Term]', 'id: ' + root, 'name: ' + namespace,
+                   'namespace: ' + namespace, '' ]
+        n = max(depth, int(n_terms * SIZES[namespace]))
+        for i in range(n):
+            # the first terms fill every level
+            level = i + 1 if i < depth else rng.randint(1, depth)
+            while len(levels) <= level:
+                levels.append([])
+            term = 'GO:{:07d}'.format(next(ids))
+            while term in ROOTS.values():
+                term = 'GO:{:07d}'.format(next(ids))
+            parents = set([ rng.choice(levels[level - 1]) ])
+            for _ in range(rng.randint(1, fan_in) - 1):
+                parents.add(rng.choice(levels[rng.randint(0, level - 1)]))
+            levels[level].append(term)
+
+            lines += [ '[Term]', 'id: ' + term, 'name: term ' + term,
+                       'namespace: ' + namespace ]
+            for k, parent in enumerate(sorted(parents)):
+                if k > 0 and rng.random() < 1. / 3:
+                    lines.append('relationship: part_of {} ! parent'.format(parent))
+                else:
+                    lines.append('is_a: {} ! parent'.format(parent))
+            lines.append('')
+        terms[namespace] = [ t for level in levels for t in level ]
+    lines += [ '[Typedef]', 'id: part_of', 'name: part of', '' ]
+
+    with open(fout, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+    return terms
+
+def protein_pairs():
+    """Return the list of (UniProt accession, CAFA id) pairs found in the
+mapping files, sorted by CAFA id."""
+    acc2id = {}
+    with gzip.open(os.path.join(CONVERSION_DIR, 'uniprot_ac_to_id_9606.map.gz'), 'rt') as f:
+        for a in f:
+            acc, _, prot_id = a.strip().split('\t')
+            acc2id.setdefault(prot_id, acc)
+    pairs = []
+    with gzip.open(os.path.join(CONVERSION_DIR, 'sp_species.9606.map.gz'), 'rt') as f:
+        for a in f:
+            cafa_id, prot_id = a.strip().split('\t')
+            if prot_id in acc2id:
+                pairs.append((acc2id[prot_id], cafa_id))
+    return sorted(pairs, key=lambda p: p[1])
+
+def make_benchmark(fout, terms, n_proteins=5000, n_annotations=5, seed=0):
+    """
+    Write a gzipped benchmark file annotating n_proteins proteins with
+    1 to 2 * n_annotations - 1 terms of each namespace (terms as returned by
+    make_obo, roots excluded).
+
+    Return the list of (UniProt accession, CAFA id) of the benchmark proteins.
+    """
+    rng = random.Random(seed)
+    pairs = protein_pairs()
+    if n_proteins > len(pairs):
+        raise ValueError("At most {} proteins can be mapped.".format(len(pairs)))
+    proteins = rng.sample(pairs, n_proteins)
+
+    with gzip.open(fout, 'wt') as f:
+        for _, cafa_id in proteins:
+            for namespace_terms in terms.values():
+                for _ in range(rng.randint(1, 2 * n_annotations - 1)):
+                    f.write('{}\t{}\n'.format(cafa_id, rng.choice(namespace_terms[1:])))
+
+    return proteins
+
+def make_predictions(fout, terms, proteins, n_predictions=50, coverage=0.8,
+                     seed=0):
+    """
+    Write a gzipped prediction file where a fraction coverage of the
+    proteins (as returned by make_benchmark) have 1 to 2 * n_predictions - 1
+    predictions, with scores rounded to 2 decimals, spread over the
+    namespaces as their terms.
+    """
+    rng = random.Random(seed)
+    all_terms = [ t for namespace_terms in terms.values() for t in namespace_terms[1:] ]
+
+    with gzip.open(fout, 'wt') as f:
+        for acc, _ in proteins:
+            if rng.random() >= coverage:
+                continue
+            for _ in range(rng.randint(1, 2 * n_predictions - 1)):
+                f.write('{}\t{}\t{:.2f}\n'.format(acc, rng.choice(all_terms),
+                                                  rng.random()))
@@ -1,2 +1,21 @@
-from .main import f1max_score
-from .main import run
+import importlib
+
+# modules are imported on first use (see __getattr__), so that importing the
+# package doesn't import numba nor compile anything
+_EXPORTS = {
+    'run': 'main',
+    'f1max_score': 'main',
+}
+_SUBMODULES = ('main', 'onto', 'inou', 'utils', 'metrics', 'sparse', 'cache',
+               'batch', 'server', 'incremental', 'instrument', 'parallel',
+               'conversion')
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        return getattr(importlib.import_module('.' + _EXPORTS[name], __name__), name)
+    if name in _SUBMODULES:
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+def __dir__():
+    return sorted(list(globals()) + list(_EXPORTS) + list(_SUBMODULES))
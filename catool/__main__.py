@@ -1,21 +1,130 @@
 #!/usr/bin/env python3
 import sys
-import os
-
-from . import main
-from . import inou
-from . import utils
 
 if __name__ == '__main__':
+    if '--profile' in sys.argv:
+        # report the stages of each evaluation as JSON lines on stderr
+        # (see instrument), as with CATOOL_PROFILE=1
+        from . import instrument
+
+        sys.argv.remove('--profile')
+        instrument.enable()
+
+    if '--threads' in sys.argv:
+        # thread budget of the kernels, shared by the workers of batch and
+        # serve (see parallel), as with CATOOL_THREADS=n
+        from . import parallel
+
+        k = sys.argv.index('--threads')
+        parallel.set_threads(int(sys.argv[k + 1]))
+        del sys.argv[k:k + 2]
+
+    if sys.argv[1] == 'client':
+        # evaluate with a running server, as the commands below:
+        # python -m catool client pred mode namespace ftype
+        # python -m catool client all pred ftype
+        # python -m catool client stop
+        from . import server
+        from . import utils
+
+        if sys.argv[2] == 'stop':
+            server.shutdown()
+        elif sys.argv[2] == 'all':
+            results = server.run_all_file(sys.argv[3], int(sys.argv[4]))
+            for (namespace, mode), ns_results in results.items():
+                utils.results2string(ns_results, mode, namespace)
+        else:
+            pred_fin, mode, namespace, ftype = sys.argv[2:6]
+            results = server.run_file(pred_fin, mode, namespace, int(ftype))
+            utils.results2string(results, mode, namespace)
+        sys.exit(0)
+
+    if sys.argv[1] == 'serve':
+        # keep caches and compiled kernels warm: python -m catool serve [ftype [n_workers]]
+        from . import server
+
+        ftype = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+        n_workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+        server.serve(ftype, n_workers)
+        sys.exit(0)
+
+    if sys.argv[1] == 'warmup':
+        # compile the kernels into the cache of numba and build the caches of
+        # the ontology and the benchmarks: python -m catool warmup [ftype]
+        from . import main
+
+        main.warm_up(int(sys.argv[2]) if len(sys.argv) > 2 else 1)
+        sys.exit(0)
+
+    # commands above only import what they need
+    from . import main
+    from . import inou
+    from . import utils
+
+    if sys.argv[1] == 'all':
+        # evaluate all namespaces and modes: python -m catool all pred ftype
+        pred_fin = sys.argv[2] # predictions
+        ftype = int(sys.argv[3])
+
+        # read predictions of all namespaces from file
+        proteins, prot_idx, terms, scores = inou.read_predictions_arrays(pred_fin)
+
+        results = main.run_all_arrays(proteins, terms, scores, ftype, prot_idx=prot_idx)
+        for (namespace, mode), ns_results in results.items():
+            utils.results2string(ns_results, mode, namespace)
+        sys.exit(0)
+
+    if sys.argv[1] == 'batch':
+        # evaluate many prediction files in parallel:
+        # python -m catool [--threads n] batch ftype pred1 pred2 ...
+        from . import batch
+
+        ftype = int(sys.argv[2])
+        table = batch.evaluate_files(sys.argv[3:], ftype)
+        batch.table2string(table)
+        sys.exit(0)
+
+    if sys.argv[1] == 'compare':
+        # paired permutation test between two prediction files:
+        # python -m catool compare pred_a pred_b mode namespace ftype [n_permutations]
+        mode = sys.argv[4]
+        namespace = sys.argv[5]
+        ftype = int(sys.argv[6])
+        n_permutations = int(sys.argv[7]) if len(sys.argv) > 7 else 10000
+
+        preds = []
+        for pred_fin in sys.argv[2:4]:
+            proteins, prot_idx, terms, scores = inou.read_predictions_arrays(pred_fin, namespace)
+            preds.append((proteins, terms, scores, prot_idx))
+
+        test = main.permutation_test_arrays(preds[0], preds[1], mode, namespace,
+                                            ftype, n_permutations=n_permutations)
+        print("{}\t{}\t{:.4f}\t{:.4f}\t{:.4f}\t{:.4f}\t{:.4g}".format(
+            mode, namespace, test['fmax_a'], test['fmax_b'], test['difference'],
+            test['effect_size'], test['p_value']))
+        sys.exit(0)
+
+    if sys.argv[1] == 'terms':
+        # term-centric ROC-AUC and AUPR:
+        # python -m catool terms pred mode namespace ftype [min_positives]
+        pred_fin = sys.argv[2]
+        mode = sys.argv[3]
+        namespace = sys.argv[4]
+        ftype = int(sys.argv[5])
+        min_positives = int(sys.argv[6]) if len(sys.argv) > 6 else 1
+
+        proteins, prot_idx, terms, scores = inou.read_predictions_arrays(pred_fin, namespace)
+        terms, results = main.run_terms_arrays(proteins, terms, scores, mode, namespace,
+                                               ftype, prot_idx=prot_idx,
+                                               min_positives=min_positives)
+        utils.terms2string(terms, results, mode, namespace)
+        sys.exit(0)
+
     pred_fin = sys.argv[1] # predictions
     mode = sys.argv[2] # full or partial
     namespace = sys.argv[3]
     ftype = int(sys.argv[4])
 
-    go = main.get_go()
     # read preditions from file
-    pred = inou.cast_predictions_into_dict(pred_fin, namespace)
-
-    #print(main.f1max_score(pred, mode, namespace))
-    results = main.run(pred, mode, namespace, ftype)
+    results = main.run_file(pred_fin, mode, namespace, ftype)
     utils.results2string(results, mode, namespace)
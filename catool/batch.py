@@ -0,0 +1,90 @@
+"""Evaluation of many prediction files in parallel worker processes.
+
+Caches (ontology snapshot, parents of terms, benchmarks and id mappings) are
+built once by the parent process before starting the workers. Workers
+memory-map the same cache files (see cache.load_arrays), so these arrays are
+shared through the page cache instead of being pickled with each task.
+
+Workers are not forked from the parent, since forking a process whose numba
+threads are running can deadlock: a fork server is used when available.
+"""
+import multiprocessing as mp
+
+from . import main
+from . import onto
+from . import inou
+from . import utils
+from . import parallel
+from .conversion import mapper
+
+def _load_caches(ftype):
+    go = main.get_go()
+    mapper.get_index()
+    true_fin = main._get_benchmark_file(ftype)
+    for namespace in onto.NAMESPACES.values():
+        utils.load_parents(namespace)
+        inou.load_groundtruth(true_fin, go, namespace)
+
+def _init_worker(ftype, n_threads):
+    # split the thread budget among workers to avoid oversubscription
+    parallel.set_threads(n_threads)
+    # map caches built by the parent
+    _load_caches(ftype)
+
+def _evaluate_file(args):
+    pred_fin, ftype, sparse, thresholds = args
+    proteins, prot_idx, terms, scores = inou.read_predictions_arrays(pred_fin)
+    results = main.run_all_arrays(proteins, terms, scores, ftype, sparse,
+                                  thresholds, prot_idx=prot_idx)
+
+    rows = []
+    for (namespace, mode), ns_results in results.items():
+        rows.append((pred_fin, namespace, mode) + utils.fmax_row(ns_results))
+    return rows
+
+def evaluate_files(pred_fins, ftype=1, n_jobs=None, sparse=True, thresholds=None):
+    """
+    Evaluate prediction files (see inou.read_predictions_arrays) with
+    main.run_all_arrays, using n_jobs worker processes (by default, one per
+    thread of the budget, see parallel), which share the thread budget.
+
+    Output:
+    ======
+    - table: a list of rows (pred_fin, namespace, mode, thr, fmax, precision,
+      recall), where the last four values are taken at the threshold
+      maximizing f1.
+    """
+    _load_caches(ftype)
+
+    if n_jobs is None:
+        n_jobs = parallel.get_threads()
+    n_jobs = max(1, min(n_jobs, len(pred_fins)))
+    tasks = [ (pred_fin, ftype, sparse, thresholds) for pred_fin in pred_fins ]
+
+    table = []
+    if n_jobs == 1:
+        for task in tasks:
+            table.extend(_evaluate_file(task))
+        return table
+
+    with make_pool(n_jobs, ftype) as pool:
+        for rows in pool.imap(_evaluate_file, tasks):
+            table.extend(rows)
+
+    return table
+
+def make_pool(n_jobs, ftype, initializer=_init_worker):
+    """Return a pool of n_jobs worker processes, started with
+initializer(ftype, n_threads) (by default, mapping the caches)."""
+    if 'forkserver' in mp.get_all_start_methods():
+        ctx = mp.get_context('forkserver')
+        # import modules once in the server instead of in every worker
+        ctx.set_forkserver_preload(['catool.main'])
+    else:
+        ctx = mp.get_context('spawn')
+    n_threads = max(1, parallel.get_threads() // n_jobs)
+    return ctx.Pool(n_jobs, initializer=initializer, initargs=(ftype, n_threads))
+
+def table2string(table):
+    for row in table:
+        print("{}\t{}\t{}\t{:.2f}\t{:.4f}\t{:.4f}\t{:.4f}".format(*row))
@@ -0,0 +1,86 @@
+"""On-disk caches made of numpy arrays.
+
+A cache is a directory with one .npy file per array and a header.json file
+describing how it was built (e.g. the hash of its sources). Arrays are
+memory-mapped when loaded, so processes using the same cache at the same time
+share its memory through the page cache.
+"""
+import os
+import json
+import time
+import shutil
+
+import numpy as np
+
+# attempts of load_arrays (and save_arrays) while a cache is being replaced by
+# another process, and the delay between the attempts of load_arrays (in
+# seconds)
+LOAD_ATTEMPTS = 50
+LOAD_DELAY = 0.01
+
+def save_arrays(dirname, arrays, header):
+    """Save a dict name -> array. The directory is written under a temporary
+name and then renamed, so readers never see a partial cache. If other
+processes write the same cache at the same time, the last one renamed is kept."""
+    tmp_dirname = '{}.{}'.format(dirname, os.getpid())
+    old_dirname = '{}.{}.old'.format(dirname, os.getpid())
+    try:
+        os.makedirs(tmp_dirname, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dirname, name + '.npy'), array)
+        with open(os.path.join(tmp_dirname, 'header.json'), 'w') as f:
+            json.dump(header, f)
+        for attempt in range(LOAD_ATTEMPTS):
+            # the old cache is moved away at once, so readers never see it
+            # partially removed
+            shutil.rmtree(old_dirname, ignore_errors=True)
+            try:
+                os.rename(dirname, old_dirname)
+            except FileNotFoundError:
+                pass
+            try:
+                os.rename(tmp_dirname, dirname)
+                break
+            except OSError: # another writer renamed its cache meanwhile
+                if attempt == LOAD_ATTEMPTS - 1:
+                    raise
+    finally:
+        shutil.rmtree(tmp_dirname, ignore_errors=True)
+        shutil.rmtree(old_dirname, ignore_errors=True)
+
+def load_header(dirname):
+    """Return the header of a cache, or None if there is no cache."""
+    try:
+        with open(os.path.join(dirname, 'header.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_header(dirname, header):
+    with open(os.path.join(dirname, 'header.json'), 'w') as f:
+        json.dump(header, f)
+
+def _load_array(fin):
+    try:
+        return np.load(fin, mmap_mode='r')
+    except ValueError: # empty arrays can't be memory-mapped in older numpy
+        return np.load(fin)
+
+def load_arrays(dirname):
+    """Return a dict name -> memory-mapped (read-only) array, or None if
+there is no cache. A cache replaced by another process (see save_arrays)
+while it is read is read again, so that all arrays come from the same one."""
+    for attempt in range(LOAD_ATTEMPTS):
+        if attempt > 0:
+            time.sleep(LOAD_DELAY)
+        header = load_header(dirname)
+        if header is None: # missing, or between the rmtree and the rename
+            continue
+        try:
+            arrays = dict([ (name[:-4], _load_array(os.path.join(dirname, name)))
+                            for name in os.listdir(dirname) if name.endswith('.npy') ])
+        except OSError: # removed while it was read
+            continue
+        if load_header(dirname) == header:
+            return arrays
+    return None
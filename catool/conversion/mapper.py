@@ -1,41 +1,207 @@
 import os
+import re
 import gzip
+import hashlib
+
+import numpy as np
+
+from .. import cache
 
 CURRENT_DIR = os.path.dirname(os.path.realpath(__file__))
-# only for human proteins
-UNIP2ID = '{}/uniprot_ac_to_id_9606.map.gz'.format(CURRENT_DIR)
-CAFA2ID = '{}/sp_species.9606.map.gz'.format(CURRENT_DIR)
+# directory of the mapping files of each species (NCBI taxon id), e.g. for
+# human proteins uniprot_ac_to_id_9606.map.gz and sp_species.9606.map.gz
+MAPPING_DIR = CURRENT_DIR
+UNIP2ID_PATTERN = re.compile(r'^uniprot_ac_to_id_(\d+)\.map\.gz$')
+CAFA2ID_PATTERN = re.compile(r'^sp_species\.(\d+)\.map\.gz$')
+# UniProt accession -> (taxon, CAFA id) index of all the species, derived
+# from the files above
+INDEX_FILE = '{}/uniprot_ac_to_cafa.cache'.format(CURRENT_DIR)
 
-def map(y_pred):
+global __CATALOG__, __INDEX__
+__CATALOG__ = [None]
+__INDEX__ = [None]
+
+def get_catalog():
     """
-    preds = list of UniProtKB accessions
+    Return a dict taxon -> (UniProt accession -> UniProt id file, CAFA id ->
+    UniProt id file) of the species whose two mapping files are found in
+    MAPPING_DIR. The directory is only listed on the first call.
     """
+    if __CATALOG__[0] is None:
+        unip2id = {}
+        cafa2id = {}
+        for name in sorted(os.listdir(MAPPING_DIR)):
+            for pattern, files in ((UNIP2ID_PATTERN, unip2id), (CAFA2ID_PATTERN, cafa2id)):
+                match = pattern.match(name)
+                if match:
+                    files[int(match.group(1))] = os.path.join(MAPPING_DIR, name)
+        __CATALOG__[0] = dict([ (taxon, (unip2id[taxon], cafa2id[taxon]))
+                                for taxon in sorted(unip2id) if taxon in cafa2id ])
+    return __CATALOG__[0]
+
+def get_taxa():
+    """Return the sorted list of the taxa of the catalog."""
+    return list(get_catalog())
+
+def _file_hash(fin):
+    h = hashlib.sha1()
+    with open(fin, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _sources(saved=None):
+    """Return a dict file name -> [size, mtime, sha1] of the mapping files of
+the catalog. Files are only hashed when their size or mtime differ from the
+saved ones."""
+    saved = saved or {}
+    sources = {}
+    for fins in get_catalog().values():
+        for fin in fins:
+            stat = os.stat(fin)
+            name = os.path.basename(fin)
+            source = [stat.st_size, stat.st_mtime_ns, None]
+            if name in saved and saved[name][:2] == source[:2]:
+                source[2] = saved[name][2]
+            else:
+                source[2] = _file_hash(fin)
+            sources[name] = source
+    return sources
+
+def _hashes(sources):
+    return dict([ (name, source[2]) for name, source in sources.items() ])
+
+def _build_taxon(unip2id_fin, cafa2id_fin):
     unip2id = {}
     id2cafa = {}
 
     # read files
-    with gzip.open(UNIP2ID, 'rt', encoding='utf-8') as f:
+    with gzip.open(unip2id_fin, 'rt', encoding='utf-8') as f:
         for a in f:
             acc, _, prot_id = a.strip().split('\t')
             unip2id[acc] = prot_id
     #
-    with gzip.open(CAFA2ID, 'rt', encoding='utf-8') as f:
+    with gzip.open(cafa2id_fin, 'rt', encoding='utf-8') as f:
         for a in f:
             cafa_id, prot_id = a.strip().split('\t')
             id2cafa[prot_id] = cafa_id
 
-    # map ids
-    new_pred = {}
-    for k, v in y_pred.items():
-        if k not in unip2id:
-            continue
+    # compose both mappings
+    accs = [ acc for acc, prot_id in unip2id.items() if prot_id in id2cafa ]
+    cafa_ids = [ id2cafa[unip2id[acc]] for acc in accs ]
+
+    return np.array(accs, dtype=np.bytes_), np.array(cafa_ids, dtype=np.bytes_)
 
-        mapped_id = unip2id[k]
-        if mapped_id not in id2cafa:
-            continue
+def _build_index():
+    # species are read one at a time, so that only the dicts of one of them
+    # are in memory
+    accs = []
+    cafa_ids = []
+    taxa = []
+    for taxon, fins in get_catalog().items():
+        taxon_accs, taxon_cafa_ids = _build_taxon(*fins)
+        accs.append(taxon_accs)
+        cafa_ids.append(taxon_cafa_ids)
+        taxa.append(np.full(taxon_accs.shape[0], taxon, dtype=np.int32))
+    if not accs:
+        return np.empty(0, dtype='S1'), np.empty(0, dtype='S1'), np.empty(0, dtype=np.int32)
 
-        mapped_id = id2cafa[mapped_id]
-        new_pred[mapped_id] = v
+    # accessions are unique across species, but if not, the first taxon wins
+    accs = np.concatenate(accs)
+    _, first = np.unique(accs, return_index=True)
 
+    return accs[first], np.concatenate(cafa_ids)[first], np.concatenate(taxa)[first]
+
+def get_index():
+    """
+    Return three aligned arrays (accessions, cafa_ids, taxa), where
+    accessions are sorted. The index is built from the mapping files of every
+    species of the catalog and saved into INDEX_FILE (see cache.save_arrays),
+    which is rebuilt when the mapping files change. Arrays are memory-mapped,
+    so lookups only read the pages of the accessions they search, and the
+    mappings are never loaded into dicts.
+    """
+    if __INDEX__[0] is None:
+        header = cache.load_header(INDEX_FILE)
+        saved = header.get('sources') if header is not None else None
+        sources = _sources(saved)
+        arrays = None
+        if saved is not None and _hashes(saved) == _hashes(sources):
+            arrays = cache.load_arrays(INDEX_FILE)
+        if arrays is not None:
+            index = arrays['accs'], arrays['cafa_ids'], arrays['taxa']
+            if saved != sources: # only the mtimes changed
+                try:
+                    cache.save_header(INDEX_FILE, {'sources': sources})
+                except OSError:
+                    pass
+        else:
+            index = _build_index()
+            try:
+                cache.save_arrays(INDEX_FILE, {
+                    'accs': index[0],
+                    'cafa_ids': index[1],
+                    'taxa': index[2],
+                }, {'sources': sources})
+            except OSError: # e.g. read-only installation
+                pass
+        __INDEX__[0] = index
+    return __INDEX__[0]
+
+def _check_taxa(taxa):
+    """Return the array of the taxa (a taxon id or a list of them), which must
+be in the catalog."""
+    taxa = np.unique(np.atleast_1d(np.asarray(taxa)).astype(np.int32))
+    missing = np.setdiff1d(taxa, get_taxa())
+    if missing.shape[0] > 0:
+        raise ValueError("No mapping files for taxa {}.".format(
+            ', '.join([ str(taxon) for taxon in missing.tolist() ])))
+    return taxa
+
+def lookup(accessions, taxa='all'):
+    """
+    Map an array of UniProtKB accessions into CAFA ids with a binary search
+    over the index. taxa is "all" or a list of taxon ids: accessions of other
+    species are not mapped.
+
+    Return two arrays: the CAFA ids (as bytes, empty when unknown) and a
+    boolean mask indicating which accessions were found.
+    """
+    accs, cafa_ids, acc_taxa = get_index()
+    query = np.asarray(accessions)
+    if query.dtype.kind == 'U':
+        query = np.char.encode(query, 'utf-8')
+    elif query.dtype.kind != 'S':
+        query = np.array([ a.encode('utf-8') for a in query.tolist() ], dtype=np.bytes_)
+    if isinstance(taxa, str):
+        if taxa != 'all':
+            raise ValueError("Unknown taxa {}.".format(taxa))
+        taxa = None
+    else:
+        taxa = _check_taxa(taxa)
+    if query.shape[0] == 0 or accs.shape[0] == 0:
+        return np.zeros(query.shape[0], dtype=cafa_ids.dtype), \
+            np.zeros(query.shape[0], dtype=np.bool_)
+
+    pos = np.minimum(np.searchsorted(accs, query), accs.shape[0] - 1)
+    found = accs[pos] == query
+    if taxa is not None:
+        found[found] = np.isin(acc_taxa[pos[found]], taxa)
+    mapped = np.where(found, cafa_ids[pos], b'')
+
+    return mapped, found
+
+def map(y_pred, taxa='all'):
+    """
+    preds = list of UniProtKB accessions
+    """
+    accessions = list(y_pred.keys())
+    mapped, found = lookup(accessions, taxa)
+
+    # map ids
+    new_pred = {}
+    for k, mapped_id in zip(accessions, mapped.tolist()):
+        if mapped_id:
+            new_pred[mapped_id.decode('utf-8')] = y_pred[k]
 
     return new_pred
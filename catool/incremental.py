@@ -0,0 +1,143 @@
+"""Incremental evaluation of predictions which change for a few proteins at a
+time (e.g. in active learning loops).
+
+An Evaluator keeps the contributions of every predicted benchmark protein to
+the sums of metrics.threshold_sums. Updating the predictions of some proteins
+only maps, propagates and sweeps these proteins and replaces their
+contributions in the running sums, so its cost is proportional to the size of
+the update, and its memory to the number of predicted proteins.
+"""
+import numpy as np
+
+from . import main
+from . import inou
+from .conversion import mapper
+from .sparse import row_ids
+from .metrics import get_thresholds
+from .metrics import protein_contributions
+from .metrics import N_FIELDS
+from .metrics import N_WEIGHTED_FIELDS
+
+class Evaluator(object):
+    """
+    Evaluate the predictions of a namespace as main.run does, while they
+    change:
+
+    >>> evaluator = Evaluator('molecular_function')
+    >>> evaluator.update(pred)
+    >>> evaluator.update(new_pred) # replaces the predictions of some proteins
+    >>> results = evaluator.results('full')
+
+    Arguments are as in main.run, but thresholds must be fixed in advance
+    (None or an array), since "exact" thresholds depend on all predictions.
+    Results are the same as main.run on the merged predictions, up to the
+    rounding of the running sums.
+    """
+    def __init__(self, namespace, ftype=1, sparse=False, thresholds=None,
+                 weighted=False, taxa='all'):
+        if isinstance(thresholds, str):
+            raise ValueError("The thresholds of an Evaluator must be fixed.")
+        self.namespace = namespace
+        self.ftype = ftype
+        self.sparse = sparse
+        self.thresholds = get_thresholds(None, thresholds)
+        self.weighted = weighted
+        self.taxa = taxa
+
+        go = main.get_go()
+        true_fin = main._get_benchmark_file(ftype)
+        self._benchmark_prots, y_true = inou.load_groundtruth(true_fin, go, namespace)
+        # benchmark proteins are sorted once, and then searched at each update
+        self._benchmark_index = inou.protein_index(self._benchmark_prots)
+        n_benchmarks = len(self._benchmark_prots)
+        # information content of the true terms of each benchmark protein
+        self._ic = None
+        self._protein_ic = np.zeros(n_benchmarks)
+        if weighted:
+            self._ic = inou.load_information_content(true_fin, go, namespace)
+            self._protein_ic = np.bincount(row_ids(y_true.indptr),
+                                           weights=self._ic[y_true.indices],
+                                           minlength=n_benchmarks)
+
+        n_fields = N_WEIGHTED_FIELDS if weighted else N_FIELDS
+        # contributions of the predicted proteins: the benchmark protein of
+        # row r is in slot _slots[r] (-1 if it is not predicted), and unused
+        # slots are listed in _free
+        self._slots = np.full(n_benchmarks, -1, dtype=np.int64)
+        self._contributions = np.zeros((n_fields, 0, len(self.thresholds)))
+        self._free = []
+        self._sums = np.zeros((n_fields, len(self.thresholds)))
+
+    @property
+    def n_predicted(self):
+        """Number of predicted proteins in the benchmark."""
+        return self._contributions.shape[1] - len(self._free)
+
+    def _allocate(self, n):
+        """Return n unused slots, growing the contributions by doubling."""
+        missing = n - len(self._free)
+        if missing > 0:
+            size = self._contributions.shape[1]
+            new_size = max(size + missing, 2 * size)
+            contributions = np.zeros(self._contributions.shape[:1] + (new_size,)
+                                     + self._contributions.shape[2:])
+            contributions[:, :size] = self._contributions
+            self._contributions = contributions
+            self._free.extend(range(new_size - 1, size - 1, -1))
+        slots = self._free[len(self._free) - n:]
+        del self._free[len(self._free) - n:]
+        return np.array(slots, dtype=np.int64)
+
+    def update(self, pred):
+        """Replace the predictions of the proteins in pred (a dict as in
+main.run). Other proteins keep their predictions."""
+        proteins, prot_idx, terms, scores = main._dict_to_arrays(pred)
+        self.update_arrays(proteins, terms, scores, prot_idx)
+
+    def update_arrays(self, proteins, terms, scores, prot_idx=None):
+        """Same as update, but predictions are given as in main.run_arrays."""
+        proteins, prot_idx, terms = main._as_coordinates(proteins, terms, prot_idx)
+
+        # only the rows of the updated proteins are built and propagated
+        y_true, rows, entry_rows, cols, scores, _, _ = main._select_arrays(
+            proteins, prot_idx, terms, scores, self.namespace, self.ftype,
+            taxa=self.taxa, benchmark_index=self._benchmark_index)
+        y_true, y_pred = main._build_arrays(y_true, rows, entry_rows, cols,
+                                            scores, self.namespace, self.sparse)
+        contributions = np.array(protein_contributions(
+            y_true, y_pred, self.thresholds, self._ic))
+
+        new = self._slots[rows] < 0
+        self._slots[rows[new]] = self._allocate(np.count_nonzero(new))
+        slots = self._slots[rows]
+        old = self._contributions[:, slots]
+        old[:, new] = 0.
+        self._sums += (contributions - old).sum(axis=1)
+        self._contributions[:, slots] = contributions
+
+    def remove(self, proteins):
+        """Remove all predictions of the given proteins (UniProt
+accessions)."""
+        cafa_ids, _ = mapper.lookup(np.asarray(proteins), self.taxa)
+        rows = inou.get_protein_rows(self._benchmark_prots, cafa_ids,
+                                     self._benchmark_index)
+        rows = np.unique(rows[rows >= 0])
+        rows = rows[self._slots[rows] >= 0]
+        slots = self._slots[rows]
+
+        self._sums -= self._contributions[:, slots].sum(axis=1)
+        self._contributions[:, slots] = 0.
+        self._slots[rows] = -1
+        self._free.extend(slots.tolist())
+
+    def results(self, mode):
+        """Return the results matrix of main.run for the current
+predictions."""
+        if mode == 'full':
+            baseline = len(self._benchmark_prots), self._protein_ic.sum()
+        else:
+            baseline = float(self.n_predicted), self._protein_ic[self._slots >= 0].sum()
+        sums = list(self._sums)
+        sums[2] = np.round(sums[2]) # n_retrieved
+
+        return main._results_from_sums(sums, baseline, self.thresholds)
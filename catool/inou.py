@@ -1,87 +1,249 @@
+import os
 import gzip
 import warnings
 
 import numpy as np
+import numba as nb
 
-from . import main
+from . import onto
+from . import sparse
+from . import cache
+from . import utils
 
-def read_groundtruth(fin, go, namespace, prot_ids):
+global __GROUNDTRUTH__
+__GROUNDTRUTH__ = {}
+global __IC__
+__IC__ = {}
+# benchmark file -> ([size, mtime], sha1), so that files are hashed once
+global __HASHES__
+__HASHES__ = {}
+
+def _read_groundtruth_arrays(fin, go, namespace):
     """
-    Ground truth is assumed to be a two-columns file.
+    Return the benchmark proteins annotated in the namespace (an array of
+    bytes, in order of appearance) and two arrays with the protein index and
+    the term index (in the namespace) of each annotation.
 
-    A boolean matrix is returned with dimensionality: (n_proteins, n_terms)
+    Terms are looked up at once with Ontology.lookup_terms.
     """
-    pred = {}
-    with gzip.open(fin, 'rt', encoding='utf-8') as f:
-        for a in f:
-            prot_id, term = a.strip().split('\t')
+    with gzip.open(fin, 'rb') as f:
+        fields = f.read().split()
+    if len(fields) % 2 != 0:
+        raise ValueError("Benchmark file {} must have two columns.".format(fin))
+    prots = np.array(fields[0::2], dtype=np.bytes_)
+    term_ns, term_index = go.lookup_terms(np.array(fields[1::2], dtype=np.bytes_))
 
-            # skip terms that are not present in the gene ontology
-            if term not in go.ont.keys():
-                warnings.warn("Benchmark term {} is missing in the go.".format(term))
-                continue
+    # skip terms that are not present in the gene ontology
+    n_missing = np.count_nonzero(term_ns < 0)
+    if n_missing > 0:
+        warnings.warn("{} benchmark terms are missing in the go.".format(n_missing))
+    known = term_ns >= 0
+    prots, term_ns, term_index = prots[known], term_ns[known], term_index[known]
 
-            term_namespace = go.ont[term]['namespace']
+    # only keep terms of the namespace, and proteins with terms annotated
+    in_namespace = term_ns == onto.NAMESPACE_CODES.index(namespace)
+    proteins, first, inverse = np.unique(prots, return_index=True, return_inverse=True)
+    inverse = inverse.ravel()
+    annotated = np.flatnonzero(np.bincount(inverse[in_namespace], minlength=proteins.shape[0]))
+    order = annotated[np.argsort(first[annotated])]
+    rank = np.full(proteins.shape[0], -1, dtype=np.int64)
+    rank[order] = np.arange(order.shape[0])
 
-            # if prot_id not in prot_ids:
-            #     continue
+    return proteins[order], rank[inverse[in_namespace]], term_index[in_namespace]
 
-            if prot_id not in pred:
-                pred[prot_id] = []
-            # only save term corresponding with the specified namespace
-            if namespace == term_namespace:
-                term_id = go.term2index[namespace][term]
-                pred[prot_id].append(term_id)
-    # remove proteins without terms annotated
-    pred = { prot_id: terms for prot_id, terms in pred.items() if len(terms) > 0 }
+def _read_groundtruth_terms(fin, go, namespace, prot_ids):
+    """
+    Return the number of benchmark proteins annotated in the namespace and a
+    dict mapping each protein in prot_ids (all proteins if None) to the
+    indices of its terms.
+    """
+    proteins, prot_idx, term_index = _read_groundtruth_arrays(fin, go, namespace)
+    pred = dict([ (p.decode('utf-8'), []) for p in proteins.tolist() ])
+    terms = list(pred.values())
+    for i, term_id in zip(prot_idx.tolist(), term_index.tolist()):
+        terms[i].append(term_id)
 
     n_benchmarks = len(pred)
 
-    reduced_pred = {}
-    for k in pred.keys():
-        if k in prot_ids:
-            reduced_pred[k] = pred[k]
-    pred = reduced_pred
+    if prot_ids is not None:
+        reduced_pred = {}
+        for k in pred.keys():
+            if k in prot_ids:
+                reduced_pred[k] = pred[k]
+        pred = reduced_pred
+
+    return n_benchmarks, pred
+
+def read_groundtruth(fin, go, namespace, prot_ids):
+    """
+    Ground truth is assumed to be a two-columns file.
+
+    A boolean matrix is returned with dimensionality: (n_proteins, n_terms)
+    """
+    n_benchmarks, pred = _read_groundtruth_terms(fin, go, namespace, prot_ids)
 
     num_proteins = len(pred.keys())
     proteins = []
     #
     # boolean matrix, for low memory footprint
-    mat = np.zeros((num_proteins, go.counts[namespace]), dtype=np.bool)
+    mat = np.zeros((num_proteins, go.counts[namespace]), dtype=np.bool_)
     for prot_id in pred:
         mat[len(proteins), pred[prot_id]] = True
         proteins.append(prot_id)
 
     return n_benchmarks, proteins, mat
 
+def _groundtruth_header(fin, go, saved=None):
+    """Return the header of the caches derived from fin and go. As in
+onto.load_ontology, fin is only hashed when its size or mtime differ from the
+saved header, and at most once per process."""
+    stat = os.stat(fin)
+    source = [stat.st_size, stat.st_mtime_ns]
+    if saved is not None and saved.get('source') == source:
+        sha1 = saved['sha1']
+    elif fin in __HASHES__ and __HASHES__[fin][0] == source:
+        sha1 = __HASHES__[fin][1]
+    else:
+        sha1 = onto._file_hash(fin)
+    __HASHES__[fin] = source, sha1
+    return {
+        'key': '{}-{}'.format(sha1, go.key),
+        'sha1': sha1,
+        'source': source,
+    }
+
+def _load_cache_header(fout, fin, go):
+    """Return the header of the cache fout derived from fin and go, and
+whether the cache is up to date. The saved header is refreshed when only the
+mtime of fin changed."""
+    saved = cache.load_header(fout)
+    header = _groundtruth_header(fin, go, saved)
+    if saved is None or saved['key'] != header['key']:
+        return header, False
+    if saved != header:
+        try:
+            cache.save_header(fout, header)
+        except OSError:
+            pass
+    return header, True
+
+def load_groundtruth(fin, go, namespace):
+    """
+    Return the benchmark proteins annotated in the namespace (an array of
+    bytes, in file order) and their terms, propagated to their ancestors, as a
+    boolean sparse.CSRMatrix (n_proteins, n_terms).
+
+    Benchmarks are parsed and propagated once: the result is kept in memory
+    and saved next to fin (e.g. true_y.tsv.gz.biological_process.cache, see
+    cache.save_arrays). The cache is rebuilt when the benchmark or the
+    ontology change, and its arrays are memory-mapped.
+    """
+    if (fin, namespace) in __GROUNDTRUTH__:
+        return __GROUNDTRUTH__[(fin, namespace)]
+
+    fout = '{}.{}.cache'.format(fin, namespace)
+    header, cached = _load_cache_header(fout, fin, go)
+    arrays = cache.load_arrays(fout) if cached else None
+    if arrays is not None:
+        mat = sparse.CSRMatrix(
+            arrays['indptr'], arrays['indices'],
+            np.ones(arrays['indices'].shape[0], dtype=np.bool_),
+            (arrays['proteins'].shape[0], go.counts[namespace]))
+        groundtruth = arrays['proteins'], mat
+    else:
+        proteins, prot_idx, term_index = _read_groundtruth_arrays(fin, go, namespace)
+        mat = sparse.CSRMatrix.from_coo(
+            prot_idx, term_index, np.ones(prot_idx.shape[0], dtype=np.bool_),
+            (proteins.shape[0], go.counts[namespace]))
+        mat = utils.propagate_terms_csr(mat, *utils.load_parents(namespace))
+        try:
+            cache.save_arrays(fout, {
+                'proteins': proteins,
+                'indptr': mat.indptr,
+                'indices': mat.indices,
+            }, header)
+        except OSError: # e.g. read-only installation
+            pass
+        groundtruth = proteins, mat
+
+    __GROUNDTRUTH__[(fin, namespace)] = groundtruth
+    return groundtruth
+
+def load_information_content(fin, go, namespace):
+    """
+    Return the information content of the terms of the namespace (see
+    utils.information_content), estimated from the propagated benchmark
+    annotations (see load_groundtruth). Root terms have no information
+    content, as they are excluded from evaluation.
+
+    The array is cached like the benchmark (e.g.
+    true_y.tsv.gz.biological_process.ic.cache).
+    """
+    if (fin, namespace) in __IC__:
+        return __IC__[(fin, namespace)]
+
+    fout = '{}.{}.ic.cache'.format(fin, namespace)
+    header, cached = _load_cache_header(fout, fin, go)
+    arrays = cache.load_arrays(fout) if cached else None
+    if arrays is not None:
+        ic = arrays['ic']
+    else:
+        _, mat = load_groundtruth(fin, go, namespace)
+        _, par_indptr, par_indices = utils.load_parents(namespace)
+        ic = utils.information_content(mat, par_indptr, par_indices)
+        ic[go.term2index[namespace][onto.namespace2go[namespace]]] = 0.
+        try:
+            cache.save_arrays(fout, {'ic': ic}, header)
+        except OSError: # e.g. read-only installation
+            pass
+
+    __IC__[(fin, namespace)] = ic
+    return ic
+
+def protein_index(proteins):
+    """Return the arrays (sorted proteins, order) searched by
+    get_protein_rows, so that proteins searched many times are sorted once."""
+    order = np.argsort(proteins)
+    return proteins[order], order
+
+def get_protein_rows(proteins, prot_ids, index=None):
+    """Return the index of each element of prot_ids (an array of bytes) in
+    proteins (as returned by load_groundtruth), or -1 if it is missing. index
+    is protein_index(proteins), if it was already computed."""
+    prot_ids = np.asarray(prot_ids, dtype=np.bytes_)
+    rows = np.full(prot_ids.shape[0], -1, dtype=np.int64)
+    if proteins.shape[0] == 0 or prot_ids.shape[0] == 0:
+        return rows
+    sorted_proteins, order = protein_index(proteins) if index is None else index
+    pos = np.minimum(np.searchsorted(sorted_proteins, prot_ids), proteins.shape[0] - 1)
+    found = sorted_proteins[pos] == prot_ids
+    rows[found] = order[pos[found]]
+    return rows
+
 def read_predictions(fin, go, proteins, namespace, prot_ids):
     """Predictions are reading from a tab-separated file with three columns:
     prot_id, GO_term, predicted_confidence.
     """
-    pred = {}
     with open(fin) as f:
-        for a in f:
-            protein, term, confidence = a.strip().split('\t')
-
-            if protein not in prot_ids:
-                continue
-
-            # exclude terms that are not found in the GO
-            try:
-                term_namespace = go.ont[term]['namespace']
-            except KeyError:
-                term_namespace = None
-
-            if term_namespace != namespace:
-                continue
-            term_id = go.term2index[namespace][term]
-            confidence = float(confidence)
-            # only save annotations on proteins previously found in the
-            # benchmark
-            if protein not in pred:
-                pred[protein] = [[], []]
-            pred[protein][0].append(term_id)
-            pred[protein][1].append(confidence)
+        lines = [ a.strip().split('\t') for a in f ]
+    lines = [ l for l in lines if l[0] in prot_ids ]
+
+    # exclude terms that are not found in the GO (or in the namespace)
+    term_ns, term_index = go.lookup_terms([ l[1] for l in lines ])
+    in_namespace = (term_ns == onto.NAMESPACE_CODES.index(namespace)).tolist()
+
+    pred = {}
+    for l, term_id, keep in zip(lines, term_index.tolist(), in_namespace):
+        if not keep:
+            continue
+        protein = l[0]
+        confidence = float(l[2])
+        # only save annotations on proteins previously found in the
+        # benchmark
+        if protein not in pred:
+            pred[protein] = [[], []]
+        pred[protein][0].append(term_id)
+        pred[protein][1].append(confidence)
     # high precision to avoid round-off errors
     mat = np.zeros((len(proteins), go.counts[namespace]), dtype=np.float64)
     # fill matrix
@@ -95,53 +257,192 @@ def read_predictions(fin, go, proteins, namespace, prot_ids):
 
     return n_pred_proteins_in_benchmark, mat
 
-def cast_predictions_into_dict(fin, namespace):
+def cast_predictions_into_dict(fin, namespace=None):
     """
+    Read predictions of the namespace from a gzipped tab-separated file with
+    three columns: prot_id, GO_term, predicted_confidence. If namespace is
+    None, predictions of all namespaces are read.
+
+    The file is parsed with read_predictions_arrays, and terms that are not
+    found in the GO are excluded.
     """
-    go = main.get_go()
-    pred = {}
-    with gzip.open(fin, 'rt', encoding='utf-8') as f:
-        for a in f:
-            protein, term, confidence = a.strip().split('\t')
+    proteins, prot_idx, terms, scores = read_predictions_arrays(fin, namespace)
 
-            # exclude terms that are not found in the GO
-            try:
-                term_namespace = go.ont[term]['namespace']
-            except KeyError:
-                term_namespace = None
+    pred = dict([ (protein, []) for protein in proteins ])
+    prot_terms = list(pred.values())
+    for i, term, confidence in zip(prot_idx.tolist(), onto.int_to_go(terms),
+                                   scores.tolist()):
+        prot_terms[i].append((term, confidence))
 
-            if term_namespace != namespace:
-                continue
+    return pred
 
-            if protein not in pred:
-                pred[protein] = []
-            pred[protein].append((term, float(confidence)))
+# bytes read from prediction files at once
+CHUNK_SIZE = 1 << 24
+# maximum number of characters of a predicted confidence
+SCORE_WIDTH = 32
 
-    return pred
+@nb.njit(cache=True)
+def _is_space(c):
+    return c == 32 or (c >= 9 and c <= 13)
 
+@nb.njit(cache=True)
+def _parse_chunk(buf, prot_start, prot_end, terms, score_chars):
+    """
+    Parse the lines of buf (uint8), which are three tab-separated fields:
+    prot_id, GO_term and predicted_confidence. For each line, write the span
+    of prot_id, the integer accession of GO_term (-1 if it is not a GO id) and
+    the characters of predicted_confidence. Blank lines are skipped.
 
-def _get_prot_ids(fin, go, namespace):
+    Return the number of lines, or -(k + 1) if the k-th line is malformed.
     """
-    Obtain the prot_id from
+    n = 0
+    pos = 0
+    while pos < buf.shape[0]:
+        end = pos
+        while end < buf.shape[0] and buf[end] != 10: # '\n'
+            end += 1
+        next_pos = end + 1
+        # strip whitespaces
+        while pos < end and _is_space(buf[pos]):
+            pos += 1
+        while end > pos and _is_space(buf[end - 1]):
+            end -= 1
+        if pos == end:
+            pos = next_pos
+            continue
+        # find tabs
+        tab1 = -1
+        tab2 = -1
+        n_tabs = 0
+        for k in range(pos, end):
+            if buf[k] == 9:
+                n_tabs += 1
+                if tab1 < 0:
+                    tab1 = k
+                elif tab2 < 0:
+                    tab2 = k
+        if n_tabs != 2 or end - tab2 - 1 > score_chars.shape[1]:
+            return -(n + 1)
+        prot_start[n] = pos
+        prot_end[n] = tab1
+        # GO:NNNNNNN
+        term = -1
+        if tab2 - tab1 - 1 == 10 and buf[tab1 + 1] == 71 and buf[tab1 + 2] == 79 \
+           and buf[tab1 + 3] == 58:
+            term = 0
+            for k in range(tab1 + 4, tab2):
+                if buf[k] < 48 or buf[k] > 57:
+                    term = -1
+                    break
+                term = term * 10 + buf[k] - 48
+        terms[n] = term
+        score_chars[n, :] = 0
+        score_chars[n, :end - tab2 - 1] = buf[tab2 + 1:end]
+        n += 1
+        pos = next_pos
+    return n
+
+@nb.njit(cache=True)
+def _protein_runs(buf, prot_start, prot_end):
+    """Flag the lines whose protein differs from the one of the previous
+line."""
+    new_run = np.ones(prot_start.shape[0], dtype=np.bool_)
+    for i in range(1, prot_start.shape[0]):
+        a = prot_end[i] - prot_start[i]
+        if a == prot_end[i - 1] - prot_start[i - 1]:
+            same = True
+            for k in range(a):
+                if buf[prot_start[i] + k] != buf[prot_start[i - 1] + k]:
+                    same = False
+                    break
+            new_run[i] = not same
+    return new_run
+
+def _parse_predictions(data, ns_table, ns_code, proteins, prot_codes):
+    """Parse whole lines of predictions (bytes). New protein ids are appended
+to proteins, and prot_codes maps them (as bytes) to their index."""
+    buf = np.frombuffer(data, dtype=np.uint8)
+    n_lines = np.count_nonzero(buf == 10) + 1
+    prot_start = np.empty(n_lines, dtype=np.int64)
+    prot_end = np.empty(n_lines, dtype=np.int64)
+    terms = np.empty(n_lines, dtype=np.int32)
+    score_chars = np.empty((n_lines, SCORE_WIDTH), dtype=np.uint8)
+    n = _parse_chunk(buf, prot_start, prot_end, terms, score_chars)
+    if n < 0:
+        line = [ l for l in data.split(b'\n') if l.strip() ][-n - 1]
+        raise ValueError("Malformed prediction line: {}".format(line[:100]))
+
+    # exclude terms that are not found in the GO (or in the namespace)
+    terms = terms[:n]
+    known = (terms >= 0) & (terms < ns_table.shape[0])
+    term_ns = np.where(known, ns_table[np.where(known, terms, 0)], -1)
+    keep = term_ns >= 0 if ns_code < 0 else term_ns == ns_code
+    prot_start = prot_start[:n][keep]
+    prot_end = prot_end[:n][keep]
+
+    # resolve the protein id of each run of lines
+    new_run = _protein_runs(buf, prot_start, prot_end)
+    run_codes = []
+    for k in np.flatnonzero(new_run).tolist():
+        protein = data[prot_start[k]:prot_end[k]]
+        if protein not in prot_codes:
+            prot_codes[protein] = len(proteins)
+            proteins.append(protein.decode('utf-8'))
+        run_codes.append(prot_codes[protein])
+    run_codes = np.array(run_codes, dtype=np.int32)
+
+    scores = score_chars[:n][keep].view('S{}'.format(SCORE_WIDTH)).ravel()
+    return run_codes[np.cumsum(new_run) - 1], terms[keep], scores.astype(np.float64)
+
+def read_predictions_arrays(fin, namespace=None, chunk_size=CHUNK_SIZE):
+    """
+    Same as cast_predictions_into_dict, but predictions are returned as
+    arrays, without creating objects per line:
+
+    - proteins: a list of protein ids, in order of appearance.
+    - prot_idx: the index in proteins of each prediction (int32).
+    - terms: the integer GO accession of each prediction (int32, see
+      onto.go_to_int).
+    - scores: the predicted confidence of each prediction (float64).
+
+    The file (gzipped or not) is read in chunks of chunk_size bytes, parsed
+    by a numba kernel, and ids are resolved in bulk, so memory is bounded by
+    the chunk size plus the returned arrays. Python objects are only created
+    for each run of consecutive lines of the same protein.
     """
-    prot_ids = set({})
-    with gzip.open(fin, 'rt', encoding='utf-8') as f:
-        for a in f:
-            raw = a.strip().split('\t')
-            prot_id = raw[0]
-            term = raw[1]
+    ns_table = onto.get_go().ns_table
+    ns_code = -1 if namespace is None else onto.NAMESPACE_CODES.index(namespace)
+
+    proteins = []
+    prot_codes = {}
+    chunks = [(np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32), np.empty(0))]
+    opener = gzip.open if fin.endswith('.gz') else open
+    with opener(fin, 'rb') as f:
+        tail = b''
+        eof = False
+        while not eof:
+            data = f.read(chunk_size)
+            eof = len(data) == 0
+            data = tail + data
+            if not eof:
+                # only parse whole lines
+                cut = data.rfind(b'\n') + 1
+                data, tail = data[:cut], data[cut:]
+            if len(data) > 0:
+                chunks.append(_parse_predictions(
+                    data, ns_table, ns_code, proteins, prot_codes))
 
-            # exclude terms that are not found in the GO
-            try :
-                term_namespace = go.ont[term]['namespace']
-            except KeyError:
-                continue
+    return proteins, np.concatenate([ c[0] for c in chunks ]), \
+        np.concatenate([ c[1] for c in chunks ]), \
+        np.concatenate([ c[2] for c in chunks ])
 
-            if term_namespace != namespace:
-                continue
-            prot_ids.add(prot_id)
+def _get_prot_ids(fin, go, namespace):
+    """
+    Obtain the prot_id from
+    """
+    proteins, _, _ = _read_groundtruth_arrays(fin, go, namespace)
 
-    return prot_ids
+    return set([ p.decode('utf-8') for p in proteins.tolist() ])
 
 def get_common_prots(true_fin, pred, go, namespace):
     # protein ids in the so-called benchmarks
@@ -0,0 +1,179 @@
+"""Opt-in instrumentation of the evaluation.
+
+Functions decorated with profiled (e.g. main.run) record the wall time, the
+CPU time and the peak memory allocated (traced with tracemalloc) of each of
+their stages, and which numba kernels were compiled or loaded from the cache
+during the call. Instrumentation is enabled:
+
+- for one call, with profile=True: the report is returned with the result,
+  as (result, report).
+- for all calls, with the environment variable CATOOL_PROFILE (or enable(),
+  see the --profile flag of the command line): reports are sent to the sink,
+  by default a JSON line written to stderr (CATOOL_PROFILE=1) or appended to
+  the file named by CATOOL_PROFILE. See set_sink.
+
+When disabled, stages cost a global lookup and a no-op context manager.
+"""
+import os
+import sys
+import json
+import time
+import functools
+import contextlib
+import tracemalloc
+
+ENV_VAR = 'CATOOL_PROFILE'
+
+global __ENABLED__, __SINK__, __RECORDER__
+__ENABLED__ = [os.environ.get(ENV_VAR, '') not in ('', '0')]
+__SINK__ = [None]
+# report of the running profiled call, if any
+__RECORDER__ = [None]
+
+_NULL_STAGE = contextlib.nullcontext()
+
+def enable(sink=None):
+    """Send the reports of all profiled calls to sink (see set_sink)."""
+    __ENABLED__[0] = True
+    if sink is not None:
+        set_sink(sink)
+
+def disable():
+    __ENABLED__[0] = False
+
+def set_sink(sink):
+    """sink is called with each report (a dict, see profiled)."""
+    __SINK__[0] = sink
+
+def json_sink(stream=None):
+    """Return a sink writing reports as JSON lines to stream (by default,
+stderr) or, if stream is a string, appending them to that file."""
+    def sink(report):
+        line = json.dumps(report) + '\n'
+        if isinstance(stream, str):
+            with open(stream, 'a') as f:
+                f.write(line)
+        else:
+            (stream or sys.stderr).write(line)
+            (stream or sys.stderr).flush()
+    return sink
+
+def _default_sink():
+    value = os.environ.get(ENV_VAR, '')
+    return json_sink(None if value in ('', '0', '1', 'stderr') else value)
+
+def _kernels():
+    """Return a dict name -> (number of compiled signatures, number of cache
+hits) of the numba kernels of the package."""
+    import numba as nb
+
+    kernels = {}
+    for module_name, module in list(sys.modules.items()):
+        if module is None or not module_name.startswith(__name__.rsplit('.', 1)[0] + '.'):
+            continue
+        for name, obj in list(vars(module).items()):
+            if isinstance(obj, nb.core.dispatcher.Dispatcher):
+                kernels['{}.{}'.format(module_name.rsplit('.', 1)[-1], name)] = (
+                    len(obj.overloads), sum(obj.stats.cache_hits.values()))
+    return kernels
+
+class _Recorder(object):
+    def __init__(self, name):
+        self.name = name
+        self.stages = {}
+        # stack of [name, wall, cpu, traced memory at start, peak of children]
+        self.stack = []
+        self.kernels = _kernels()
+        self.tracing = not tracemalloc.is_tracing()
+        if self.tracing:
+            tracemalloc.start()
+        self._enter(name)
+
+    def _enter(self, name):
+        current, peak = tracemalloc.get_traced_memory()
+        if self.stack: # the peak of the parent is lost when it is reset
+            self.stack[-1][4] = max(self.stack[-1][4], peak)
+        if hasattr(tracemalloc, 'reset_peak'): # python >= 3.9
+            tracemalloc.reset_peak()
+        frame = [name, time.perf_counter(), time.process_time(), current, current]
+        self.stack.append(frame)
+        return frame
+
+    def _exit(self):
+        name, wall, cpu, current, child_peak = self.stack.pop()
+        peak = max(tracemalloc.get_traced_memory()[1], child_peak)
+        if self.stack:
+            self.stack[-1][4] = max(self.stack[-1][4], peak)
+        return {
+            'wall': time.perf_counter() - wall,
+            'cpu': time.process_time() - cpu,
+            'peak_memory': peak - current,
+        }
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        self._enter(name)
+        try:
+            yield
+        finally:
+            record = self._exit()
+            # stages called many times (e.g. per block) are accumulated
+            if name in self.stages:
+                stats = self.stages[name]
+                stats['calls'] += 1
+                stats['wall'] += record['wall']
+                stats['cpu'] += record['cpu']
+                stats['peak_memory'] = max(stats['peak_memory'], record['peak_memory'])
+            else:
+                record['calls'] = 1
+                self.stages[name] = record
+
+    def report(self):
+        total = self._exit()
+        if self.tracing:
+            tracemalloc.stop()
+        kernels = {}
+        for name, (n_compiled, n_hits) in _kernels().items():
+            old_compiled, old_hits = self.kernels.get(name, (0, 0))
+            if n_compiled > old_compiled:
+                kernels[name] = {
+                    'compiled': (n_compiled - old_compiled) - (n_hits - old_hits),
+                    'cached': n_hits - old_hits,
+                }
+        return {
+            'function': self.name,
+            'total': total,
+            'stages': self.stages,
+            'kernels': kernels,
+        }
+
+def stage(name):
+    """Context manager recording a stage of the running profiled call."""
+    if __RECORDER__[0] is None:
+        return _NULL_STAGE
+    return __RECORDER__[0].stage(name)
+
+def profiled(fn):
+    """
+    Add the keyword argument profile to fn (see the module documentation).
+    The stages run during the call (see stage) are recorded, including those
+    of nested profiled calls.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        profile = kwargs.pop('profile', False)
+        if __RECORDER__[0] is not None or not (profile or __ENABLED__[0]):
+            result = fn(*args, **kwargs)
+            return (result, None) if profile else result
+
+        __RECORDER__[0] = _Recorder(fn.__name__)
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            report = __RECORDER__[0].report()
+            __RECORDER__[0] = None
+        if profile:
+            return result, report
+        (__SINK__[0] or _default_sink())(report)
+        return result
+    return wrapper
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 import sys
 import os
+import tempfile
+import warnings
 
 import numpy as np
 import numba as nb
@@ -9,39 +11,34 @@ import numba as nb
 from . import onto
 from . import inou
 from . import utils
+from . import instrument
+from . import parallel
 from .conversion import mapper
-from .metrics import precision_recall_curve
+from .onto import get_go
+from .sparse import CSRMatrix
+from .sparse import row_ids
+from .metrics import precision_and_recall_at_thr
+from .metrics import get_thresholds
+from .metrics import threshold_sums
+from .metrics import curve_from_sums
+from .metrics import weighted_curve_from_sums
+from .metrics import init_sums
+from .metrics import update_sums
+from .metrics import finalize_sums
+from .metrics import protein_contributions
+from .metrics import bootstrap_curves
+from .metrics import permutation_differences
+from .metrics import term_metrics
 
 
 CURRENT_DIR = os.path.dirname(os.path.realpath(__file__))
-# obo file used for calculations
-OBO_FILE = '{}/go.obo'.format(CURRENT_DIR)
 TRUE_FIN = '%s/true_y.tsv.gz' % (CURRENT_DIR) # derived from bpo_HUMAN_type1.txt
 TRUE_FIN2 = '%s/true_y_2.tsv.gz' % (CURRENT_DIR) # derived from bpo_HUMAN_type1.txt and bpo_HUMAN_type2.txt
 
-global __GO__
-__GO__ = [None]
-
-def _decompress_obofile():
-    import gzip
-    import shutil
-    with gzip.open(OBO_FILE + ".gz", 'r') as f_in:
-        with open(OBO_FILE, 'wb') as f_out:
-            shutil.copyfileobj(f_in, f_out)
-
-def get_go():
-    """
-    The GO is a global variable to avoid multiple reading of the obo file.
-    """
-    # decompress obo file if it wasn't yet
-    if not os.path.exists(OBO_FILE):
-        _decompress_obofile()
-    # create global variable
-    if __GO__[0] is None:
-        __GO__[0] = onto.Ontology(OBO_FILE, with_rels=True, include_alt_ids=False)
-    return __GO__[0]
-
-def run(pred, mode, namespace, ftype=1):
+@instrument.profiled
+@parallel.threaded
+def run(pred, mode, namespace, ftype=1, sparse=False, thresholds=None,
+        block_size=None, weighted=False, taxa='all'):
     """This method calculates performance metrics by comparing predictions with
 groundtruths.
 
@@ -49,7 +46,7 @@ groundtruths.
     =====
     - pred: a dict whose keys are protein identifier and values are tuple of
       two elements. The first element is a GO term and the second element is a
-      predicted value \in [0,1]
+      predicted value in [0,1]
 
     - mode: a string indicating "full" or "partial" mode.
 
@@ -60,60 +57,721 @@ groundtruths.
       moment, this variable takes two values: 1 (bpo_HUMAN_type1.txt) and
       2 (bpo_HUMAN_type1.txt + bpo_HUMAN_type2.txt).
 
+    - sparse: if True, groundtruths and predictions are kept as sparse
+      matrices (see sparse.CSRMatrix), so memory scales with the number of
+      annotations instead of n_proteins * n_terms. Results are the same.
+
+    - thresholds: None for the 101 thresholds 0.01 * i, an array of
+      thresholds, or "exact" to evaluate at every distinct predicted score
+      (after propagation).
+
+    - block_size: if given, proteins are evaluated in blocks of block_size
+      rows, which are built, propagated and reduced into partial sums one at a
+      time (see metrics.update_sums), so memory is bounded by the block size
+      instead of the number of predicted proteins. Results are the same.
+
+    - weighted: if True, metrics weighted by the information content of the
+      terms (see inou.load_information_content) are calculated in the same
+      pass over the predictions.
+
+    - taxa: "all", or a list of NCBI taxon ids (e.g. [9606, 10090]): only
+      proteins of these species are mapped into CAFA ids (see
+      conversion.mapper), and predictions of other species are ignored.
+
+    - threads: if given, the number of threads used by the numba kernels
+      during the call (see parallel). Results don't depend on it.
+
     Output:
     ======
     - results: a matrix (n_thresholds, 4): columns are: thr, f1, precision,
-      recall.
+      recall. If weighted, 6 more columns follow: weighted f1, weighted
+      precision, weighted recall, remaining uncertainty, misinformation and
+      semantic distance, whose minimum is Smin.
 
     """
-    go = get_go()
+    proteins, prot_idx, terms, scores = _dict_to_arrays(pred)
+
+    return run_arrays(proteins, terms, scores, mode, namespace, ftype, sparse,
+                      thresholds, prot_idx=prot_idx, block_size=block_size,
+                      weighted=weighted, taxa=taxa)
+
+@instrument.profiled
+@parallel.threaded
+def run_arrays(proteins, terms, scores, mode, namespace, ftype=1, sparse=False,
+               thresholds=None, prot_idx=None, block_size=None, weighted=False,
+               taxa='all'):
+    """Same as run, but predictions are given as coordinate arrays: protein
+proteins[i] is predicted with term terms[i] and confidence scores[i].
+
+    Input:
+    =====
+    - proteins: an array of UniProt accessions (str or bytes). If prot_idx is
+      given, proteins only holds each accession once and prot_idx[i] is the
+      index of the protein of prediction i (see inou.read_predictions_arrays).
+
+    - terms: an array of GO ids, as strings (GO:0008150) or integers (8150).
+      Terms of other namespaces, or not found in the GO, are ignored.
+
+    - scores: an array of predicted values in [0,1].
+
+    Arrays are used as given, without creating objects per prediction. As in
+    run, every protein in proteins counts as predicted, so predictions of
+    several namespaces should be evaluated with run_all_arrays.
+    """
+    proteins, prot_idx, terms = _as_coordinates(proteins, terms, prot_idx)
+
+    thresholds, sums, baselines = _arrays_sums(
+        proteins, prot_idx, terms, scores, namespace, ftype, sparse, thresholds,
+        block_size, weighted=weighted, taxa=taxa)
+
+    return _results_from_sums(sums, baselines[mode], thresholds)
+
+@instrument.profiled
+@parallel.threaded
+def run_matrix(matrix, proteins, terms, mode, namespace, ftype=1, sparse=False,
+               thresholds=None, block_size=None, weighted=False, taxa='all'):
+    """Same as run, but predictions are given as a matrix (n_proteins,
+n_terms), either a numpy array or a sparse.CSRMatrix, whose rows are labeled
+with UniProt accessions (proteins) and columns with GO ids (terms, as in
+run_arrays). Zero (or not stored) values are not predictions, and proteins
+are only predicted in the namespaces of their nonzero values.
+
+    Only the rows of mapped proteins and the columns of the namespace are
+    read; the matrix itself is never modified.
+    """
+    proteins = np.asarray(proteins)
+    cafa_ids, found = mapper.lookup(proteins, taxa)
+    prot_idx, terms, scores = _matrix_to_arrays(matrix, found, terms, namespace)
+    # as for arrays, only rows with a nonzero value in the namespace are
+    # predicted proteins
+    predicted = np.bincount(prot_idx, minlength=proteins.shape[0]) > 0
+
+    thresholds, sums, baselines = _arrays_sums(
+        proteins, prot_idx, terms, scores, namespace, ftype, sparse, thresholds,
+        block_size, predicted, weighted=weighted, taxa=taxa, cafa_ids=cafa_ids)
+
+    return _results_from_sums(sums, baselines[mode], thresholds)
+
+@instrument.profiled
+@parallel.threaded
+def run_file(pred_fin, mode, namespace, ftype=1, sparse=False, thresholds=None,
+             block_size=None, weighted=False, taxa='all'):
+    """Same as run, but predictions are read from a file (see
+inou.read_predictions_arrays) straight into arrays, without building a dict."""
+    with instrument.stage('read_predictions'):
+        proteins, prot_idx, terms, scores = inou.read_predictions_arrays(pred_fin, namespace)
+
+    return run_arrays(proteins, terms, scores, mode, namespace, ftype, sparse,
+                      thresholds, prot_idx=prot_idx, block_size=block_size,
+                      weighted=weighted, taxa=taxa)
+
+def _results_from_sums(sums, baseline, thresholds):
+    """Return the results of run from the sums of metrics.threshold_sums and
+the (number of proteins, information content of their true terms) used to
+average the metrics."""
+    n_proteins, relevant_ic = baseline
+    weighted = len(sums) > 3
+    results = np.empty((len(thresholds), 10 if weighted else 4))
+    with instrument.stage('curves'):
+        curve_from_sums(*sums[:3], n_proteins, thresholds, results)
+        if weighted:
+            weighted_curve_from_sums(*sums[3:], sums[2], relevant_ic, n_proteins,
+                                     results[:, 4:])
+
+    return results
+
+@instrument.profiled
+@parallel.threaded
+def run_all(pred, ftype=1, sparse=False, thresholds=None, block_size=None,
+            weighted=False, taxa='all'):
+    """Same as run, but for all namespaces and both "full" and "partial" modes.
+
+    pred may contain terms of any namespace. Identifiers are mapped once, and
+    matrices are built and propagated once per namespace: both modes share
+    them, since they only differ in the number of proteins used to average
+    recall. Namespaces without predictions are skipped.
+
+    Output:
+    ======
+    - results: a dict (namespace, mode) -> results matrix of run.
+    """
+    proteins, prot_idx, terms, scores = _dict_to_arrays(pred)
+
+    return run_all_arrays(proteins, terms, scores, ftype, sparse, thresholds,
+                          prot_idx=prot_idx, block_size=block_size,
+                          weighted=weighted, taxa=taxa)
+
+@instrument.profiled
+@parallel.threaded
+def run_all_arrays(proteins, terms, scores, ftype=1, sparse=False,
+                   thresholds=None, prot_idx=None, block_size=None,
+                   weighted=False, taxa='all'):
+    """Same as run_all, but predictions are given as in run_arrays."""
+    proteins, prot_idx, terms = _as_coordinates(proteins, terms, prot_idx)
+
+    # proteins are mapped once for all namespaces
+    with instrument.stage('map_proteins'):
+        cafa_ids, found = mapper.lookup(proteins, taxa)
+    term_ns, _ = get_go().lookup_terms(terms)
+
+    results = {}
+    for namespace in onto.NAMESPACES.values():
+        # proteins with predictions in the namespace
+        predicted = np.bincount(
+            prot_idx[term_ns == onto.NAMESPACE_CODES.index(namespace)],
+            minlength=len(proteins)) > 0
+        if not np.any(predicted & found):
+            continue
+        ns_thresholds, sums, baselines = _arrays_sums(
+            proteins, prot_idx, terms, scores, namespace, ftype, sparse,
+            thresholds, block_size, predicted, weighted, taxa, cafa_ids)
+
+        for mode in ('full', 'partial'):
+            results[(namespace, mode)] = _results_from_sums(
+                sums, baselines[mode], ns_thresholds)
+
+    return results
+
+@instrument.profiled
+@parallel.threaded
+def run_terms(pred, mode, namespace, ftype=1, sparse=False, min_positives=1,
+              taxa='all'):
+    """Term-centric evaluation: for each GO term of the namespace, rank the
+proteins by their predicted value for the term (see metrics.term_metrics).
+
+    Input is as in run. In "full" mode, benchmark proteins without predictions
+    are ranked last (as predicted with 0); in "partial" mode, only predicted
+    proteins in the benchmark are ranked. Only terms annotated to at least
+    min_positives of these proteins are kept. The root term is excluded.
+
+    Output:
+    ======
+    - terms: an array with the GO ids of the kept terms.
+    - results: a matrix (n_terms, 3): columns are: number of annotated
+      proteins, ROC-AUC, AUPR. Macro averages are the (nan) means of the
+      columns (see term_scores).
+    """
+    proteins, prot_idx, terms, scores = _dict_to_arrays(pred)
+
+    return run_terms_arrays(proteins, terms, scores, mode, namespace, ftype,
+                            sparse, prot_idx=prot_idx, min_positives=min_positives,
+                            taxa=taxa)
+
+@instrument.profiled
+@parallel.threaded
+def run_terms_arrays(proteins, terms, scores, mode, namespace, ftype=1,
+                     sparse=False, prot_idx=None, min_positives=1, taxa='all'):
+    """Same as run_terms, but predictions are given as in run_arrays."""
+    proteins, prot_idx, terms = _as_coordinates(proteins, terms, prot_idx)
+
+    y_true, rows, entry_rows, cols, scores, n_benchmarks, n_predicted_proteins_in_benchmark = \
+        _select_arrays(proteins, prot_idx, terms, scores, namespace, ftype,
+                       taxa=taxa)
+    n_terms = y_true.shape[1]
+    n_unpredicted = 0
+    unpredicted_labels = np.zeros(n_terms)
+    if mode == 'full':
+        # annotations of the benchmark proteins without predictions
+        n_unpredicted = n_benchmarks - rows.shape[0]
+        unpredicted_labels = np.bincount(y_true.indices, minlength=n_terms) \
+            - np.bincount(y_true.take_rows(rows).indices, minlength=n_terms)
+        root_term_id = get_go().term2index[namespace][onto.namespace2go[namespace]]
+        unpredicted_labels[root_term_id] = 0
+    y_true, y_pred = _build_arrays(y_true, rows, entry_rows, cols, scores,
+                                   namespace, sparse)
+
+    with instrument.stage('term_metrics'):
+        results = term_metrics(y_true, y_pred, n_unpredicted, unpredicted_labels)
+    kept = np.flatnonzero(results[:, 0] >= max(min_positives, 1))
+    index2term = get_go().index2term[namespace]
+
+    return np.array([ index2term[j] for j in kept.tolist() ]), results[kept]
+
+def _arrays_sums(proteins, prot_idx, terms, scores, namespace, ftype, sparse,
+                 thresholds, block_size, predicted=None, weighted=False,
+                 taxa='all', cafa_ids=None):
+    """
+    Return the thresholds, the sums of metrics.threshold_sums (with weighted
+    metrics if weighted) and a dict mode -> (number of proteins, information
+    content of their true terms) with the proteins used to average metrics
+    ("full": benchmark proteins, "partial": predicted proteins in the
+    benchmark), for predictions given as arrays (see _select_arrays).
+    """
+    y_true, rows, entry_rows, cols, scores, n_benchmarks, n_predicted_proteins_in_benchmark = \
+        _select_arrays(proteins, prot_idx, terms, scores, namespace, ftype, predicted,
+                       taxa, cafa_ids)
+
+    ic = None
+    benchmark_ic = predicted_ic = 0.
+    if weighted:
+        with instrument.stage('information_content'):
+            ic = inou.load_information_content(_get_benchmark_file(ftype), get_go(), namespace)
+            protein_ic = np.bincount(row_ids(y_true.indptr), weights=ic[y_true.indices],
+                                     minlength=y_true.shape[0])
+        benchmark_ic, predicted_ic = protein_ic.sum(), protein_ic[rows].sum()
+    baselines = {
+        'full': (n_benchmarks, benchmark_ic),
+        'partial': (n_predicted_proteins_in_benchmark, predicted_ic),
+    }
+
+    if block_size is None:
+        y_true, y_pred = _build_arrays(y_true, rows, entry_rows, cols, scores,
+                                       namespace, sparse)
+        with instrument.stage('threshold_sweep'):
+            thresholds = get_thresholds(y_pred, thresholds)
+            sums = threshold_sums(y_true, y_pred, thresholds, ic)
+
+        return thresholds, sums, baselines
+
+    blocks = (y_true, rows, entry_rows, cols, scores, namespace, sparse)
+    if isinstance(thresholds, str):
+        if thresholds != 'exact':
+            raise ValueError("Unknown thresholds {}.".format(thresholds))
+        # distinct scores before propagation, which are the same after it
+        # unless some of them are only found in overwritten entries
+        root_term_id = get_go().term2index[namespace][onto.namespace2go[namespace]]
+        scored = (scores != 0.) & (cols != root_term_id)
+        candidates = np.unique(scores[scored])
+        sums, distinct = _blocked_sums(*blocks, candidates, block_size, ic,
+                                       distinct_scores=True)
+        thresholds = distinct
+        if not np.array_equal(candidates, distinct):
+            sums, _ = _blocked_sums(*blocks, thresholds, block_size, ic)
+    else:
+        thresholds = get_thresholds(None, thresholds)
+        sums, _ = _blocked_sums(*blocks, thresholds, block_size, ic)
+
+    return thresholds, finalize_sums(sums), baselines
+
+def _blocked_sums(y_true, rows, entry_rows, cols, scores, namespace, sparse,
+                  thresholds, block_size, ic=None, distinct_scores=False):
+    """Accumulate the partial sums of metrics.update_sums over blocks of
+block_size proteins (see _select_arrays), which are propagated one at a time.
+Return the partial sums and, if distinct_scores, the distinct nonzero scores
+after propagation (else None)."""
+    n_terms = y_true.shape[1]
+    sums = init_sums(thresholds, ic is not None)
+    distinct = np.empty(0) if distinct_scores else None
+    bounds = np.searchsorted(entry_rows, np.arange(0, rows.shape[0] + block_size, block_size))
+    for k, start in enumerate(range(0, rows.shape[0], block_size)):
+        stop = min(start + block_size, rows.shape[0])
+        a, b = bounds[k], bounds[k + 1]
+        with instrument.stage('build_matrices'):
+            block_true = y_true.take_rows(rows[start:stop])
+            block_pred = CSRMatrix.from_coo(entry_rows[a:b] - start, cols[a:b],
+                                            scores[a:b], (stop - start, n_terms))
+            if not sparse:
+                block_true = block_true.toarray()
+                block_pred = block_pred.toarray()
+        block_true, block_pred = _propagate(block_true, block_pred, namespace)
+
+        with instrument.stage('threshold_sweep'):
+            update_sums(sums, block_true, block_pred, thresholds, ic)
+        if distinct_scores:
+            values = block_pred if isinstance(block_pred, np.ndarray) else block_pred.data
+            distinct = np.union1d(distinct, values[values != 0.])
 
-    # convert UniProt accessions into CAFA ids
-    pred = mapper.map(pred)
+    return sums, distinct
 
+def _dict_to_arrays(pred):
+    """Flatten a dict of predictions (see run) into coordinate arrays."""
+    with instrument.stage('dict_to_arrays'):
+        proteins = list(pred.keys())
+        counts = np.array([ len(terms) for terms in pred.values() ], dtype=np.int64)
+        prot_idx = np.repeat(np.arange(len(proteins)), counts)
+        terms = onto.go_to_int([ t for terms in pred.values() for t, _ in terms ], strict=False)
+        scores = np.array([ c for terms in pred.values() for _, c in terms ], dtype=np.float64)
+
+    return proteins, prot_idx, terms, scores
+
+def _as_coordinates(proteins, terms, prot_idx):
+    """Return proteins (each one once), prot_idx and integer terms."""
+    if prot_idx is None:
+        # index proteins in order of appearance
+        proteins, first, inverse = np.unique(
+            np.asarray(proteins), return_index=True, return_inverse=True)
+        order = np.argsort(first)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(order.shape[0])
+        proteins, prot_idx = proteins[order], rank[inverse.ravel()]
+
+    return proteins, np.asarray(prot_idx), _as_terms(terms)
+
+def _as_terms(terms):
+    """Convert GO ids (strings or integers) into integers (-1 if they are not
+GO ids)."""
+    terms = np.asarray(terms)
+    if terms.dtype.kind in 'iu':
+        return terms
+
+    return onto.go_to_int(terms, strict=False)
+
+def _get_benchmark_file(ftype):
     # define benchmark file
     if ftype == 1:
-        true_fin = TRUE_FIN # type1
+        return TRUE_FIN # type1
     else:
-        true_fin = TRUE_FIN2 # type1 + type2
+        return TRUE_FIN2 # type1 + type2
 
-    # obtained protein identifieres that appear in the benchmarks
-    common_prots = inou.get_common_prots(true_fin, pred, go, namespace)
+def _select_arrays(proteins, prot_idx, terms, scores, namespace, ftype,
+                   predicted=None, taxa='all', cafa_ids=None, benchmark_index=None):
+    """
+    Select the predictions given as arrays (see run_arrays), whose proteins
+    are UniProt accessions, of proteins in the benchmark and terms in the
+    namespace. Only the proteins in the boolean mask predicted are used (by
+    default, all of them), and of the given taxa (see conversion.mapper).
+    cafa_ids are the CAFA ids of the proteins, if they were already mapped,
+    and benchmark_index the inou.protein_index of the benchmark proteins, if
+    it was already computed.
 
-    # read data from input files
-    # true \in (n_proteins, n_onto_specific_terms)
-    n_benchmarks, proteins, y_true = inou.read_groundtruth(
-        true_fin, go, namespace, common_prots)
+    Return the propagated benchmark matrix (see inou.load_groundtruth), the
+    sorted benchmark rows of the predicted proteins, the (row, column, score)
+    of the selected predictions, where rows index the predicted proteins and
+    are sorted, and the number of benchmark proteins and of predicted proteins
+    in the benchmark.
+    """
+    go = get_go()
+    true_fin = _get_benchmark_file(ftype)
 
-    n_predicted_proteins_in_benchmark, y_pred = utils.predictions_into_a_matrix(pred, proteins, namespace)
+    with instrument.stage('load_groundtruth'):
+        benchmark_prots, y_true = inou.load_groundtruth(true_fin, go, namespace)
+    n_benchmarks = len(benchmark_prots)
+    prot_rows = _benchmark_rows(benchmark_prots, proteins, taxa, cafa_ids,
+                                benchmark_index)
+    if predicted is not None:
+        prot_rows[~predicted] = -1
 
-    # propagate terms based on the topological structure of the GO
-    #
-    # create cache files containing ancestor terms
-    utils.create_cache_files(log=False)
-    # read cache file with ancestors
-    anc_fin = os.path.dirname(os.path.realpath(__file__)) + '/' + namespace + '.npz'
-    ancestors = np.load(anc_fin)['a']
-
-    # propagate terms to include their ancestors
-    utils.propagate_terms(y_true, ancestors)
-    utils.propagate_terms(y_pred, ancestors)
-    branches = None # free memory
+    # rows are sorted, so proteins keep the order of the benchmark
+    rows = np.unique(prot_rows[prot_rows >= 0])
+    n_predicted_proteins_in_benchmark = float(rows.shape[0])
+
+    # keep predictions of proteins in the benchmark and terms in the namespace
+    with instrument.stage('select_predictions'):
+        entry_rows = prot_rows[prot_idx]
+        term_ns, term_index = go.lookup_terms(terms)
+        n_missing = np.count_nonzero((entry_rows >= 0) & (term_ns < 0))
+        if n_missing > 0: # discard terms not present in go
+            warnings.warn("{} predicted terms are missing in the go.".format(n_missing))
+        keep = np.flatnonzero((entry_rows >= 0) & (term_ns == onto.NAMESPACE_CODES.index(namespace)))
+        # the sort is stable, so repeated predictions keep their order
+        entry_rows = np.searchsorted(rows, entry_rows[keep])
+        order = np.argsort(entry_rows, kind='stable')
+        keep = keep[order]
+
+    return y_true, rows, entry_rows[order], term_index[keep], \
+        np.asarray(scores, dtype=np.float64)[keep], \
+        n_benchmarks, n_predicted_proteins_in_benchmark
+
+def _prepare_arrays(proteins, prot_idx, terms, scores, namespace, ftype, sparse,
+                    predicted=None, taxa='all'):
+    """Build the propagated matrices y_true and y_pred from predictions given
+as arrays (see _select_arrays). Return y_true, y_pred, the number of benchmark
+proteins and the number of predicted proteins in the benchmark."""
+    y_true, rows, entry_rows, cols, scores, n_benchmarks, n_predicted_proteins_in_benchmark = \
+        _select_arrays(proteins, prot_idx, terms, scores, namespace, ftype, predicted,
+                       taxa)
+    y_true, y_pred = _build_arrays(y_true, rows, entry_rows, cols, scores,
+                                   namespace, sparse)
+
+    return y_true, y_pred, n_benchmarks, n_predicted_proteins_in_benchmark
+
+def _build_arrays(y_true, rows, entry_rows, cols, scores, namespace, sparse):
+    """Return the propagated matrices y_true and y_pred of the predictions
+selected by _select_arrays."""
+    with instrument.stage('build_matrices'):
+        y_true = y_true.take_rows(rows)
+        y_pred = CSRMatrix.from_coo(entry_rows, cols, scores,
+                                    (rows.shape[0], y_true.shape[1]))
+        if not sparse:
+            y_true = y_true.toarray()
+            y_pred = y_pred.toarray()
+
+    return _propagate(y_true, y_pred, namespace)
+
+def _matrix_to_arrays(matrix, rows, terms, namespace):
+    """Return the coordinates (prot_idx, terms, scores) of the nonzero values
+of a labeled matrix (see run_matrix) in the rows of the boolean mask rows and
+the columns of the namespace."""
+    go = get_go()
+    terms = _as_terms(terms)
+    ns_code = onto.NAMESPACE_CODES.index(namespace)
+    if isinstance(matrix, CSRMatrix):
+        prot_idx = row_ids(matrix.indptr)
+        term_ns, _ = go.lookup_terms(terms[matrix.indices])
+        keep = np.flatnonzero((matrix.data != 0) & rows[prot_idx] & (term_ns == ns_code))
+        return prot_idx[keep], terms[matrix.indices[keep]], matrix.data[keep]
+
+    term_ns, _ = go.lookup_terms(terms)
+    src = np.flatnonzero(rows)
+    cols = np.flatnonzero(term_ns == ns_code)
+    block = np.asarray(matrix)[np.ix_(src, cols)]
+    i, j = np.nonzero(block)
+
+    return src[i], terms[cols[j]], block[i, j].astype(np.float64)
+
+def _benchmark_rows(benchmark_prots, proteins, taxa='all', cafa_ids=None,
+                    benchmark_index=None):
+    """Return the benchmark row of each protein (UniProt accession of one of
+the taxa), or -1 if it is not found. cafa_ids are the CAFA ids of the
+proteins, if they were already mapped (see mapper.lookup), and
+benchmark_index the inou.protein_index of benchmark_prots."""
+    # convert UniProt accessions into CAFA ids, and find them in the benchmark
+    if cafa_ids is None:
+        with instrument.stage('map_proteins'):
+            cafa_ids, _ = mapper.lookup(proteins, taxa)
+    with instrument.stage('benchmark_rows'):
+        prot_rows = inou.get_protein_rows(benchmark_prots, cafa_ids, benchmark_index)
+    # as in mapper.map, the last accession mapped to a CAFA id wins
+    in_benchmark = np.flatnonzero(prot_rows >= 0)[::-1]
+    _, last = np.unique(prot_rows[in_benchmark], return_index=True)
+    winner = np.zeros(prot_rows.shape[0], dtype=np.bool_)
+    winner[in_benchmark[last]] = True
+    prot_rows[~winner] = -1
+
+    return prot_rows
+
+def _propagate(y_true, y_pred, namespace):
+    """Propagate predictions (y_true is already propagated) and exclude root
+terms, for dense arrays or sparse.CSRMatrix."""
+    go = get_go()
+
+    # read cache file with the topological order and parents of the terms
+    # (created if needed)
+    with instrument.stage('load_parents'):
+        parents = utils.load_parents(namespace)
 
     # Exclude root terms
     root_term = onto.namespace2go[namespace]
     root_term_id = go.term2index[namespace][root_term]
-    y_true[:, root_term_id] = False
-    y_pred[:, root_term_id] = 0.
 
-    # Calculate metrics
-    results = np.empty((len(range(0, 101)), 4))
-    baseline = n_benchmarks if mode == 'full' else n_predicted_proteins_in_benchmark
-    precision_recall_curve(y_true, y_pred, baseline, results)
+    # propagate terms based on the topological structure of the GO
+    if isinstance(y_pred, CSRMatrix):
+        # propagate terms to include their ancestors
+        with instrument.stage('propagate'):
+            y_pred = utils.propagate_terms_csr(y_pred, *parents)
 
-    return results
+        y_true = y_true.drop_column(root_term_id)
+        y_pred = y_pred.drop_column(root_term_id)
+    else:
+        # propagate terms to include their ancestors
+        with instrument.stage('propagate'), parallel.kernel(y_pred.shape[0], y_pred.size):
+            utils.propagate_terms(y_pred, *parents)
+
+        y_true[:, root_term_id] = False
+        y_pred[:, root_term_id] = 0.
 
-def f1max_score(pred, mode, namespace, ftype=1):
-    """ Return maximum F1 score"""
-    results = run(pred, mode, namespace, ftype)
+    return y_true, y_pred
+
+def f1max_score(pred, mode, namespace, ftype=1, sparse=False, thresholds=None,
+                **kwargs):
+    """ Return maximum F1 score. Other keyword arguments (e.g. block_size,
+taxa, threads) are passed to run."""
+    results = run(pred, mode, namespace, ftype, sparse, thresholds, **kwargs)
     return max(results[:,1])
+
+def smin_score(pred, mode, namespace, ftype=1, sparse=False, thresholds=None,
+               **kwargs):
+    """ Return minimum semantic distance (Smin). Other keyword arguments are
+passed to run, as in f1max_score."""
+    results = run(pred, mode, namespace, ftype, sparse, thresholds, weighted=True,
+                  **kwargs)
+    return min(results[:,9])
+
+def term_scores(pred, mode, namespace, ftype=1, sparse=False, min_positives=1,
+                **kwargs):
+    """ Return the macro averages of the term-centric metrics (see run_terms)
+as a dict with keys "roc_auc", "aupr" and "n_terms" (number of terms kept).
+Other keyword arguments (taxa, threads) are passed to run_terms."""
+    _, results = run_terms(pred, mode, namespace, ftype, sparse, min_positives,
+                           **kwargs)
+    if results.shape[0] == 0:
+        return {'roc_auc': np.nan, 'aupr': np.nan, 'n_terms': 0}
+    # ROC-AUC is undefined for terms annotated to all the proteins
+    roc_auc = results[:, 1][~np.isnan(results[:, 1])]
+    return {
+        'roc_auc': roc_auc.mean() if roc_auc.shape[0] > 0 else np.nan,
+        'aupr': results[:, 2].mean(),
+        'n_terms': results.shape[0],
+    }
+
+@parallel.threaded
+def f1max_bootstrap(pred, mode, namespace, ftype=1, sparse=False, thresholds=None,
+                    n_replicates=1000, confidence=0.95, seed=None):
+    """Return bootstrap confidence intervals for the maximum F1 score and the
+precision and recall at the threshold maximizing it.
+
+    Predictions are loaded, propagated and swept once, into per-protein
+    contributions (see metrics.protein_contributions). Each of the
+    n_replicates replicates resamples the proteins ("full" mode: benchmark
+    proteins, "partial": predicted proteins in the benchmark) and is a
+    weighted reduction of the contributions (see metrics.bootstrap_curves).
+    Thresholds must be fixed (None or an array): with "exact" thresholds, the
+    contributions would take n_proteins * n_distinct_scores memory.
+
+    Output:
+    ======
+    - intervals: a dict "fmax", "precision", "recall" -> (value, low, high),
+      where value is calculated on all proteins and (low, high) is the
+      percentile interval with the given confidence.
+    """
+    proteins, prot_idx, terms, scores = _dict_to_arrays(pred)
+
+    return f1max_bootstrap_arrays(proteins, terms, scores, mode, namespace, ftype,
+                                  sparse, thresholds, n_replicates, confidence,
+                                  seed, prot_idx=prot_idx)
+
+@parallel.threaded
+def f1max_bootstrap_arrays(proteins, terms, scores, mode, namespace, ftype=1,
+                           sparse=False, thresholds=None, n_replicates=1000,
+                           confidence=0.95, seed=None, prot_idx=None):
+    """Same as f1max_bootstrap, but predictions are given as in run_arrays."""
+    if isinstance(thresholds, str):
+        raise ValueError("Bootstrap thresholds must be fixed.")
+    proteins, prot_idx, terms = _as_coordinates(proteins, terms, prot_idx)
+
+    y_true, y_pred, n_benchmarks, n_predicted_proteins_in_benchmark = _prepare_arrays(
+        proteins, prot_idx, terms, scores, namespace, ftype, sparse)
+    baseline = n_benchmarks if mode == 'full' else n_predicted_proteins_in_benchmark
+    if baseline == 0:
+        raise ValueError("There are no proteins to resample.")
+
+    thresholds = get_thresholds(None, thresholds)
+    contributions = protein_contributions(y_true, y_pred, thresholds)
+    results = np.empty((len(thresholds), 4))
+    curve_from_sums(*[ c.sum(axis=0) for c in contributions ], baseline,
+                    thresholds, results)
+    _, f1, precision, recall = utils.fmax_row(results)
+
+    replicates = bootstrap_curves(contributions, baseline, n_replicates, seed)
+    percentiles = [ 50. * (1. - confidence), 50. * (1. + confidence) ]
+    intervals = {}
+    for name, value, values in zip(('fmax', 'precision', 'recall'),
+                                   (f1, precision, recall), replicates):
+        low, high = np.percentile(values, percentiles)
+        intervals[name] = (value, float(low), float(high))
+
+    return intervals
+
+@parallel.threaded
+def permutation_test(pred_a, pred_b, mode, namespace, ftype=1, sparse=False,
+                     thresholds=None, n_permutations=10000, seed=None):
+    """Paired permutation test over proteins of the maximum F1 score of two
+prediction sets (dicts, see run) on the same benchmark.
+
+    Both prediction sets are loaded, propagated and swept once, into
+    per-protein contributions (see metrics.protein_contributions) over the
+    union of their predicted proteins. Each permutation exchanges the
+    contributions of every protein between both models with probability 1/2
+    (see metrics.permutation_differences). Thresholds must be fixed (None or
+    an array), as in f1max_bootstrap.
+
+    Output:
+    ======
+    - test: a dict with "fmax_a", "fmax_b", "difference" (fmax_b - fmax_a),
+      "effect_size" (the difference divided by the standard deviation of the
+      differences under permutation), "p_value" (two-sided) and
+      "n_permutations".
+    """
+    pred_a = _dict_to_arrays(pred_a)
+    pred_b = _dict_to_arrays(pred_b)
+
+    return permutation_test_arrays(
+        (pred_a[0], pred_a[2], pred_a[3], pred_a[1]),
+        (pred_b[0], pred_b[2], pred_b[3], pred_b[1]),
+        mode, namespace, ftype, sparse, thresholds, n_permutations, seed)
+
+@parallel.threaded
+def permutation_test_arrays(pred_a, pred_b, mode, namespace, ftype=1,
+                            sparse=False, thresholds=None, n_permutations=10000,
+                            seed=None):
+    """Same as permutation_test, but each prediction set is a tuple (proteins,
+terms, scores) or (proteins, terms, scores, prot_idx), as in run_arrays."""
+    if isinstance(thresholds, str):
+        raise ValueError("Permutation test thresholds must be fixed.")
+    thresholds = get_thresholds(None, thresholds)
+    selected = []
+    for pred in (pred_a, pred_b):
+        proteins, prot_idx, terms = _as_coordinates(
+            pred[0], pred[1], pred[3] if len(pred) > 3 else None)
+        selected.append(_select_arrays(proteins, prot_idx, terms, pred[2],
+                                       namespace, ftype))
+    n_benchmarks = selected[0][5]
+
+    # proteins predicted by any model, in benchmark order
+    rows = np.union1d(selected[0][1], selected[1][1])
+    matrices = [ _build_arrays(*s[:5], namespace, sparse) for s in selected ]
+
+    contributions = []
+    predicted = []
+    for s, (y_true, y_pred) in zip(selected, matrices):
+        pos = np.searchsorted(rows, s[1])
+        model = []
+        for c in protein_contributions(y_true, y_pred, thresholds):
+            expanded = np.zeros((rows.shape[0], len(thresholds)))
+            expanded[pos] = c
+            model.append(expanded)
+        contributions.append(model)
+        predicted.append(np.isin(rows, s[1]))
+
+    observed, differences = permutation_differences(
+        contributions[0], contributions[1], predicted[0], predicted[1],
+        n_benchmarks if mode == 'full' else None, n_permutations, seed)
+
+    fmax = []
+    for model, pred_mask in zip(contributions, predicted):
+        baseline = n_benchmarks if mode == 'full' else np.count_nonzero(pred_mask)
+        results = np.empty((len(thresholds), 4))
+        curve_from_sums(*[ c.sum(axis=0) for c in model ], baseline, thresholds, results)
+        fmax.append(utils.fmax_row(results)[1])
+
+    # ties are counted as extreme, with a tolerance for round-off errors
+    n_extreme = np.count_nonzero(np.abs(differences) >= abs(observed) - 1e-12)
+    std = differences.std()
+
+    return {
+        'fmax_a': fmax[0],
+        'fmax_b': fmax[1],
+        'difference': float(observed),
+        'effect_size': float(observed / std) if std > 0 else 0.,
+        'p_value': float((n_extreme + 1.) / (n_permutations + 1.)),
+        'n_permutations': n_permutations,
+    }
+
+def warm_up(ftype=1):
+    """
+    Compile the numba kernels, or load them from the on-disk cache of numba,
+    and build the caches of the ontology, the benchmarks and the id mappings.
+
+    Kernels are compiled with cache=True, so a warm-up after installing or
+    updating the package (python -m catool warmup) saves later processes the
+    compilation. They are run on a single prediction of a benchmark protein in
+    each namespace, through the same paths (and types) as real evaluations.
+    """
+    go = get_go()
+    accs, cafa_ids, _ = mapper.get_index()
+    true_fin = _get_benchmark_file(ftype)
+    for namespace in onto.NAMESPACES.values():
+        benchmark_prots, _ = inou.load_groundtruth(true_fin, go, namespace)
+        found = np.flatnonzero(np.isin(cafa_ids, np.asarray(benchmark_prots,
+                                                            dtype=cafa_ids.dtype)))
+        if found.shape[0] == 0:
+            continue
+        pred = (accs[found[:1]], np.array([ go.index2term[namespace][0] ]), np.array([0.5]))
+        for sparse in (False, True):
+            for weighted in (False, True):
+                run_arrays(*pred, 'full', namespace, ftype, sparse, weighted=weighted)
+            run_terms_arrays(*pred, 'full', namespace, ftype, sparse)
+        f1max_bootstrap_arrays(*pred, 'full', namespace, ftype, n_replicates=2, seed=0)
+        permutation_test_arrays(pred, pred, 'full', namespace, ftype,
+                                n_permutations=2, seed=0)
+
+    precision_and_recall_at_thr(np.ones((1, 1), dtype=np.bool_), np.ones((1, 1)), 1., 0.5)
+
+    # prediction parser
+    fd, pred_fin = tempfile.mkstemp(suffix='.tsv')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write('P00000\tGO:0008150\t0.50\n')
+        inou.read_predictions_arrays(pred_fin)
+    finally:
+        os.remove(pred_fin)
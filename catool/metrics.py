@@ -1,10 +1,12 @@
 import numpy as np
 import numba as nb
 
+from . import parallel
+
 EPSILON = np.finfo(float).eps
 
 #@nb.njit(parallel=True, fastmath=True)
-@nb.njit(parallel=True)
+@nb.njit(parallel=True, cache=True)
 def precision_and_recall_at_thr(true, pred, n_predicted_proteins, thr):
     """#
     true: (n_proteins, n_terms)
@@ -17,51 +19,622 @@ def precision_and_recall_at_thr(true, pred, n_predicted_proteins, thr):
     \sum_i^m pr_i
     \sum_i^N rc_N
     """
-    pr = 0.
-    re = 0.
-    n_retrieved = 0.
+    # values of each protein, summed in order below so that the sums don't
+    # depend on the number of threads
+    prot_pr = np.empty(true.shape[0])
+    prot_re = np.empty(true.shape[0])
+    prot_retrieved = np.empty(true.shape[0])
     for i in nb.prange(true.shape[0]): # loop over proteins
-        ### PROTEIN INDEX
-        #i = 2015
-        #i = 1981 # T96060010945
-        # i = 2061 # T96060010935
-        # i = 2126 # T96060001131
-        ####################
-
         tp = 0. # true positives
         retrieved = 0.
         relevant = 0.
-        for j in nb.prange(true.shape[1]): # loop over terms
+        for j in range(true.shape[1]): # loop over terms
             val = (pred[i,j] >= thr)
             tp += true[i,j] * val
             relevant += true[i,j]
             retrieved += val # count the number of pred >= thr
-        pr += tp / (retrieved + EPSILON)
-        re += tp / (relevant + EPSILON)
+        prot_pr[i] = tp / (retrieved + EPSILON)
+        prot_re[i] = tp / (relevant + EPSILON)
         # count proteins with at least one prediction
-        if retrieved > 0:
-            n_retrieved += 1.
+        prot_retrieved[i] = 1. if retrieved > 0 else 0.
 
-        ######
-        # break
-    ############
-    #print(n_retrieved)
-    #print(n_predicted_proteins)
+    pr = 0.
+    re = 0.
+    n_retrieved = 0.
+    for i in range(true.shape[0]):
+        pr += prot_pr[i]
+        re += prot_re[i]
+        n_retrieved += prot_retrieved[i]
 
     return pr / n_retrieved, re / n_predicted_proteins
 
-@nb.njit(parallel=True)
-def precision_recall_curve(true, pred, n_predicted_proteins, out):
-    for i in nb.prange(out.shape[0]):
-        thr = 0.01 * i # prediction threshold
-        pr, re = precision_and_recall_at_thr(true, pred, n_predicted_proteins, thr)
-        # if thr == 0.01:
-        #     breakpoint()
-
-        if re > 1:
-            re = 1.
-        f1 = 2. * ((pr * re) / (pr + re + EPSILON)) # f1-measure
-        out[i, 0] = thr
-        out[i, 1] = f1
-        out[i, 2] = pr
-        out[i, 3] = re
+# fields of the events written by _protein_sweep: precision, recall and
+# "retrieved > 0", followed, for information-content weighted metrics, by the
+# weighted precision, the weighted recall, the information content of the
+# true positives and of the retrieved terms
+N_FIELDS = 3
+N_WEIGHTED_FIELDS = 7
+
+@nb.njit(cache=True)
+def _protein_sweep(scores, labels, weights, n_zeros, n_zero_labels, zero_weight,
+                   zero_label_weight, relevant, relevant_weight, thresholds,
+                   ev_thr, ev):
+    """Sweep over the predictions of a single protein.
+
+    scores/labels hold the nonzero predictions of the protein and whether
+    their terms are true. The remaining n_zeros terms are predicted as 0, and
+    n_zero_labels of them are true.
+
+    Precision, recall and "retrieved > 0" are step functions of the
+    threshold index, which only change at the thresholds hit by the scores.
+    Predictions are thus sorted by threshold index and, at each distinct index,
+    the change of the three quantities is written as an event (a row of ev).
+    The number of events is returned.
+
+    If ev has N_WEIGHTED_FIELDS columns, weighted metrics are also swept:
+    weights hold the information content of the predicted terms, zero_weight
+    and zero_label_weight the one of the zero predicted terms (and of the true
+    ones among them) and relevant_weight the one of the true terms.
+    """
+    m = scores.shape[0]
+    weighted = ev.shape[1] == N_WEIGHTED_FIELDS
+    # threshold index of each prediction: largest k such that
+    # score >= thresholds[k], or -1 if the score is below all thresholds
+    bins = np.empty(m + 1, dtype=np.int64)
+    w_retrieved = np.empty(m + 1)
+    w_tp = np.empty(m + 1)
+    ic_retrieved = np.zeros(m + 1)
+    ic_tp = np.zeros(m + 1)
+    for e in range(m):
+        bins[e] = np.searchsorted(thresholds, scores[e], side='right') - 1
+        w_retrieved[e] = 1.
+        w_tp[e] = labels[e]
+        if weighted:
+            ic_retrieved[e] = weights[e]
+            ic_tp[e] = weights[e] * labels[e]
+    # all zero predictions fall together into the same bin
+    bins[m] = np.searchsorted(thresholds, 0., side='right') - 1
+    w_retrieved[m] = n_zeros
+    w_tp[m] = n_zero_labels
+    ic_retrieved[m] = zero_weight
+    ic_tp[m] = zero_label_weight
+    order = np.argsort(-bins, kind='mergesort')
+
+    tp = 0. # true positives
+    retrieved = 0.
+    tp_weight = 0.
+    retrieved_weight = 0.
+    old = np.zeros(ev.shape[1])
+    new = np.empty(ev.shape[1])
+    n_events = 0
+    e = 0
+    while e <= m:
+        b = bins[order[e]]
+        if b < 0: # never retrieved
+            break
+        # cumulative counts over predictions >= thresholds[b]
+        while e <= m and bins[order[e]] == b:
+            tp += w_tp[order[e]]
+            retrieved += w_retrieved[order[e]]
+            tp_weight += ic_tp[order[e]]
+            retrieved_weight += ic_retrieved[order[e]]
+            e += 1
+        ev_thr[n_events] = b
+        new[0] = tp / (retrieved + EPSILON)
+        new[1] = tp / (relevant + EPSILON)
+        new[2] = 1. if retrieved > 0 else 0.
+        if weighted:
+            new[3] = tp_weight / (retrieved_weight + EPSILON)
+            new[4] = tp_weight / (relevant_weight + EPSILON)
+            new[5] = tp_weight
+            new[6] = retrieved_weight
+        for f in range(ev.shape[1]):
+            ev[n_events, f] = new[f] - old[f]
+            old[f] = new[f]
+        n_events += 1
+
+    return n_events
+
+@nb.njit(parallel=True, cache=True)
+def _sweep_dense(true, pred, ic, thresholds, offsets, ev_thr, ev, n_events):
+    weighted = ev.shape[1] == N_WEIGHTED_FIELDS
+    for i in nb.prange(true.shape[0]): # loop over proteins
+        m = offsets[i + 1] - offsets[i] - 1
+        scores = np.empty(m)
+        labels = np.empty(m)
+        weights = np.empty(m)
+        relevant = 0.
+        matched = 0.
+        relevant_weight = 0.
+        matched_weight = 0.
+        total_weight = 0.
+        n = 0
+        for j in range(true.shape[1]): # loop over terms
+            relevant += true[i,j]
+            if weighted:
+                relevant_weight += true[i,j] * ic[j]
+                total_weight += ic[j]
+            if pred[i,j] != 0.:
+                scores[n] = pred[i,j]
+                labels[n] = true[i,j]
+                matched += true[i,j]
+                if weighted:
+                    weights[n] = ic[j]
+                    matched_weight += true[i,j] * ic[j]
+                n += 1
+        predicted_weight = 0.
+        for e in range(m):
+            predicted_weight += weights[e] if weighted else 0.
+        start = offsets[i]
+        n_events[i] = _protein_sweep(
+            scores, labels, weights, true.shape[1] - m, relevant - matched,
+            total_weight - predicted_weight, relevant_weight - matched_weight,
+            relevant, relevant_weight, thresholds, ev_thr[start:], ev[start:])
+
+@nb.njit(parallel=True, cache=True)
+def _sweep_csr(t_indptr, t_indices, p_indptr, p_indices, p_data, n_terms, ic,
+               thresholds, offsets, ev_thr, ev, n_events):
+    weighted = ev.shape[1] == N_WEIGHTED_FIELDS
+    total_weight = 0.
+    if weighted:
+        total_weight = ic.sum()
+    for i in nb.prange(t_indptr.shape[0] - 1): # loop over proteins
+        m = p_indptr[i + 1] - p_indptr[i]
+        labels = np.zeros(m)
+        weights = np.zeros(m)
+        relevant = t_indptr[i + 1] - t_indptr[i]
+        matched = 0.
+        relevant_weight = 0.
+        matched_weight = 0.
+        predicted_weight = 0.
+        if weighted:
+            for k in range(t_indptr[i], t_indptr[i + 1]):
+                relevant_weight += ic[t_indices[k]]
+        # column indices are sorted, so labels are found by merging rows
+        k = t_indptr[i]
+        for j in range(p_indptr[i], p_indptr[i + 1]):
+            while k < t_indptr[i + 1] and t_indices[k] < p_indices[j]:
+                k += 1
+            if k < t_indptr[i + 1] and t_indices[k] == p_indices[j]:
+                labels[j - p_indptr[i]] = 1.
+                matched += 1.
+                if weighted:
+                    matched_weight += ic[p_indices[j]]
+            if weighted:
+                weights[j - p_indptr[i]] = ic[p_indices[j]]
+                predicted_weight += ic[p_indices[j]]
+        start = offsets[i]
+        n_events[i] = _protein_sweep(
+            p_data[p_indptr[i]:p_indptr[i + 1]], labels, weights, n_terms - m,
+            relevant - matched, total_weight - predicted_weight,
+            relevant_weight - matched_weight, relevant, relevant_weight,
+            thresholds, ev_thr[start:], ev[start:])
+
+@nb.njit(cache=True)
+def _count_nonzeros(pred, counts):
+    for i in range(pred.shape[0]):
+        n = 0
+        for j in range(pred.shape[1]):
+            if pred[i,j] != 0.:
+                n += 1
+        counts[i] = n
+
+@nb.njit(cache=True)
+def _reduce_events(offsets, n_events, ev_thr, ev, sums):
+    # proteins are visited in order, so sums don't depend on scheduling
+    for i in range(n_events.shape[0]):
+        for e in range(offsets[i], offsets[i] + n_events[i]):
+            for f in range(ev.shape[1]):
+                sums[f, ev_thr[e]] += ev[e, f]
+
+@nb.njit(parallel=True, cache=True)
+def _expand_events(offsets, n_events, ev_thr, ev, contributions):
+    for i in nb.prange(n_events.shape[0]): # loop over proteins
+        for e in range(offsets[i], offsets[i] + n_events[i]):
+            for f in range(ev.shape[1]):
+                contributions[f, i, ev_thr[e]] += ev[e, f]
+        # values at threshold k are accumulated over the thresholds >= k
+        for f in range(ev.shape[1]):
+            for k in range(contributions.shape[2] - 2, -1, -1):
+                contributions[f, i, k] += contributions[f, i, k + 1]
+
+def protein_contributions(true, pred, thresholds, ic=None):
+    """Same as threshold_sums, but values are not summed over proteins: return
+three arrays (n_proteins, n_thresholds) with the precision and the recall of
+each protein, and whether it has a prediction >= threshold (1. or 0.), followed
+by the four weighted ones if ic is given.
+
+Sums of any subset of proteins, or weighted sums (see bootstrap_curves), are
+then reductions over the rows of these arrays."""
+    offsets, n_events, ev_thr, ev = _sweep_events(true, pred, thresholds, ic)
+    contributions = np.zeros((ev.shape[1], true.shape[0], len(thresholds)))
+    with parallel.kernel(true.shape[0], contributions.size):
+        _expand_events(offsets, n_events, ev_thr, ev, contributions)
+    contributions[2] = np.round(contributions[2])
+
+    return tuple(contributions)
+
+def bootstrap_curves(contributions, n_proteins, n_replicates=1000, seed=None,
+                     chunk_size=256):
+    """
+    Resample proteins with replacement and return, for each replicate, the
+    maximum f1 and the precision and recall at the threshold maximizing it, as
+    three arrays (n_replicates,).
+
+    contributions: the arrays of protein_contributions, for the predicted
+    proteins. n_proteins is the number of proteins used to average recall
+    (see curve_from_sums); in "full" mode, the n_proteins - n_predicted
+    proteins without predictions contribute nothing but are also resampled.
+
+    Each replicate is a vector of counts (how many times each protein was
+    drawn), so its sums are a weighted reduction of the contributions:
+    replicates are reduced in chunks of chunk_size with matrix products.
+    """
+    pr, re, retrieved = contributions
+    n_predicted = pr.shape[0]
+    n_proteins = int(round(n_proteins))
+    rng = np.random.default_rng(seed)
+    # proteins without predictions are drawn together in the last column
+    pvals = np.full(n_predicted + 1, 1. / n_proteins)
+    pvals[-1] = max(0., 1. - n_predicted / n_proteins)
+
+    fmax = np.empty(n_replicates)
+    precision = np.empty(n_replicates)
+    recall = np.empty(n_replicates)
+    for start in range(0, n_replicates, chunk_size):
+        stop = min(start + chunk_size, n_replicates)
+        weights = rng.multinomial(n_proteins, pvals / pvals.sum(),
+                                  size=stop - start)[:, :-1].astype(np.float64)
+        n_retrieved = np.round(weights @ retrieved)
+        rep_pr = np.divide(weights @ pr, n_retrieved,
+                           out=np.zeros_like(n_retrieved), where=n_retrieved > 0)
+        rep_re = np.minimum((weights @ re) / n_proteins, 1.)
+        f1 = 2. * ((rep_pr * rep_re) / (rep_pr + rep_re + EPSILON))
+        best = np.argmax(f1, axis=1)
+        rows = np.arange(stop - start)
+        fmax[start:stop] = f1[rows, best]
+        precision[start:stop] = rep_pr[rows, best]
+        recall[start:stop] = rep_re[rows, best]
+
+    return fmax, precision, recall
+
+@nb.njit(cache=True)
+def _fmax_from_sums(pr, re, n_retrieved, n_predicted_proteins):
+    # same as curve_from_sums, but only the maximum f1 is returned
+    fmax = 0.
+    if n_predicted_proteins == 0.:
+        return fmax
+    for k in range(pr.shape[0]):
+        precision = pr[k] / n_retrieved[k] if n_retrieved[k] > 0. else 0.
+        recall = min(re[k] / n_predicted_proteins, 1.)
+        f1 = 2. * ((precision * recall) / (precision + recall + EPSILON))
+        if f1 > fmax:
+            fmax = f1
+    return fmax
+
+@nb.njit(parallel=True, cache=True)
+def _permuted_differences(pr, re, retrieved, predicted, n_proteins, swaps, out):
+    """pr, re, retrieved: (2, n_proteins, n_thresholds) contributions of both
+models, predicted: (2, n_proteins). For each permutation p, the rows of
+protein i are exchanged between models if swaps[p, i], and out[p] is the
+difference between the maximum f1 of the second and the first model."""
+    n_thresholds = pr.shape[2]
+    for p in nb.prange(swaps.shape[0]): # loop over permutations
+        sums = np.zeros((2, 3, n_thresholds))
+        n_predicted = np.zeros(2)
+        for i in range(pr.shape[1]): # loop over proteins
+            for m in range(2):
+                src = 1 - m if swaps[p, i] else m
+                n_predicted[m] += predicted[src, i]
+                for k in range(n_thresholds):
+                    sums[m, 0, k] += pr[src, i, k]
+                    sums[m, 1, k] += re[src, i, k]
+                    sums[m, 2, k] += retrieved[src, i, k]
+        fmax = np.empty(2)
+        for m in range(2):
+            # "partial" mode: recall is averaged over predicted proteins
+            baseline = n_proteins if n_proteins > 0 else n_predicted[m]
+            fmax[m] = _fmax_from_sums(sums[m, 0], sums[m, 1], sums[m, 2], baseline)
+        out[p] = fmax[1] - fmax[0]
+
+def permutation_differences(contributions_a, contributions_b, predicted_a,
+                            predicted_b, n_proteins=None, n_permutations=10000,
+                            seed=None, chunk_size=1024):
+    """
+    Paired permutation test of the maximum f1 of two models.
+
+    contributions_a/b: the arrays of protein_contributions of each model, for
+    the same proteins and thresholds. predicted_a/b: boolean arrays indicating
+    which proteins each model predicted. n_proteins is the number of proteins
+    used to average recall ("full" mode), or None to use the number of
+    proteins predicted by each model ("partial" mode).
+
+    Return the observed difference fmax_b - fmax_a and an array
+    (n_permutations,) with the differences obtained when the predictions of
+    each protein are exchanged between models with probability 1/2.
+    Permutations are evaluated in parallel, reusing the contributions.
+    """
+    pr, re, retrieved = [ np.stack([a, b]) for a, b in zip(contributions_a, contributions_b) ]
+    predicted = np.stack([predicted_a, predicted_b]).astype(np.float64)
+    n_proteins = 0. if n_proteins is None else float(n_proteins)
+    rng = np.random.default_rng(seed)
+
+    observed = np.empty(1)
+    _permuted_differences(pr, re, retrieved, predicted, n_proteins,
+                          np.zeros((1, pr.shape[1]), dtype=np.bool_), observed)
+    differences = np.empty(n_permutations)
+    for start in range(0, n_permutations, chunk_size):
+        stop = min(start + chunk_size, n_permutations)
+        swaps = rng.random((stop - start, pr.shape[1])) < 0.5
+        with parallel.kernel(stop - start, swaps.size * pr.shape[2]):
+            _permuted_differences(pr, re, retrieved, predicted, n_proteins, swaps,
+                                  differences[start:stop])
+
+    return observed[0], differences
+
+def threshold_sums(true, pred, thresholds, ic=None):
+    """For every threshold, calculate in a single pass over the predictions:
+
+    - the sum of the protein precisions,
+    - the sum of the protein recalls,
+    - the number of proteins with at least one prediction >= threshold.
+
+    true and pred are either dense (n_proteins, n_terms) arrays or
+    sparse.CSRMatrix. thresholds must be sorted in increasing order.
+
+    If the information content of the terms is given (ic, see
+    utils.information_content), the same pass also returns the sums of the
+    weighted precisions and recalls and of the information content of the
+    true positives and of the retrieved terms (see weighted_curve_from_sums).
+    """
+    sums = init_sums(thresholds, ic is not None)
+    update_sums(sums, true, pred, thresholds, ic)
+    return finalize_sums(sums)
+
+def init_sums(thresholds, weighted=False):
+    """Return empty partial sums (see update_sums)."""
+    return np.zeros((N_WEIGHTED_FIELDS if weighted else N_FIELDS, len(thresholds)))
+
+def update_sums(sums, true, pred, thresholds, ic=None):
+    """Add the proteins of a block (true, pred, as in threshold_sums) to the
+partial sums returned by init_sums. Blocks must be added in order: sums are
+then the same as for a single block with all proteins (see finalize_sums)."""
+    offsets, n_events, ev_thr, ev = _sweep_events(true, pred, thresholds, ic)
+    _reduce_events(offsets, n_events, ev_thr, ev, sums)
+
+def _sweep_events(true, pred, thresholds, ic=None):
+    """Return the events of all proteins (see _protein_sweep) as arrays
+(offsets, n_events, ev_thr, ev): the events of protein i are
+offsets[i]:offsets[i]+n_events[i]."""
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    n_proteins = true.shape[0]
+    if ic is None:
+        n_fields = N_FIELDS
+        ic = np.empty(0)
+    else:
+        n_fields = N_WEIGHTED_FIELDS
+        ic = np.asarray(ic, dtype=np.float64)
+
+    # each protein writes at most one event per nonzero prediction, plus one
+    # for the zero predictions
+    counts = np.empty(n_proteins, dtype=np.int64)
+    if isinstance(pred, np.ndarray):
+        _count_nonzeros(pred, counts)
+    else:
+        counts[:] = np.diff(pred.indptr)
+    offsets = np.zeros(n_proteins + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts + 1)
+
+    ev_thr = np.empty(offsets[-1], dtype=np.int64)
+    ev = np.empty((offsets[-1], n_fields))
+    n_events = np.zeros(n_proteins, dtype=np.int64)
+    if isinstance(pred, np.ndarray):
+        with parallel.kernel(n_proteins, pred.size):
+            _sweep_dense(true, pred, ic, thresholds, offsets, ev_thr, ev, n_events)
+    else:
+        with parallel.kernel(n_proteins, offsets[-1]):
+            _sweep_csr(true.indptr, true.indices, pred.indptr, pred.indices,
+                       pred.data, true.shape[1], ic, thresholds, offsets,
+                       ev_thr, ev, n_events)
+
+    return offsets, n_events, ev_thr, ev
+
+def finalize_sums(sums):
+    """Return the sums of threshold_sums from partial sums."""
+    # events hold changes, so sums at threshold k are accumulated over
+    # the events of the thresholds >= k
+    sums = [ np.cumsum(row[::-1])[::-1] for row in sums ]
+    sums[2] = np.round(sums[2]) # n_retrieved
+
+    return tuple(sums)
+
+def get_thresholds(pred, thresholds=None):
+    """Return the sorted array of thresholds used to compute a curve.
+
+    - None: the 101 thresholds 0.01 * i.
+    - "exact": every distinct nonzero score in pred (an array or
+      sparse.CSRMatrix), so that the curve is evaluated wherever it changes.
+    - an array-like of thresholds, which is sorted.
+    """
+    if thresholds is None:
+        return 0.01 * np.arange(101)
+    if isinstance(thresholds, str):
+        if thresholds != 'exact':
+            raise ValueError("Unknown thresholds {}.".format(thresholds))
+        scores = pred if isinstance(pred, np.ndarray) else pred.data
+        return np.unique(scores[scores != 0.]).astype(np.float64)
+    return np.unique(np.asarray(thresholds, dtype=np.float64))
+
+def precision_recall_curve(true, pred, n_predicted_proteins, out, thresholds=None):
+    """
+    true: (n_proteins, n_terms), a boolean array or sparse.CSRMatrix
+    pred: (n_proteins, n_terms), a float array or sparse.CSRMatrix
+    out: (n_thresholds, 4), filled with thr, f1, precision, recall.
+    thresholds: sorted thresholds; if None, 0.01 * i for i < n_thresholds.
+
+    Each prediction is visited once for all thresholds (see threshold_sums).
+    Precision is set to 0 at thresholds where no protein has predictions.
+    """
+    if thresholds is None:
+        thresholds = 0.01 * np.arange(out.shape[0]) # prediction thresholds
+    pr, re, n_retrieved = threshold_sums(true, pred, thresholds)
+    curve_from_sums(pr, re, n_retrieved, n_predicted_proteins, thresholds, out)
+
+def curve_from_sums(pr, re, n_retrieved, n_predicted_proteins, thresholds, out):
+    """Fill out (n_thresholds, 4) with thr, f1, precision, recall from the sums
+returned by threshold_sums. Only recall depends on n_predicted_proteins, so
+the same sums serve both "full" and "partial" modes."""
+    pr = np.divide(pr, n_retrieved, out=np.zeros_like(pr), where=n_retrieved > 0)
+    re = np.minimum(re / n_predicted_proteins, 1.)
+    f1 = 2. * ((pr * re) / (pr + re + EPSILON)) # f1-measure
+    out[:, 0] = thresholds
+    out[:, 1] = f1
+    out[:, 2] = pr
+    out[:, 3] = re
+
+def weighted_curve_from_sums(wpr, wrc, tp_ic, retrieved_ic, n_retrieved,
+                             relevant_ic, n_predicted_proteins, out):
+    """
+    Fill out (n_thresholds, 6) with weighted f1, weighted precision, weighted
+    recall, remaining uncertainty, misinformation and semantic distance
+    sqrt(ru^2 + mi^2) from the weighted sums returned by threshold_sums.
+    Smin is the minimum of the last column.
+
+    relevant_ic is the information content of the true terms of the proteins
+    used to average recall (n_predicted_proteins): proteins without
+    predictions only add uncertainty.
+    """
+    wpr = np.divide(wpr, n_retrieved, out=np.zeros_like(wpr), where=n_retrieved > 0)
+    wrc = np.minimum(wrc / n_predicted_proteins, 1.)
+    ru = (relevant_ic - tp_ic) / n_predicted_proteins # remaining uncertainty
+    mi = (retrieved_ic - tp_ic) / n_predicted_proteins # misinformation
+    out[:, 0] = 2. * ((wpr * wrc) / (wpr + wrc + EPSILON))
+    out[:, 1] = wpr
+    out[:, 2] = wrc
+    out[:, 3] = ru
+    out[:, 4] = mi
+    out[:, 5] = np.sqrt(ru ** 2 + mi ** 2)
+
+@nb.njit(cache=True)
+def _term_ranking(scores, labels, n_zeros, n_zero_labels, out):
+    """Ranking metrics of a single term across proteins.
+
+    scores/labels hold the nonzero predictions of the term and whether their
+    proteins are annotated with it. The remaining n_zeros proteins are
+    predicted as 0, and n_zero_labels of them are annotated.
+
+    Scores are sorted once and visited by groups of tied scores (the zero
+    predictions being the last group): each group adds a trapezoid to the ROC
+    curve and a step to the precision-recall curve, whose area is the average
+    precision. out is filled with the number of positives, ROC-AUC and AUPR
+    (nan when undefined).
+    """
+    m = scores.shape[0]
+    n_positives = n_zero_labels
+    for e in range(m):
+        n_positives += labels[e]
+    n_negatives = m + n_zeros - n_positives
+    order = np.argsort(-scores, kind='mergesort')
+
+    tp = 0. # true positives
+    fp = 0. # false positives
+    auc = 0.
+    ap = 0.
+    e = 0
+    while e <= m:
+        if e < m:
+            s = scores[order[e]]
+            d_tp = 0.
+            d_fp = 0.
+            while e < m and scores[order[e]] == s:
+                d_tp += labels[order[e]]
+                d_fp += 1. - labels[order[e]]
+                e += 1
+        else: # zero predictions
+            d_tp = n_zero_labels
+            d_fp = n_zeros - n_zero_labels
+            e += 1
+        if d_tp + d_fp == 0.:
+            continue
+        auc += d_fp * (tp + 0.5 * d_tp)
+        tp += d_tp
+        fp += d_fp
+        ap += d_tp * tp / (tp + fp)
+
+    out[0] = n_positives
+    out[1] = auc / (n_positives * n_negatives) if n_positives > 0 and n_negatives > 0 else np.nan
+    out[2] = ap / n_positives if n_positives > 0 else np.nan
+
+@nb.njit(parallel=True, cache=True)
+def _terms_dense(true, pred, n_unpredicted, unpredicted_labels, out):
+    for j in nb.prange(true.shape[1]): # loop over terms
+        m = 0
+        for i in range(true.shape[0]):
+            if pred[i,j] != 0.:
+                m += 1
+        scores = np.empty(m)
+        labels = np.empty(m)
+        relevant = 0.
+        n = 0
+        for i in range(true.shape[0]): # loop over proteins
+            relevant += true[i,j]
+            if pred[i,j] != 0.:
+                scores[n] = pred[i,j]
+                labels[n] = true[i,j]
+                n += 1
+        matched = 0.
+        for e in range(m):
+            matched += labels[e]
+        _term_ranking(scores, labels, true.shape[0] - m + n_unpredicted,
+                      relevant - matched + unpredicted_labels[j], out[j])
+
+@nb.njit(parallel=True, cache=True)
+def _terms_csc(t_indptr, t_indices, p_indptr, p_indices, p_data, n_proteins,
+               n_unpredicted, unpredicted_labels, out):
+    # same as _sweep_csr, over the columns of transposed matrices
+    for j in nb.prange(t_indptr.shape[0] - 1): # loop over terms
+        m = p_indptr[j + 1] - p_indptr[j]
+        labels = np.zeros(m)
+        matched = 0.
+        k = t_indptr[j]
+        for e in range(p_indptr[j], p_indptr[j + 1]):
+            while k < t_indptr[j + 1] and t_indices[k] < p_indices[e]:
+                k += 1
+            if k < t_indptr[j + 1] and t_indices[k] == p_indices[e]:
+                labels[e - p_indptr[j]] = 1.
+                matched += 1.
+        relevant = t_indptr[j + 1] - t_indptr[j]
+        _term_ranking(p_data[p_indptr[j]:p_indptr[j + 1]], labels,
+                      n_proteins - m + n_unpredicted,
+                      relevant - matched + unpredicted_labels[j], out[j])
+
+def term_metrics(true, pred, n_unpredicted=0, unpredicted_labels=None):
+    """Term-centric metrics: rank the proteins by their score for each term
+(a column of pred) and compare them with its annotations (the same column of
+true). Terms are evaluated in parallel, each one sorted once.
+
+    true and pred are as in threshold_sums. n_unpredicted proteins without any
+    prediction can be added (e.g. the rest of the benchmark), as if they were
+    rows of zeros in pred: unpredicted_labels then holds the number of them
+    annotated with each term.
+
+    Return an array (n_terms, 3) with the number of proteins annotated with the
+    term, its ROC-AUC and its AUPR (average precision). ROC-AUC is nan for
+    terms without negatives, and both are nan for terms without positives.
+    """
+    n_terms = true.shape[1]
+    if unpredicted_labels is None:
+        unpredicted_labels = np.zeros(n_terms)
+    unpredicted_labels = np.asarray(unpredicted_labels, dtype=np.float64)
+    out = np.empty((n_terms, 3))
+    if isinstance(pred, np.ndarray):
+        with parallel.kernel(n_terms, pred.size):
+            _terms_dense(true, pred, n_unpredicted, unpredicted_labels, out)
+    else:
+        true, pred = true.transpose(), pred.transpose()
+        with parallel.kernel(n_terms, pred.indptr[-1] + n_terms):
+            _terms_csc(true.indptr, true.indices, pred.indptr, pred.indices,
+                       pred.data, true.shape[1], n_unpredicted, unpredicted_labels,
+                       out)
+
+    return out
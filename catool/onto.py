@@ -5,7 +5,15 @@ import sys
 # from goatools.godag.go_tasks import get_go2parents
 
 from collections import deque, Counter
+import gzip
+import hashlib
 import math
+import os
+
+import numpy as np
+
+from . import cache
+from . import instrument
 
 # root terms
 BIOLOGICAL_PROCESS = 'GO:0008150'
@@ -24,6 +32,10 @@ NAMESPACES = {
     'mf': 'molecular_function',
     'bp': 'biological_process'
 }
+# namespaces in the order used to encode them as integers
+NAMESPACE_CODES = ['biological_process', 'cellular_component', 'molecular_function']
+# bump when the snapshot format changes
+SNAPSHOT_VERSION = 1
 namespace2go = {
     'cellular_component': CELLULAR_COMPONENT,
     'molecular_function': MOLECULAR_FUNCTION,
@@ -47,12 +59,91 @@ class Ontology(object):
         self.term2index = {}
         self.index2term = {}
         self.with_rels = with_rels
-        self.ont = self.load_data(filename, with_rels)
+        self._snapshot = None
+        self._key = None
+        self._tables = None
+        self._ont = self.load_data(filename, with_rels)
+
+    @property
+    def ont(self):
+        # ontologies loaded from snapshots only build their dicts when used
+        if self._ont is None:
+            self._ont = self._snapshot_to_dict()
+        return self._ont
+
+    @property
+    def key(self):
+        """A string identifying the obo file and the options used to parse it,
+used to invalidate caches derived from the ontology."""
+        if self._key is None:
+            self._key = _ontology_key(_file_hash(self.fname), self.with_rels,
+                                      self.remove_obs, self.include_alt_ids)
+        return self._key
+
+    @property
+    def ns_table(self):
+        """An array indexed by GO accession (see go_to_int) with the namespace
+code of each term (see NAMESPACE_CODES), or -1 if it is not in the ontology."""
+        if self._tables is None:
+            self._tables = self._make_tables()
+        return self._tables[0]
+
+    @property
+    def index_table(self):
+        """An array indexed by GO accession (see go_to_int) with the index of
+each term in its namespace (see term2index), or -1 if it is not in the
+ontology."""
+        if self._tables is None:
+            self._tables = self._make_tables()
+        return self._tables[1]
+
+    def _make_tables(self):
+        if self._snapshot is not None:
+            accessions = np.asarray(self._snapshot['keys'])
+            codes = np.asarray(self._snapshot['namespace'])[self._snapshot['key_obj']]
+        else:
+            accessions = []
+            codes = []
+            for code, namespace in enumerate(NAMESPACE_CODES):
+                accessions.append(go_to_int(list(self.term2index[namespace]), strict=False))
+                codes.append(np.full(accessions[-1].shape[0], code, dtype=np.int8))
+            accessions = np.concatenate(accessions)
+            codes = np.concatenate(codes)
+
+        size = int(accessions.max()) + 1 if accessions.shape[0] > 0 else 0
+        ns_table = np.full(size, -1, dtype=np.int8)
+        index_table = np.full(size, -1, dtype=np.int32)
+        for code in range(len(NAMESPACE_CODES)):
+            # terms are indexed in order within their namespace
+            a = accessions[codes == code]
+            index_table[a[a >= 0]] = np.flatnonzero(a >= 0)
+            ns_table[a[a >= 0]] = code
+        return ns_table, index_table
+
+    def lookup_terms(self, terms):
+        """
+        Return two arrays with the namespace code and the index in its
+        namespace of each term, or -1 for terms that are not in the ontology.
+        Terms are GO ids, either as strings or integers (see go_to_int), and
+        they are looked up at once in ns_table and index_table.
+        """
+        terms = np.asarray(terms)
+        if terms.dtype.kind not in 'iu':
+            terms = go_to_int(terms, strict=False)
+        known = (terms >= 0) & (terms < self.ns_table.shape[0])
+        terms = np.where(known, terms, 0)
+
+        return np.where(known, self.ns_table[terms], -1), \
+            np.where(known, self.index_table[terms], -1)
 
     def load_data(self, filename, with_rels):
         ont = dict()
         obj = None
-        with open(filename, 'r') as f:
+        if filename.endswith('.gz'):
+            f = gzip.open(filename, 'rt', encoding='utf-8')
+        else:
+            f = open(filename, 'r')
+        with f:
             for line in f:
                 line = line.strip()
                 if not line:
@@ -130,20 +221,21 @@ class Ontology(object):
                 #self.leaves[root_id].add(term_id)
                 self.leaves.append(term_id)
         # generate tables of indices
-        self.make_indices(ont.items())
+        self.make_indices((term_id, val['namespace']) for term_id, val in ont.items())
 
         return ont
 
     def make_indices(self, items):
+        """items: pairs (term_id, namespace)"""
         bp = []
         cc = []
         mf = []
-        for term_id, val in items:
-            if val['namespace'] == 'biological_process':
+        for term_id, namespace in items:
+            if namespace == 'biological_process':
                 bp.append(term_id)
-            elif val['namespace'] == 'cellular_component':
+            elif namespace == 'cellular_component':
                 cc.append(term_id)
-            elif val['namespace'] == 'molecular_function':
+            elif namespace == 'molecular_function':
                 mf.append(term_id)
         self.term2index['biological_process'] = dict(
             [ (term, i) for i, term in enumerate(bp) ]
@@ -164,19 +256,186 @@ class Ontology(object):
             [ (i, term) for i, term in enumerate(mf) ]
         )
 
+    def save_snapshot(self, dirname, header):
+        """
+        Save the parsed ontology as numpy arrays in dirname, so that it can be
+        loaded with Ontology.from_snapshot. GO ids are stored as integers and
+        lists of ids (e.g. parents) as (indptr, values) pairs of arrays.
+
+        Raise ValueError if a term id is not a GO id.
+        """
+        keys = list(self.ont.keys())
+        # alternative ids share the object of their main id
+        objs = []
+        obj_index = {}
+        key_obj = []
+        for term_id in keys:
+            obj = self.ont[term_id]
+            if id(obj) not in obj_index:
+                obj_index[id(obj)] = len(objs)
+                objs.append(obj)
+            key_obj.append(obj_index[id(obj)])
+
+        arrays = {
+            'keys': go_to_int(keys),
+            'key_obj': np.array(key_obj, dtype=np.int32),
+            'obj_id': go_to_int([ obj['id'] for obj in objs ]),
+            'namespace': np.array([ NAMESPACE_CODES.index(obj['namespace'])
+                                    for obj in objs ], dtype=np.int8),
+            'is_obsolete': np.array([ obj['is_obsolete'] for obj in objs ], dtype=np.bool_),
+        }
+        for field in ('is_a', 'part_of', 'alt_ids'):
+            values = [ sorted(obj[field]) if field == 'alt_ids' else obj[field]
+                       for obj in objs ]
+            arrays[field + '_indptr'] = np.concatenate(
+                [[0], np.cumsum([ len(v) for v in values ])]).astype(np.int64)
+            arrays[field] = go_to_int([ t for v in values for t in v ])
+        names = [ obj.get('name', '').encode('utf-8') for obj in objs ]
+        arrays['name_indptr'] = np.concatenate(
+            [[0], np.cumsum([ len(n) for n in names ])]).astype(np.int64)
+        arrays['name'] = np.frombuffer(b''.join(names), dtype=np.uint8)
+
+        header = dict(header, filename=self.fname, with_rels=self.with_rels,
+                      remove_obs=self.remove_obs,
+                      include_alt_ids=self.include_alt_ids)
+        cache.save_arrays(dirname, arrays, header)
+
+    @classmethod
+    def from_snapshot(cls, dirname):
+        """Load an ontology saved with save_snapshot, or return None if it
+vanished. Arrays are memory-mapped and the dicts of Ontology.ont are only
+built when accessed."""
+        header = cache.load_header(dirname)
+        arrays = cache.load_arrays(dirname)
+        if header is None or arrays is None:
+            return None
+        go = cls.__new__(cls)
+        go.fname = header['filename']
+        go.remove_obs = header['remove_obs']
+        go.include_alt_ids = header['include_alt_ids']
+        go.with_rels = header['with_rels']
+        go._key = _ontology_key(header['sha1'], go.with_rels, go.remove_obs,
+                                go.include_alt_ids)
+        go.term2index = {}
+        go.index2term = {}
+        go._ont = None
+        go._tables = None
+        go._snapshot = arrays
+
+        keys = int_to_go(arrays['keys'])
+        key_obj = np.asarray(arrays['key_obj'])
+        key_namespace = np.asarray(arrays['namespace'])[key_obj]
+        n_keys = np.bincount(key_namespace, minlength=len(NAMESPACE_CODES))
+        go.counts = dict(zip(NAMESPACE_CODES, n_keys.tolist()))
+        go.make_indices(zip(keys, [ NAMESPACE_CODES[i] for i in key_namespace ]))
+        # objects referenced as is_a parents are the ones with children
+        has_children = np.zeros(len(arrays['obj_id']), dtype=np.bool_)
+        parents = np.isin(arrays['keys'], arrays['is_a'])
+        has_children[key_obj[parents]] = True
+        go.leaves = [ t for t, obj in zip(keys, key_obj.tolist())
+                      if not has_children[obj] ]
+
+        return go
+
+    def _snapshot_to_dict(self):
+        arrays = self._snapshot
+        keys = int_to_go(arrays['keys'])
+        ids = int_to_go(arrays['obj_id'])
+        fields = {}
+        for field in ('is_a', 'part_of', 'alt_ids'):
+            values = int_to_go(arrays[field])
+            indptr = arrays[field + '_indptr'].tolist()
+            fields[field] = [ values[indptr[i]:indptr[i + 1]]
+                              for i in range(len(ids)) ]
+        names = arrays['name'].tobytes()
+        name_indptr = arrays['name_indptr'].tolist()
+
+        objs = []
+        for i, term_id in enumerate(ids):
+            objs.append({
+                'id': term_id,
+                'name': names[name_indptr[i]:name_indptr[i + 1]].decode('utf-8'),
+                'namespace': NAMESPACE_CODES[arrays['namespace'][i]],
+                'is_a': fields['is_a'][i],
+                'part_of': fields['part_of'][i],
+                'regulates': list(),
+                'alt_ids': set(fields['alt_ids'][i]),
+                'is_obsolete': bool(arrays['is_obsolete'][i]),
+                'children': set(),
+            })
+        ont = dict(zip(keys, [ objs[i] for i in arrays['key_obj'].tolist() ]))
+        for term_id, val in ont.items():
+            for p_id in val['is_a']:
+                if p_id in ont:
+                    ont[p_id]['children'].add(term_id)
+
+        return ont
+
+    def get_parents(self, term_id):
+        if self.with_rels:
+            return self.ont[term_id]['is_a'] + self.ont[term_id]['part_of']
+        return self.ont[term_id]['is_a']
+
     def get_ancestors(self, term_id):
+        """Return the set of terms reachable from term_id, including itself."""
         if term_id not in self.ont:
             return set()
-        if self.with_rels:
-            parents = self.ont[term_id]['is_a'] + self.ont[term_id]['part_of']
-        else:
-            parents = self.ont[term_id]['is_a']
-        if len(parents) < 1:
-            return [[term_id]]
-        branches = []
-        for parent_id in parents:
-            branches += [ b + [term_id] for b in self.get_ancestors(parent_id) ]
-        return branches
+        ancestors = set([term_id])
+        queue = deque([term_id])
+        while queue:
+            for parent_id in self.get_parents(queue.popleft()):
+                if parent_id in self.ont and parent_id not in ancestors:
+                    ancestors.add(parent_id)
+                    queue.append(parent_id)
+        return ancestors
+
+    def topological_order(self, namespace):
+        """
+        Return the indices of the namespace terms sorted such that every term
+        comes after its parents. Only relationships between terms of the
+        namespace are considered.
+        """
+        term2index = self.term2index[namespace]
+        n_children = [0] * self.counts[namespace] # children yet to be visited
+        for term_id in term2index:
+            for parent_id in set(self.get_parents(term_id)):
+                if parent_id in term2index:
+                    n_children[term2index[parent_id]] += 1
+        # visit terms from leaves to roots and then reverse the order
+        queue = deque([ i for i, n in enumerate(n_children) if n == 0 ])
+        order = []
+        while queue:
+            i = queue.popleft()
+            order.append(i)
+            for parent_id in set(self.get_parents(self.index2term[namespace][i])):
+                if parent_id in term2index:
+                    j = term2index[parent_id]
+                    n_children[j] -= 1
+                    if n_children[j] == 0:
+                        queue.append(j)
+        order.reverse()
+        return order
+
+    def get_parents_index(self, namespace):
+        """
+        Return the direct parents of the namespace terms as two arrays
+        (indptr, indices): the parents of the term with index i are
+        indices[indptr[i]:indptr[i+1]] (sorted). Only parents in the namespace
+        are considered.
+        """
+        term2index = self.term2index[namespace]
+        parents = []
+        for i in range(self.counts[namespace]):
+            parents.append(sorted(set([ term2index[p]
+                for p in self.get_parents(self.index2term[namespace][i])
+                if p in term2index ])))
+
+        indptr = np.zeros(len(parents) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([ len(p) for p in parents ])
+        indices = np.empty(indptr[-1], dtype=np.int32)
+        for i, p in enumerate(parents):
+            indices[indptr[i]:indptr[i + 1]] = p
+        return indptr, indices
 
     def get_namespace_terms(self, namespace):
         terms = set()
@@ -187,6 +446,121 @@ class Ontology(object):
 
     def get_blanket(self, term_id):
         return set(self.ont[term_id]['is_a']) | self.ont[term_id]['children']
+
+def go_to_int(terms, strict=True):
+    """
+    Convert GO ids (e.g. GO:0008150) into integers (e.g. 8150). terms is a
+    sequence or an array of strings (str or bytes). Other ids raise a
+    ValueError, or are converted into -1 if strict is False.
+
+    Ids are converted at once, as a matrix of characters.
+    """
+    terms = np.asarray(terms)
+    if terms.dtype.kind == 'O':
+        terms = terms.astype(np.str_)
+    terms = np.ascontiguousarray(terms.reshape(-1))
+    if terms.shape[0] == 0:
+        return np.empty(0, dtype=np.int32)
+    if terms.dtype.kind not in 'US':
+        raise ValueError("GO ids must be strings.")
+
+    # one row of character codes per id, padded with zeros
+    char_size = 4 if terms.dtype.kind == 'U' else 1
+    width = terms.dtype.itemsize // char_size
+    chars = terms.view('u{}'.format(char_size)).reshape(-1, width)
+    if width < 10:
+        valid = np.zeros(terms.shape[0], dtype=np.bool_)
+        digits = np.zeros((terms.shape[0], 7), dtype=np.int64)
+    else:
+        digits = chars[:, 3:10].astype(np.int64) - ord('0')
+        valid = (chars[:, 0] == ord('G')) & (chars[:, 1] == ord('O')) \
+            & (chars[:, 2] == ord(':')) & np.all((digits >= 0) & (digits <= 9), axis=1)
+        if width > 10:
+            valid &= chars[:, 10] == 0
+    if strict and not np.all(valid):
+        raise ValueError("{} is not a GO id.".format(terms[np.argmin(valid)]))
+
+    ints = digits @ 10 ** np.arange(6, -1, -1, dtype=np.int64)
+    return np.where(valid, ints, -1).astype(np.int32)
+
+def int_to_go(ints):
+    return [ 'GO:%07d' % i for i in ints.tolist() ]
+
+def _ontology_key(sha1, with_rels, remove_obs, include_alt_ids):
+    return '{}-rels{:d}-obs{:d}-alt{:d}'.format(
+        sha1, with_rels, remove_obs, include_alt_ids)
+
+def _file_hash(filename):
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def load_ontology(filename, with_rels=False, remove_obs=True, include_alt_ids=True):
+    """
+    Same as Ontology(...), but the parsed ontology is cached as a binary
+    snapshot next to filename (see Ontology.save_snapshot). The snapshot is
+    keyed by the SHA-1 of filename and the options, and it is rebuilt when
+    they change. Plain and gzipped obo files are supported.
+    """
+    dirname = '{}.snapshot/rels{:d}-obs{:d}-alt{:d}'.format(
+        filename, with_rels, remove_obs, include_alt_ids)
+    stat = os.stat(filename)
+    header = {
+        'version': SNAPSHOT_VERSION,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime_ns,
+    }
+
+    saved = cache.load_header(dirname)
+    go = None
+    if saved is not None and saved['version'] == SNAPSHOT_VERSION:
+        # only hash the file when its size or mtime changed
+        if saved['size'] == header['size'] and saved['mtime'] == header['mtime']:
+            go = Ontology.from_snapshot(dirname)
+        elif saved['sha1'] == _file_hash(filename):
+            saved.update(header)
+            try:
+                cache.save_header(dirname, saved)
+            except OSError:
+                pass
+            go = Ontology.from_snapshot(dirname)
+    if go is not None:
+        return go
+
+    go = Ontology(filename, with_rels=with_rels, remove_obs=remove_obs,
+                  include_alt_ids=include_alt_ids)
+    header['sha1'] = _file_hash(filename)
+    go._key = _ontology_key(header['sha1'], with_rels, remove_obs, include_alt_ids)
+    try:
+        go.save_snapshot(dirname, header)
+    except (OSError, ValueError): # e.g. read-only directory or non GO ids
+        pass
+
+    return go
+
+# obo file used for calculations
+OBO_FILE = '{}/go.obo'.format(os.path.dirname(os.path.realpath(__file__)))
+
+global __GO__
+__GO__ = [None]
+
+def get_go():
+    """
+    The GO is a global variable to avoid multiple reading of the obo file.
+
+    The obo file is read from a binary snapshot when it didn't change (see
+    load_ontology). If the obo file was not decompressed, the gzipped file is
+    read directly.
+    """
+    # create global variable
+    if __GO__[0] is None:
+        obo_file = OBO_FILE if os.path.exists(OBO_FILE) else OBO_FILE + '.gz'
+        with instrument.stage('load_ontology'):
+            __GO__[0] = load_ontology(obo_file, with_rels=True, include_alt_ids=False)
+    return __GO__[0]
+
 #
 if __name__ == '__main__':
     go_file = sys.argv[1]
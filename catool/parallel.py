@@ -0,0 +1,93 @@
+"""Thread budget of the numba kernels.
+
+Each kernel is parallelized over a single axis (proteins, terms or
+permutations) and writes separate outputs for each item, which are then
+reduced in a fixed order: results are the same, bit for bit, whatever the
+number of threads and the scheduling.
+
+Kernels use at most the thread budget of the calling thread, by default all
+the threads of numba (NUMBA_NUM_THREADS, the number of CPUs). It is set:
+
+- for one call, with threads=n (see threaded, e.g. main.run).
+- for the calling thread, with set_threads (see the --threads flag of the
+  command line) or the environment variable CATOOL_THREADS (read when the
+  kernels are imported).
+
+Within the budget, each kernel (see kernel) only uses as many threads as its
+amount of work justifies: small inputs run on a single thread, where starting
+a parallel region would dominate, and larger ones are scheduled in chunks (with
+numba >= 0.57), so that threads finishing early take over the remaining items.
+"""
+import os
+import functools
+import contextlib
+
+import numba as nb
+
+ENV_VAR = 'CATOOL_THREADS'
+# minimum amount of work (e.g. matrix entries) per thread
+MIN_WORK_PER_THREAD = 1 << 15
+# chunks per thread of the dynamic scheduling
+CHUNKS_PER_THREAD = 8
+
+def get_threads():
+    """Return the thread budget of the calling thread."""
+    return nb.get_num_threads()
+
+def set_threads(n=None):
+    """Set the thread budget of the calling thread. n is capped to
+NUMBA_NUM_THREADS, which is also the budget if n is None."""
+    if n is None:
+        n = nb.config.NUMBA_NUM_THREADS
+    n = int(n)
+    if n < 1:
+        raise ValueError("The number of threads must be positive, got {}.".format(n))
+    nb.set_num_threads(min(n, nb.config.NUMBA_NUM_THREADS))
+
+@contextlib.contextmanager
+def threads(n):
+    """Context manager setting the thread budget (see set_threads) of a block."""
+    old = nb.get_num_threads()
+    set_threads(n)
+    try:
+        yield
+    finally:
+        nb.set_num_threads(old)
+
+def threaded(fn):
+    """Add the keyword argument threads to fn: the thread budget of the call
+(None to keep the one of the calling thread)."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        n = kwargs.pop('threads', None)
+        if n is None:
+            return fn(*args, **kwargs)
+        with threads(n):
+            return fn(*args, **kwargs)
+    return wrapper
+
+@contextlib.contextmanager
+def kernel(n_items, work=None):
+    """Context manager around the call of a parallel kernel whose parallel
+loop has n_items iterations, for an amount of work (by default n_items) such
+as the number of matrix entries visited."""
+    if work is None:
+        work = n_items
+    budget = nb.get_num_threads()
+    n = max(1, min(budget, n_items, work // MIN_WORK_PER_THREAD))
+    # chunked scheduling needs numba >= 0.57, otherwise iterations are split
+    # evenly between the threads
+    chunked = hasattr(nb, 'set_parallel_chunksize')
+    if chunked:
+        old_chunksize = nb.set_parallel_chunksize(
+            max(1, n_items // (n * CHUNKS_PER_THREAD)) if n > 1 else 0)
+    nb.set_num_threads(n)
+    try:
+        yield
+    finally:
+        nb.set_num_threads(budget)
+        if chunked:
+            nb.set_parallel_chunksize(old_chunksize)
+
+if os.environ.get(ENV_VAR):
+    set_threads(os.environ[ENV_VAR])
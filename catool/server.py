@@ -0,0 +1,216 @@
+"""Evaluation server keeping the ontology, the benchmarks and the compiled
+kernels warm between evaluations, and its client.
+
+The server (see serve) listens on a local socket and evaluates requests in a
+pool of worker processes (see batch.make_pool), which load the caches and
+compile the kernels once when they start. Requests are queued by the pool and
+up to n_workers of them are evaluated at the same time.
+
+Clients send a function of main and its arguments, e.g.
+
+>>> from catool import server
+>>> results = server.run_file('pred.tsv', 'full', 'molecular_function')
+
+Messages are pickled (see multiprocessing.connection), so both ends
+authenticate each other with a key before any message is read: by default, a
+random key written by the server into KEY_FILE. The socket and the key are in
+RUNTIME_DIR, which is only accessible to its owner.
+"""
+import os
+import stat
+import getpass
+import tempfile
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener
+from multiprocessing.connection import Client
+
+# private directory of the socket and the key of the server
+RUNTIME_DIR = os.path.join(os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(),
+                           'catool-{}'.format(getpass.getuser()))
+KEY_FILE = os.path.join(RUNTIME_DIR, 'catool.key')
+if os.name == 'posix':
+    ADDRESS = os.path.join(RUNTIME_DIR, 'catool.sock')
+else:
+    ADDRESS = ('localhost', 8931)
+
+# functions of main which can be requested, plus run_all_file
+COMMANDS = ('run', 'run_arrays', 'run_file', 'run_all', 'run_all_arrays',
+            'run_all_file', 'run_terms', 'run_terms_arrays', 'f1max_score',
+            'smin_score', 'term_scores')
+
+def _runtime_dir():
+    """Create RUNTIME_DIR if needed, and check that it is a directory only
+accessible to its owner, the current user."""
+    try:
+        os.makedirs(RUNTIME_DIR, 0o700)
+    except FileExistsError:
+        pass
+    if os.name == 'posix':
+        st = os.lstat(RUNTIME_DIR)
+        if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() \
+           or st.st_mode & 0o077:
+            raise RuntimeError("{} must be a directory only accessible to the "
+                               "current user.".format(RUNTIME_DIR))
+    return RUNTIME_DIR
+
+def _read_key(authkey=None):
+    """Return authkey, or by default the key of the server in KEY_FILE."""
+    if authkey is not None:
+        return authkey
+    _runtime_dir()
+    with open(KEY_FILE, 'rb') as f:
+        return f.read()
+
+def _write_key():
+    """Write a new random key into KEY_FILE and return it."""
+    _runtime_dir()
+    authkey = os.urandom(32)
+    fd = os.open(KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(authkey)
+    return authkey
+
+def _init_worker(ftype, n_threads):
+    from . import batch
+    from . import main
+
+    batch._init_worker(ftype, n_threads)
+    main.warm_up(ftype)
+
+def _evaluate(command, args, kwargs):
+    from . import main
+    from . import inou
+
+    if command == 'run_all_file':
+        pred_fin, args = args[0], args[1:]
+        proteins, prot_idx, terms, scores = inou.read_predictions_arrays(pred_fin)
+        return main.run_all_arrays(proteins, terms, scores, *args,
+                                   prot_idx=prot_idx, **kwargs)
+    return getattr(main, command)(*args, **kwargs)
+
+def _handle(conn, pool, stop):
+    try:
+        command, args, kwargs = conn.recv()
+        if command == 'ping':
+            conn.send(('ok', None))
+        elif command == 'shutdown':
+            conn.send(('ok', None))
+            stop()
+        elif command not in COMMANDS:
+            conn.send(('error', "ValueError: unknown command {}.".format(command)))
+        else:
+            try:
+                result = pool.apply_async(_evaluate, (command, args, kwargs)).get()
+            except Exception as e:
+                conn.send(('error', '{}: {}'.format(type(e).__name__, e)))
+            else:
+                conn.send(('ok', result))
+    except (EOFError, OSError): # the client went away
+        pass
+    finally:
+        conn.close()
+
+def serve(ftype=1, n_workers=None, address=ADDRESS, authkey=None):
+    """
+    Run the server until a client requests a shutdown, with n_workers
+    worker processes (by default, one per thread of the budget, see parallel),
+    which share the thread budget. The caches of the benchmark
+    ftype are loaded by the workers when they start (benchmarks of other
+    types are loaded on their first request). Clients must send authkey, by
+    default a new random key written into KEY_FILE.
+    """
+    from . import batch
+    from . import parallel
+
+    _runtime_dir()
+    if isinstance(address, str) and os.path.exists(address):
+        try:
+            listening = ping(address, authkey)
+        except AuthenticationError: # a server with another key
+            listening = True
+        if listening:
+            raise RuntimeError("A server is already listening on {}.".format(address))
+        # only remove a socket left by a server of ours which was killed
+        st = os.lstat(address)
+        if not stat.S_ISSOCK(st.st_mode) or st.st_uid != os.getuid():
+            raise RuntimeError("{} exists and is not a socket of the current "
+                               "user.".format(address))
+        os.unlink(address)
+    if authkey is None:
+        authkey = _write_key()
+
+    batch._load_caches(ftype)
+    if n_workers is None:
+        n_workers = parallel.get_threads()
+    pool = batch.make_pool(n_workers, ftype, _init_worker)
+    # the socket is created only accessible to its owner
+    umask = os.umask(0o177)
+    try:
+        listener = Listener(address, authkey=authkey)
+    finally:
+        os.umask(umask)
+
+    stopped = threading.Event()
+    def stop():
+        stopped.set()
+        # wake up accept
+        try:
+            Client(address, authkey=authkey).close()
+        except OSError:
+            pass
+
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, EOFError, ConnectionError):
+                continue # the client did not authenticate
+            if stopped.is_set():
+                conn.close()
+                break
+            threading.Thread(target=_handle, args=(conn, pool, stop),
+                             daemon=True).start()
+    finally:
+        listener.close()
+        pool.terminate()
+        pool.join()
+
+def request(command, *args, **kwargs):
+    """Evaluate main.<command>(*args, **kwargs) on the server and return the
+result. address and authkey (by default, read from KEY_FILE) are keyword
+arguments of the client."""
+    address = kwargs.pop('address', ADDRESS)
+    authkey = _read_key(kwargs.pop('authkey', None))
+    with Client(address, authkey=authkey) as conn:
+        conn.send((command, args, kwargs))
+        status, result = conn.recv()
+    if status == 'error':
+        raise RuntimeError(result)
+    return result
+
+def ping(address=ADDRESS, authkey=None):
+    """Return True if a server is listening on address."""
+    try:
+        request('ping', address=address, authkey=authkey)
+    except (OSError, EOFError):
+        return False
+    return True
+
+def shutdown(address=ADDRESS, authkey=None):
+    request('shutdown', address=address, authkey=authkey)
+
+def run_file(pred_fin, mode, namespace, ftype=1, **kwargs):
+    """Same as main.run_file, evaluated by the server."""
+    return request('run_file', os.path.abspath(pred_fin), mode, namespace,
+                   ftype, **kwargs)
+
+def run_all_file(pred_fin, ftype=1, **kwargs):
+    """Evaluate a prediction file of all namespaces as main.run_all_arrays,
+on the server."""
+    return request('run_all_file', os.path.abspath(pred_fin), ftype, **kwargs)
+
+def run_arrays(proteins, terms, scores, mode, namespace, ftype=1, **kwargs):
+    """Same as main.run_arrays, evaluated by the server."""
+    return request('run_arrays', proteins, terms, scores, mode, namespace,
+                   ftype, **kwargs)
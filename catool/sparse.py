@@ -0,0 +1,107 @@
+"""Compressed sparse row (CSR) matrices backed by plain numpy arrays.
+
+Only the handful of operations needed by the evaluation pipeline are
+implemented here, so that no extra dependency (e.g. scipy) is required.
+"""
+import numpy as np
+
+
+class CSRMatrix(object):
+    """
+    Row i stores its column indices in indices[indptr[i]:indptr[i+1]] and
+    their values in data[indptr[i]:indptr[i+1]]. Column indices are sorted
+    and unique within each row. Entries that are not stored are zero (or
+    False).
+    """
+    def __init__(self, indptr, indices, data, shape):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.shape = tuple(shape)
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    @classmethod
+    def from_coo(cls, rows, cols, data, shape):
+        """Build a matrix from (row, column, value) triplets. For repeated
+        (row, column) pairs, the last value is kept."""
+        rows = np.asarray(rows, dtype=np.int64)
+        keys = rows * shape[1] + cols
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        last = np.ones(keys.shape[0], dtype=np.bool_)
+        last[:-1] = keys[1:] != keys[:-1]
+        order = order[last]
+        indptr = np.zeros(shape[0] + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(rows[order], minlength=shape[0]))
+
+        return cls(indptr, np.asarray(cols)[order].astype(np.int32),
+                   np.asarray(data)[order], shape)
+
+    @classmethod
+    def from_dense(cls, mat):
+        """Build a matrix with the nonzero entries of a 2d array."""
+        rows, indices = np.nonzero(mat)
+        indptr = np.zeros(mat.shape[0] + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(rows, minlength=mat.shape[0]))
+
+        return cls(indptr, indices.astype(np.int32), mat[rows, indices], mat.shape)
+
+    def row_block(self, start, stop):
+        """Return the rows start:stop as a new matrix (sharing data)."""
+        a, b = self.indptr[start], self.indptr[stop]
+        return CSRMatrix(self.indptr[start:stop + 1] - a, self.indices[a:b],
+                         self.data[a:b], (stop - start, self.shape[1]))
+
+    def take_rows(self, rows):
+        """Return a new matrix with the given rows."""
+        rows = np.asarray(rows, dtype=np.int64)
+        counts = np.diff(self.indptr)[rows]
+        indptr = np.zeros(rows.shape[0] + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(counts)
+        # position of every selected entry in the original arrays
+        entries = np.repeat(self.indptr[rows] - indptr[:-1], counts) \
+            + np.arange(indptr[-1])
+        return CSRMatrix(indptr, self.indices[entries], self.data[entries],
+                         (rows.shape[0], self.shape[1]))
+
+    def transpose(self):
+        """Return the transposed matrix, i.e. the columns of this one as rows
+(with sorted row indices)."""
+        return CSRMatrix.from_coo(self.indices, row_ids(self.indptr), self.data,
+                                  (self.shape[1], self.shape[0]))
+
+    def toarray(self):
+        mat = np.zeros(self.shape, dtype=self.dtype)
+        mat[row_ids(self.indptr), self.indices] = self.data
+        return mat
+
+    def drop_column(self, j):
+        """Return a new matrix whose column j is empty."""
+        keep = self.indices != j
+        rows = row_ids(self.indptr)
+        indptr = np.zeros_like(self.indptr)
+        indptr[1:] = np.cumsum(np.bincount(rows[keep], minlength=self.shape[0]))
+        return CSRMatrix(indptr, self.indices[keep], self.data[keep], self.shape)
+
+
+def row_ids(indptr):
+    """Return the row index of every stored entry."""
+    return np.repeat(np.arange(indptr.shape[0] - 1), np.diff(indptr))
+
+def vstack(blocks, n_cols):
+    """Stack matrices with n_cols columns on top of each other."""
+    indptr = [np.zeros(1, dtype=np.int64)]
+    for block in blocks:
+        indptr.append(block.indptr[1:] + indptr[-1][-1])
+    n_rows = sum([ block.shape[0] for block in blocks ])
+    if len(blocks) == 0:
+        return CSRMatrix(indptr[0], np.empty(0, dtype=np.int32),
+                         np.empty(0), (0, n_cols))
+
+    return CSRMatrix(np.concatenate(indptr),
+                     np.concatenate([ block.indices for block in blocks ]),
+                     np.concatenate([ block.data for block in blocks ]),
+                     (n_rows, n_cols))
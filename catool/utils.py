@@ -7,71 +7,197 @@ import numpy as np
 import numba as nb
 
 from . import onto
-from . import main
-
-@nb.njit(parallel=True)
-def propagate_terms(m, branches):
+from . import cache
+from . import sparse
+from . import parallel
+
+@nb.njit(parallel=True, cache=True)
+def propagate_terms(m, order, par_indptr, par_indices):
+    """Propagate the values of m (n_proteins, n_terms) to the ancestors of each
+term, keeping the maximum value.
+
+Terms are visited once in reverse topological order (order lists parents
+before children), so each term has received the values of all its descendants
+before pushing its own value to its direct parents
+par_indices[par_indptr[j]:par_indptr[j+1]]."""
     for i in nb.prange(m.shape[0]): # loop over proteins
-        for j in np.where(m[i,:])[0]: # loop over terms
-            for k in np.where(branches[j,:])[0]:
+        for n in range(order.shape[0] - 1, -1, -1): # loop over terms
+            j = order[n]
+            if not m[i, j]:
+                continue
+            for k in par_indices[par_indptr[j]:par_indptr[j + 1]]:
                 if m[i, j] > m[i, k]:
                     m[i, k] = m[i, j]
 
-def create_ancestors_cache(go, namespace, fout):
-    n_terms = go.counts[namespace]
-    ancestors = np.zeros((n_terms, n_terms), dtype=np.bool)
-
-    for i in range(n_terms):
-        term = go.index2term[namespace][i]
-        propagations = go.get_ancestors(term)
-        # flat propagations
-        propagations = set([t for b in propagations for t in b])
-        # don't include root terms and leaf term
-        propagations = propagations.difference({
-            term,
-            onto.BIOLOGICAL_PROCESS,
-            onto.CELLULAR_COMPONENT,
-            onto.MOLECULAR_FUNCTION})
-        propagations = [go.term2index[namespace][p] for p in propagations]
-        ancestors[i, propagations] = True
-
-    np.savez_compressed(fout, a=ancestors)
+def propagate_terms_csr(m, order, par_indptr, par_indices, block_size=128):
+    """Same as propagate_terms, but for a sparse.CSRMatrix. As propagation
+adds new entries, a new matrix is returned.
+
+Proteins are propagated in blocks of block_size rows, which are expanded into
+a dense array, so memory is bounded by block_size * n_terms."""
+    blocks = []
+    for start in range(0, m.shape[0], block_size):
+        stop = min(start + block_size, m.shape[0])
+        block = m.row_block(start, stop).toarray()
+        with parallel.kernel(stop - start, block.size):
+            propagate_terms(block, order, par_indptr, par_indices)
+        blocks.append(sparse.CSRMatrix.from_dense(block))
+
+    return sparse.vstack(blocks, m.shape[1])
+
+@nb.njit(cache=True)
+def _count_parent_annotations(indptr, indices, ch_indptr, ch_indices,
+                              par_indptr, par_indices, counts):
+    """Count, for every term, the proteins annotated with all its parents
+(rows of the propagated matrix (indptr, indices)). Only terms that are
+children of an annotated term are visited."""
+    annotated = np.zeros(counts.shape[0], dtype=np.bool_)
+    for i in range(indptr.shape[0] - 1): # loop over proteins
+        for k in range(indptr[i], indptr[i + 1]):
+            annotated[indices[k]] = True
+        for k in range(indptr[i], indptr[i + 1]):
+            j = indices[k]
+            for c in ch_indices[ch_indptr[j]:ch_indptr[j + 1]]:
+                # count each child once, from its first parent
+                if par_indices[par_indptr[c]] != j:
+                    continue
+                all_parents = True
+                for p in par_indices[par_indptr[c]:par_indptr[c + 1]]:
+                    if not annotated[p]:
+                        all_parents = False
+                        break
+                if all_parents:
+                    counts[c] += 1
+        for k in range(indptr[i], indptr[i + 1]):
+            annotated[indices[k]] = False
+
+def information_content(mat, par_indptr, par_indices):
+    """Return the information content of each term, -log2 P(term | parents),
+estimated from a propagated boolean sparse.CSRMatrix (n_proteins, n_terms) as
+the fraction of the proteins annotated with all the parents of the term that
+are also annotated with the term. Terms without parents (in par_indices)
+are conditioned on all proteins, and terms without annotations have no
+information content."""
+    n_terms = mat.shape[1]
+    n_annotated = np.bincount(mat.indices, minlength=n_terms).astype(np.float64)
+
+    # children of each term, from the parents of each term
+    children = par_indices.argsort(kind='stable')
+    ch_indptr = np.zeros(n_terms + 1, dtype=np.int64)
+    ch_indptr[1:] = np.cumsum(np.bincount(par_indices, minlength=n_terms))
+    ch_indices = sparse.row_ids(par_indptr)[children].astype(np.int32)
+
+    n_parents = np.zeros(n_terms, dtype=np.int64)
+    _count_parent_annotations(mat.indptr, mat.indices, ch_indptr, ch_indices,
+                              par_indptr, par_indices, n_parents)
+    n_parents[np.diff(par_indptr) == 0] = mat.shape[0]
+
+    ic = np.zeros(n_terms)
+    known = n_annotated > 0
+    ic[known] = -np.log2(n_annotated[known] / n_parents[known])
+    return ic
+
+def create_parents_cache(go, namespace, fout):
+    """Save the arrays needed by propagate_terms (the topological order and
+the direct parents of each term of the namespace), without root terms."""
+    roots = [ go.term2index[namespace][t] for t in (
+        onto.BIOLOGICAL_PROCESS,
+        onto.CELLULAR_COMPONENT,
+        onto.MOLECULAR_FUNCTION) if t in go.term2index[namespace] ]
+
+    def drop_roots(indptr, indices):
+        keep = ~np.isin(indices, roots)
+        counts = np.bincount(sparse.row_ids(indptr)[keep], minlength=indptr.shape[0] - 1)
+        indptr = np.zeros_like(indptr)
+        indptr[1:] = np.cumsum(counts)
+        return indptr, indices[keep]
+
+    par_indptr, par_indices = drop_roots(*go.get_parents_index(namespace))
+    order = np.array(go.topological_order(namespace), dtype=np.int32)
+
+    cache.save_arrays(fout, {
+        'order': order,
+        'par_indptr': par_indptr,
+        'par_indices': par_indices,
+    }, {'key': go.key})
+
+# directory of the caches of the parents of the terms (see load_parents)
+CACHE_DIR = os.path.dirname(os.path.realpath(__file__))
+
+def get_cache_file(namespace):
+    return CACHE_DIR + '/' + namespace + '.cache'
 
 def create_cache_files(log=False):
-    go = main.get_go()
+    go = onto.get_go()
 
     for namespace in onto.NAMESPACES.values():
-        fout = os.path.dirname(os.path.realpath(__file__)) + '/' + namespace + '.npz'
-
-        if not os.path.exists(fout):
-            create_ancestors_cache(go, namespace, fout)
-            if log:
-                print(namespace + '.npz was created.')
-
+        fout = get_cache_file(namespace)
+
+        # skip caches created from the same ontology
+        header = cache.load_header(fout)
+        if header is not None and header['key'] == go.key:
+            continue
+        create_parents_cache(go, namespace, fout)
+        if log:
+            print(namespace + '.cache was created.')
+
+def load_parents(namespace):
+    """Return the arrays (order, par_indptr, par_indices) used by
+propagate_terms, creating cache files if needed. Arrays are memory-mapped."""
+    create_cache_files(log=False)
+    fout = get_cache_file(namespace)
+    arrays = cache.load_arrays(fout)
+    if arrays is None: # removed by another process
+        create_parents_cache(onto.get_go(), namespace, fout)
+        arrays = cache.load_arrays(fout)
+    return arrays['order'], arrays['par_indptr'], arrays['par_indices']
+
+
+def _prediction_entries(pred, benchmark_prots, namespace):
+    """Return the number of benchmark proteins in pred and the (row, column,
+probability) of their predictions in the namespace."""
+    go = onto.get_go()
+
+    rows = []
+    terms = []
+    probs = []
+    n_pred_proteins_in_benchmark = 0.
+    for prot_id, protein in enumerate(benchmark_prots):
+        if protein in pred:
+            n_pred_proteins_in_benchmark += 1.
+            # loop over pairs (predicted terms, probability)
+            for term, prob in pred[protein]:
+                rows.append(prot_id)
+                terms.append(term)
+                probs.append(prob)
+    term_ns, term_index = go.lookup_terms(terms)
+    n_missing = np.count_nonzero(term_ns < 0)
+    if n_missing > 0: # discard terms not present in go
+        warnings.warn("{} predicted terms are missing in the go.".format(n_missing))
+    keep = term_ns == onto.NAMESPACE_CODES.index(namespace)
+
+    return n_pred_proteins_in_benchmark, np.array(rows, dtype=np.int64)[keep], \
+        term_index[keep], np.array(probs, dtype=np.float64)[keep]
 
 def predictions_into_a_matrix(pred, benchmark_prots, namespace):
     """Create matrix (n_prots, n_term) whose values are the predicted
 probabilities."""
-    go = main.get_go()
+    go = onto.get_go()
     # pred = { k:pred[k] for k in pred.keys() if k in common_prots  }
     # n_predicted_proteins_in_benchmark = len(pred.keys())
 
+    n_pred_proteins_in_benchmark, rows, cols, probs = _prediction_entries(
+        pred, benchmark_prots, namespace)
     mat = np.zeros((len(benchmark_prots), go.counts[namespace]), dtype=np.float64)
     # fill matrix
-    n_pred_proteins_in_benchmark = 0.
-    for prot_id, protein in enumerate(benchmark_prots):
-        if protein in pred:
-            n_pred_proteins_in_benchmark += 1.
-            # loop over pairs (predicted terms, probability)
-            for term, prob in pred[protein]:
-                if term not in go.ont.keys(): # discard terms not present in go
-                    warnings.warn("Predicted term {} is missing in the go.".format(term))
-                    continue
-                term = go.term2index[namespace][term]
-                mat[prot_id, term] = prob
+    mat[rows, cols] = probs
 
     return n_pred_proteins_in_benchmark, mat
 
+def fmax_row(results):
+    """Return the row (thr, f1, precision, recall) of results with maximum
+f1."""
+    return tuple(results[np.argmax(results[:,1])].tolist())
 
 def results2string(results, mode, namespace):
     for i in range(results.shape[0]):
@@ -81,8 +207,14 @@ def results2string(results, mode, namespace):
             results[i,0],
             results[i,1],
             results[i,2],
-            results[i,3]))
+            results[i,3]) + ''.join([ "\t{:.4f}".format(v) # weighted metrics
+                                      for v in results[i,4:].tolist() ]))
+
+def terms2string(terms, results, mode, namespace):
+    for term, row in zip(terms.tolist(), results.tolist()):
+        print("{}\t{}\t{}\t{:d}\t{:.4f}\t{:.4f}".format(
+            mode, namespace, term, int(row[0]), row[1], row[2]))
 
 
 if __name__ == '__main__':
-    create_caches(log=True)
+    create_cache_files(log=True)
@@ -0,0 +1,113 @@
+"""Tests run on a small synthetic ontology, benchmark and predictions (see
+benchmarks/synthetic.py), with every cache written to a temporary directory."""
+import os
+import sys
+import gzip
+import subprocess
+from collections import defaultdict
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'benchmarks'))
+
+import synthetic
+
+from catool import main
+from catool import onto
+from catool import utils
+from catool.conversion import mapper
+
+@pytest.fixture(scope='session')
+def data(tmp_path_factory):
+    """Point catool at synthetic inputs, and return a dict with their paths
+and the (UniProt accession, CAFA id) of the benchmark proteins."""
+    tmp_dir = str(tmp_path_factory.mktemp('catool'))
+    obo_file = os.path.join(tmp_dir, 'go.obo')
+    true_fin = os.path.join(tmp_dir, 'true_y.tsv.gz')
+    pred_fin = os.path.join(tmp_dir, 'pred.tsv.gz')
+    terms = synthetic.make_obo(obo_file, n_terms=400, depth=6, seed=1)
+    proteins = synthetic.make_benchmark(true_fin, terms, n_proteins=300,
+                                        n_annotations=3, seed=1)
+    synthetic.make_predictions(pred_fin, terms, proteins, n_predictions=10,
+                               coverage=0.7, seed=1)
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(onto, 'OBO_FILE', obo_file)
+        mp.setattr(onto, '__GO__', [None])
+        mp.setattr(main, 'TRUE_FIN', true_fin)
+        mp.setattr(main, 'TRUE_FIN2', true_fin)
+        mp.setattr(utils, 'CACHE_DIR', tmp_dir)
+        mp.setattr(mapper, 'INDEX_FILE', os.path.join(tmp_dir, 'uniprot_ac_to_cafa.cache'))
+        mp.setattr(mapper, '__INDEX__', [None])
+        yield {
+            'dir': tmp_dir,
+            'obo': obo_file,
+            'true': true_fin,
+            'pred': pred_fin,
+            'terms': terms,
+            'proteins': proteins,
+        }
+
+@pytest.fixture(scope='session')
+def run_python(data):
+    """Return a function running python code in a new interpreter, where
+catool is pointed at the synthetic inputs (unless synthetic=False), and
+returning its standard output. Keyword arguments are added to its
+environment."""
+    setup = ("from catool import main, onto, utils\n"
+             "from catool.conversion import mapper\n"
+             "onto.OBO_FILE = {!r}\n"
+             "main.TRUE_FIN = main.TRUE_FIN2 = {!r}\n"
+             "utils.CACHE_DIR = {!r}\n"
+             "mapper.INDEX_FILE = {!r}\n").format(
+                 data['obo'], data['true'], data['dir'], mapper.INDEX_FILE)
+    def run_python(code, synthetic=True, **env):
+        env = dict(os.environ, PYTHONPATH=os.path.join(TESTS_DIR, '..'), **env)
+        if synthetic:
+            code = setup + code
+        return subprocess.run([sys.executable, '-c', code], env=env,
+                              check=True, stdout=subprocess.PIPE,
+                              universal_newlines=True).stdout
+    return run_python
+
+@pytest.fixture(scope='session')
+def pred(data):
+    """Return the synthetic predictions as the dict of main.run."""
+    pred = defaultdict(list)
+    with gzip.open(data['pred'], 'rt') as f:
+        for a in f:
+            acc, term, score = a.split()
+            pred[acc].append((term, float(score)))
+    return dict(pred)
+
+@pytest.fixture(scope='session')
+def parents(data):
+    """Return a dict term -> set of its parents (is_a and part_of) in the
+synthetic ontology, read without catool."""
+    parents = defaultdict(set)
+    with open(data['obo']) as f:
+        for a in f:
+            a = a.split(' ! ')[0].split()
+            if a and a[0] == 'id:':
+                term = a[1]
+            elif a and a[0] == 'is_a:':
+                parents[term].add(a[1])
+            elif a[:2] == ['relationship:', 'part_of']:
+                parents[term].add(a[2])
+    return parents
+
+@pytest.fixture(scope='session')
+def ancestors(data, parents):
+    """Return a dict term -> set of its ancestors in the synthetic ontology."""
+    ancestors = {}
+    def get_ancestors(term):
+        if term not in ancestors:
+            ancestors[term] = set()
+            for parent in parents[term]:
+                ancestors[term] |= {parent} | get_ancestors(parent)
+        return ancestors[term]
+    for terms in data['terms'].values():
+        for term in terms:
+            get_ancestors(term)
+    return ancestors
@@ -0,0 +1,29 @@
+import gzip
+
+import numpy as np
+
+from catool import batch
+from catool import main
+from catool import utils
+
+def test_evaluate_files(data, pred, tmp_path):
+    # a second model with half the predictions of every protein
+    half = dict([ (acc, predictions[::2]) for acc, predictions in pred.items() ])
+    half_fin = str(tmp_path / 'half.tsv.gz')
+    with gzip.open(half_fin, 'wt') as f:
+        for acc, predictions in half.items():
+            for term, score in predictions:
+                f.write('{}\t{}\t{:.2f}\n'.format(acc, term, score))
+
+    # workers can't see the synthetic inputs of the tests, so files are
+    # evaluated in this process
+    table = batch.evaluate_files([data['pred'], half_fin], n_jobs=1)
+    assert len(table) == 2 * 3 * 2
+    for pred_fin, model in ((data['pred'], pred), (half_fin, half)):
+        results = main.run_all(model)
+        rows = [ row for row in table if row[0] == pred_fin ]
+        assert len(rows) == 6
+        for _, namespace, mode, thr, fmax, precision, recall in rows:
+            np.testing.assert_allclose((thr, fmax, precision, recall),
+                                       utils.fmax_row(results[(namespace, mode)]),
+                                       rtol=1e-12)
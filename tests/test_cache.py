@@ -0,0 +1,91 @@
+import os
+import gzip
+import shutil
+
+import numpy as np
+
+from catool import cache
+from catool import inou
+from catool import onto
+from catool import utils
+
+def test_save_and_load_arrays(tmp_path):
+    dirname = str(tmp_path / 'arrays.cache')
+    assert cache.load_header(dirname) is None
+
+    cache.save_arrays(dirname, {'a': np.arange(5), 'b': np.array([b'x', b'yz'])},
+                      {'key': 'v1'})
+    arrays = cache.load_arrays(dirname)
+    assert cache.load_header(dirname) == {'key': 'v1'}
+    assert isinstance(arrays['a'], np.memmap) and not arrays['a'].flags.writeable
+    np.testing.assert_array_equal(arrays['a'], np.arange(5))
+    np.testing.assert_array_equal(arrays['b'], [b'x', b'yz'])
+
+    # a new cache replaces all the arrays of the old one
+    cache.save_arrays(dirname, {'c': np.empty(0)}, {'key': 'v2'})
+    assert cache.load_header(dirname) == {'key': 'v2'}
+    assert list(cache.load_arrays(dirname)) == ['c']
+    assert os.listdir(str(tmp_path)) == ['arrays.cache']
+
+def test_load_arrays_while_replaced(tmp_path, monkeypatch):
+    dirname = str(tmp_path / 'arrays.cache')
+    monkeypatch.setattr(cache, 'LOAD_DELAY', 0.)
+    assert cache.load_arrays(dirname) is None
+
+    cache.save_arrays(dirname, {'a': np.zeros(3), 'b': np.zeros(3)}, {'key': 'v1'})
+    load_array = cache._load_array
+    def replace_and_load(fin):
+        # another process replaces the cache after the first array is read
+        if cache.load_header(dirname) == {'key': 'v1'}:
+            cache.save_arrays(dirname, {'a': np.ones(3), 'b': np.ones(3)}, {'key': 'v2'})
+        return load_array(fin)
+    monkeypatch.setattr(cache, '_load_array', replace_and_load)
+
+    arrays = cache.load_arrays(dirname)
+    np.testing.assert_array_equal(arrays['a'], np.ones(3))
+    np.testing.assert_array_equal(arrays['b'], np.ones(3))
+
+def test_groundtruth_cache(data, tmp_path, monkeypatch):
+    namespace = 'molecular_function'
+    go = onto.get_go()
+    true_fin = str(tmp_path / 'true.tsv.gz')
+    shutil.copy(data['true'], true_fin)
+    monkeypatch.setattr(inou, '__GROUNDTRUTH__', {})
+
+    proteins, mat = inou.load_groundtruth(true_fin, go, namespace)
+    fout = true_fin + '.' + namespace + '.cache'
+    header = cache.load_header(fout)
+    assert header is not None
+
+    # the cache is read back as it was built
+    monkeypatch.setattr(inou, '__GROUNDTRUTH__', {})
+    cached_proteins, cached_mat = inou.load_groundtruth(true_fin, go, namespace)
+    assert isinstance(cached_proteins, np.memmap)
+    np.testing.assert_array_equal(cached_proteins, proteins)
+    np.testing.assert_array_equal(cached_mat.indptr, mat.indptr)
+    np.testing.assert_array_equal(cached_mat.indices, mat.indices)
+
+    # and rebuilt when the benchmark changes
+    with gzip.open(data['true'], 'rt') as f:
+        lines = f.readlines()
+    first = lines[0].split('\t')[0]
+    with gzip.open(true_fin, 'wt') as f:
+        f.writelines([ a for a in lines if not a.startswith(first + '\t') ])
+    monkeypatch.setattr(inou, '__GROUNDTRUTH__', {})
+    new_proteins, _ = inou.load_groundtruth(true_fin, go, namespace)
+    assert first.encode() in proteins.tolist()
+    assert new_proteins.tolist() == [ p for p in proteins.tolist() if p != first.encode() ]
+    assert cache.load_header(fout) != header
+
+def test_ontology_cache(data):
+    go = onto.get_go()
+    utils.create_cache_files()
+    fout = utils.get_cache_file('molecular_function')
+    parents = [ np.array(a) for a in utils.load_parents('molecular_function') ]
+
+    # a cache of another ontology is rebuilt
+    cache.save_arrays(fout, {'order': np.empty(0)}, {'key': 'other'})
+    utils.create_cache_files()
+    assert cache.load_header(fout) == {'key': go.key}
+    for a, b in zip(utils.load_parents('molecular_function'), parents):
+        np.testing.assert_array_equal(a, b)
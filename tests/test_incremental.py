@@ -0,0 +1,39 @@
+import random
+
+import numpy as np
+import pytest
+
+from catool import main
+from catool.incremental import Evaluator
+
+@pytest.mark.parametrize('namespace', ('biological_process', 'molecular_function'))
+@pytest.mark.parametrize('sparse', (False, True))
+@pytest.mark.parametrize('weighted', (False, True))
+def test_update_and_remove(data, pred, namespace, sparse, weighted):
+    rng = random.Random(0)
+    proteins = sorted(pred)
+    terms = data['terms'][namespace][1:]
+
+    evaluator = Evaluator(namespace, sparse=sparse, weighted=weighted)
+    merged = {}
+    for step in range(4):
+        # new predictions for some proteins, predicted before or not
+        update = dict([ (acc, [ (rng.choice(terms), round(rng.random(), 2))
+                                for _ in range(rng.randint(1, 10)) ])
+                        for acc in rng.sample(proteins, 40) ])
+        evaluator.update(update)
+        merged.update(update)
+        removed = rng.sample(sorted(merged), 10) + ['UNKNOWN']
+        evaluator.remove(removed)
+        for acc in removed:
+            merged.pop(acc, None)
+
+        for mode in ('full', 'partial'):
+            np.testing.assert_allclose(
+                evaluator.results(mode),
+                main.run(merged, mode, namespace, weighted=weighted),
+                rtol=1e-9, atol=1e-12)
+
+    evaluator.remove(sorted(merged))
+    assert evaluator.n_predicted == 0
+    np.testing.assert_allclose(evaluator._sums, 0., atol=1e-9)
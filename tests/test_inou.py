@@ -0,0 +1,77 @@
+import gzip
+import shutil
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+from catool import inou
+from catool import onto
+from catool import main
+
+def test_load_groundtruth(data, ancestors):
+    namespace = 'biological_process'
+    go = onto.get_go()
+    root = onto.namespace2go[namespace]
+    expected = OrderedDict()
+    with gzip.open(data['true'], 'rt') as f:
+        for a in f:
+            cafa_id, term = a.split()
+            if term in go.term2index[namespace]:
+                expected.setdefault(cafa_id.encode(), set()).update({term} | ancestors[term])
+
+    proteins, mat = inou.load_groundtruth(data['true'], go, namespace)
+    assert proteins.tolist() == list(expected)
+    index2term = go.index2term[namespace]
+    for i, terms in enumerate(expected.values()):
+        # terms aren't propagated to the root, which isn't evaluated
+        assert set([ index2term[j] for j in mat.indices[mat.indptr[i]:mat.indptr[i + 1]] ]) \
+            - {root} == terms - {root}
+
+def test_benchmark_hashed_once(data, pred, tmp_path, monkeypatch):
+    true_fin = str(tmp_path / 'true.tsv.gz')
+    shutil.copy(data['true'], true_fin)
+    for name in ('TRUE_FIN', 'TRUE_FIN2'):
+        monkeypatch.setattr(main, name, true_fin)
+    hashed = []
+    file_hash = onto._file_hash
+    monkeypatch.setattr(onto, '_file_hash', lambda fin: hashed.append(fin) or file_hash(fin))
+
+    for memo in ('__GROUNDTRUTH__', '__IC__', '__HASHES__'):
+        monkeypatch.setattr(inou, memo, {})
+    results = main.run_all(pred, weighted=True)
+    assert hashed == [true_fin]
+
+    # caches saved by another process are used without hashing the file
+    for memo in ('__GROUNDTRUTH__', '__IC__', '__HASHES__'):
+        monkeypatch.setattr(inou, memo, {})
+    for key, ns_results in main.run_all(pred, weighted=True).items():
+        np.testing.assert_array_equal(ns_results, results[key])
+    assert hashed == [true_fin]
+
+def test_read_predictions_arrays(data, pred, tmp_path):
+    go = onto.get_go()
+    # plain file with blank lines, surrounding spaces, CRLF and no final newline
+    lines = [ ' {}\t{}\t{}\r'.format(acc, term, score) for acc, predictions in pred.items()
+              for term, score in predictions ]
+    plain_fin = str(tmp_path / 'pred.tsv')
+    with open(plain_fin, 'w') as f:
+        f.write('\n'.join(lines[:10]) + '\n\n' + '\n'.join(lines[10:]))
+
+    for fin in (data['pred'], plain_fin):
+        for namespace in (None, 'molecular_function'):
+            for chunk_size in (37, 1 << 20):
+                proteins, prot_idx, terms, scores = inou.read_predictions_arrays(
+                    fin, namespace, chunk_size)
+                expected = [ (acc, int(term[3:]), score) for acc, predictions in pred.items()
+                             for term, score in predictions
+                             if namespace is None or go.ont[term]['namespace'] == namespace ]
+                assert list(zip(np.array(proteins)[prot_idx].tolist(), terms.tolist(),
+                                scores.tolist())) == expected
+
+def test_read_predictions_malformed(tmp_path):
+    fin = str(tmp_path / 'pred.tsv')
+    with open(fin, 'w') as f:
+        f.write('P1\tGO:0003674\t0.5\nP1 GO:0003674 0.5\n')
+    with pytest.raises(ValueError, match='P1 GO:0003674 0.5'):
+        inou.read_predictions_arrays(fin)
@@ -0,0 +1,63 @@
+import json
+
+import numpy as np
+import pytest
+
+from catool import main
+from catool import instrument
+
+@pytest.fixture
+def sink(monkeypatch):
+    reports = []
+    monkeypatch.setattr(instrument, '__ENABLED__', [False])
+    monkeypatch.setattr(instrument, '__SINK__', [reports.append])
+    return reports
+
+def test_profile(pred, sink):
+    results = main.run(pred, 'full', 'molecular_function', weighted=True)
+    profiled, report = main.run(pred, 'full', 'molecular_function', weighted=True,
+                                block_size=40, profile=True)
+    np.testing.assert_array_equal(profiled, results)
+    assert sink == []
+    assert instrument.__RECORDER__[0] is None
+
+    # stages of the nested profiled calls are recorded in one report
+    assert report['function'] == 'run'
+    assert set(report['total']) == {'wall', 'cpu', 'peak_memory'}
+    assert {'dict_to_arrays', 'map_proteins', 'build_matrices', 'propagate',
+            'threshold_sweep', 'curves', 'information_content'} <= set(report['stages'])
+    # stages of each block are accumulated
+    assert report['stages']['threshold_sweep']['calls'] > 1
+    assert report['stages']['curves']['calls'] == 1
+    for stats in report['stages'].values():
+        assert 0. <= stats['wall'] <= report['total']['wall']
+        assert 0 <= stats['peak_memory']
+    json.dumps(report)
+
+    # without profile, the result is returned alone
+    assert main.run(pred, 'full', 'molecular_function', profile=False).shape == (101, 4)
+    assert main.run_terms(pred, 'full', 'molecular_function', profile=True)[1] is not None
+
+def test_enable(pred, sink, tmp_path):
+    instrument.enable()
+    results = main.run_all(pred)
+    instrument.disable()
+    main.run_all(pred)
+    assert [ report['function'] for report in sink ] == ['run_all']
+    assert isinstance(results, dict)
+
+    fout = str(tmp_path / 'profile.jsonl')
+    instrument.enable(instrument.json_sink(fout))
+    main.run(pred, 'partial', 'biological_process')
+    main.run(pred, 'full', 'biological_process')
+    instrument.disable()
+    with open(fout) as f:
+        reports = [ json.loads(a) for a in f ]
+    assert [ report['function'] for report in reports ] == ['run', 'run']
+    assert 'threshold_sweep' in reports[0]['stages']
+
+def test_stage_without_profile():
+    assert instrument.__RECORDER__[0] is None
+    with instrument.stage('unused'):
+        pass
+    assert instrument.stage('unused') is instrument._NULL_STAGE
@@ -0,0 +1,311 @@
+import gzip
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+from catool import main
+from catool import inou
+from catool import onto
+from catool.sparse import CSRMatrix
+
+NAMESPACES = ('biological_process', 'molecular_function')
+
+def read_predictions(data, namespace=None):
+    proteins, prot_idx, terms, scores = inou.read_predictions_arrays(data['pred'], namespace)
+    return np.array(proteins)[prot_idx], terms, scores
+
+def read_benchmark(data, ancestors, namespace):
+    """Return a dict CAFA id -> set of the propagated true terms of the
+namespace, for the benchmark proteins annotated in the namespace."""
+    columns = set(data['terms'][namespace])
+    benchmark = defaultdict(set)
+    with gzip.open(data['true'], 'rt') as f:
+        for a in f:
+            cafa_id, term = a.split()
+            if term in columns:
+                benchmark[cafa_id] |= {term} | (ancestors.get(term, set()) & columns)
+    return benchmark
+
+def reference_information_content(data, ancestors, parents, namespace):
+    """Return a dict term -> -log2 P(term | parents) over the benchmark
+proteins, 0 for the root and for terms without annotations."""
+    terms = data['terms'][namespace]
+    root = terms[0]
+    benchmark = list(read_benchmark(data, ancestors, namespace).values())
+    ic = {}
+    for term in terms:
+        n_annotated = sum(term in true for true in benchmark)
+        term_parents = (parents[term] & set(terms)) - {root}
+        n_parents = sum(term_parents <= true for true in benchmark)
+        ic[term] = -np.log2(n_annotated / n_parents) if n_annotated and term != root else 0.
+    return ic
+
+def reference_matrices(data, ancestors, pred, namespace):
+    """Return the benchmark (see read_benchmark) and the dense true and
+predicted matrices of the predicted benchmark proteins, propagated with python
+sets, where the root (first column) is zeroed."""
+    terms = data['terms'][namespace]
+    columns = dict([ (term, j) for j, term in enumerate(terms) ])
+    cafa_ids = dict(data['proteins'])
+    benchmark = read_benchmark(data, ancestors, namespace)
+    # the last accession of a CAFA id wins
+    pred = dict([ (cafa_ids[acc], predictions) for acc, predictions in pred.items()
+                  if cafa_ids.get(acc) in benchmark ])
+
+    y_true = np.zeros((len(pred), len(terms)))
+    y_pred = np.zeros((len(pred), len(terms)))
+    for i, (cafa_id, predictions) in enumerate(pred.items()):
+        y_true[i, [ columns[t] for t in benchmark[cafa_id] ]] = 1.
+        scores = {}
+        for term, score in predictions:
+            if term in columns:
+                scores[term] = score # the last prediction of a term wins
+        for term, score in scores.items():
+            for t in {term} | ancestors.get(term, set()):
+                if t in columns:
+                    y_pred[i, columns[t]] = max(y_pred[i, columns[t]], score)
+    y_true[:, 0] = 0.
+    y_pred[:, 0] = 0.
+    return benchmark, y_true, y_pred
+
+def reference_run(data, ancestors, pred, mode, namespace, ic=None):
+    """The evaluation of the original implementation: the matrices of
+reference_matrices swept at the thresholds 0, 0.01, ..., 1. If ic
+(a dict term -> information content) is given, the weighted metrics are
+added as in run(weighted=True)."""
+    terms = data['terms'][namespace]
+    columns = dict([ (term, j) for j, term in enumerate(terms) ])
+    benchmark, y_true, y_pred = reference_matrices(data, ancestors, pred, namespace)
+
+    eps = np.finfo(float).eps
+    baseline = len(benchmark) if mode == 'full' else y_pred.shape[0]
+    results = np.empty((101, 4 if ic is None else 10))
+    if ic is not None:
+        weights = np.array([ ic[term] for term in terms ])
+        relevant = y_true @ weights
+        if mode == 'full':
+            relevant_ic = sum([ weights[[ columns[t] for t in true ]].sum()
+                                for true in benchmark.values() ])
+        else:
+            relevant_ic = relevant.sum()
+    for k in range(101):
+        thr = 0.01 * k
+        retrieved = (y_pred >= thr).sum(axis=1)
+        tp = ((y_pred >= thr) * y_true).sum(axis=1)
+        pr = (tp / (retrieved + eps)).sum() / np.count_nonzero(retrieved)
+        re = min(1., (tp / (y_true.sum(axis=1) + eps)).sum() / baseline)
+        results[k, :4] = thr, 2. * pr * re / (pr + re + eps), pr, re
+        if ic is not None:
+            w_retrieved = (y_pred >= thr) @ weights
+            w_tp = ((y_pred >= thr) * y_true) @ weights
+            wpr = (w_tp / (w_retrieved + eps)).sum() / np.count_nonzero(retrieved)
+            wrc = min(1., (w_tp / (relevant + eps)).sum() / baseline)
+            ru = (relevant_ic - w_tp.sum()) / baseline
+            mi = (w_retrieved - w_tp).sum() / baseline
+            results[k, 4:] = (2. * wpr * wrc / (wpr + wrc + eps), wpr, wrc, ru, mi,
+                              np.sqrt(ru ** 2 + mi ** 2))
+    return results
+
+def reference_terms(data, ancestors, pred, mode, namespace):
+    """Return a dict GO id -> (number of positives, ROC-AUC, AUPR) of the
+terms of the namespace, ranking the proteins of reference_matrices (and in
+"full" mode the benchmark proteins without predictions, predicted with 0) by
+comparing all pairs of positive and negative proteins."""
+    terms = data['terms'][namespace]
+    benchmark, y_true, y_pred = reference_matrices(data, ancestors, pred, namespace)
+    n_unpredicted = len(benchmark) - y_pred.shape[0] if mode == 'full' else 0
+    results = {}
+    for j, term in enumerate(terms[1:], 1):
+        n_annotated = sum(term in true for true in benchmark.values()) \
+            - y_true[:, j].sum() if mode == 'full' else 0
+        labels = np.concatenate([y_true[:, j], np.ones(int(n_annotated)),
+                                 np.zeros(int(n_unpredicted - n_annotated))])
+        scores = np.concatenate([y_pred[:, j], np.zeros(n_unpredicted)])
+        pos, neg = scores[labels == 1.], scores[labels == 0.]
+        if pos.shape[0] == 0:
+            continue
+        pairs = (pos[:, None] > neg[None, :]) + 0.5 * (pos[:, None] == neg[None, :])
+        roc_auc = pairs.mean() if neg.shape[0] > 0 else np.nan
+        aupr = np.mean([ labels[scores >= a].mean() for a in pos ])
+        results[term] = pos.shape[0], roc_auc, aupr
+    return results
+
+def as_matrix(proteins, terms, scores, extra_proteins=()):
+    """Return predictions as a dense matrix labeled with accessions and GO
+ids, with a row of zeros for each of extra_proteins."""
+    row_labels, rows = np.unique(proteins, return_inverse=True)
+    col_labels, cols = np.unique(terms, return_inverse=True)
+    matrix = np.zeros((row_labels.shape[0] + len(extra_proteins), col_labels.shape[0]))
+    matrix[rows, cols] = scores
+    row_labels = np.concatenate([row_labels, np.asarray(extra_proteins, dtype=row_labels.dtype)])
+    return matrix, row_labels, col_labels
+
+@pytest.mark.parametrize('namespace', NAMESPACES)
+@pytest.mark.parametrize('mode', ('full', 'partial'))
+@pytest.mark.parametrize('sparse', (False, True))
+def test_run_matches_reference(data, ancestors, pred, namespace, mode, sparse):
+    results = main.run(pred, mode, namespace, sparse=sparse)
+    np.testing.assert_allclose(results, reference_run(data, ancestors, pred, mode, namespace),
+                               rtol=1e-10, atol=1e-12)
+
+@pytest.mark.parametrize('namespace', NAMESPACES)
+@pytest.mark.parametrize('mode', ('full', 'partial'))
+@pytest.mark.parametrize('sparse', (False, True))
+def test_run_weighted_matches_reference(data, ancestors, parents, pred, namespace,
+                                        mode, sparse):
+    ic = reference_information_content(data, ancestors, parents, namespace)
+    results = main.run(pred, mode, namespace, sparse=sparse, weighted=True)
+    np.testing.assert_allclose(results, reference_run(data, ancestors, pred, mode,
+                                                      namespace, ic),
+                               rtol=1e-9, atol=1e-12)
+    assert main.smin_score(pred, mode, namespace, sparse=sparse) == results[:, 9].min()
+
+@pytest.mark.parametrize('namespace', NAMESPACES)
+@pytest.mark.parametrize('mode', ('full', 'partial'))
+@pytest.mark.parametrize('sparse', (False, True))
+def test_run_terms_matches_reference(data, ancestors, pred, namespace, mode, sparse):
+    reference = reference_terms(data, ancestors, pred, mode, namespace)
+    terms, results = main.run_terms(pred, mode, namespace, sparse=sparse)
+    assert sorted(terms.tolist()) == sorted(reference)
+    np.testing.assert_allclose(results, [ reference[t] for t in terms.tolist() ],
+                               rtol=1e-10, atol=1e-12)
+
+    terms, results = main.run_terms(pred, mode, namespace, sparse=sparse, min_positives=5)
+    assert sorted(terms.tolist()) == sorted([ t for t, a in reference.items() if a[0] >= 5 ])
+    scores = main.term_scores(pred, mode, namespace, sparse=sparse, min_positives=5)
+    assert scores['n_terms'] == len(terms)
+    assert scores['roc_auc'] == pytest.approx(np.nanmean(results[:, 1]))
+    assert scores['aupr'] == pytest.approx(results[:, 2].mean())
+
+@pytest.mark.parametrize('namespace', NAMESPACES)
+@pytest.mark.parametrize('mode', ('full', 'partial'))
+def test_run_matrix_dense_and_csr(data, namespace, mode):
+    proteins, terms, scores = read_predictions(data)
+    # benchmark proteins without any prediction are labeled rows of zeros
+    predicted = set(proteins.tolist())
+    unpredicted = [ acc for acc, _ in data['proteins'] if acc not in predicted ]
+    matrix, row_labels, col_labels = as_matrix(proteins, terms, scores, unpredicted[:50])
+    assert len(unpredicted) > 0
+
+    dense = main.run_matrix(matrix, row_labels, col_labels, mode, namespace)
+    csr = main.run_matrix(CSRMatrix.from_dense(matrix), row_labels, col_labels, mode, namespace)
+    # matrices hold all namespaces, but proteins are only predicted in the
+    # namespaces of their nonzero values
+    ref = main.run_arrays(*read_predictions(data, namespace), mode, namespace)
+
+    np.testing.assert_array_equal(dense, csr)
+    np.testing.assert_allclose(dense, ref, rtol=1e-12)
+
+def test_run_all_maps_proteins_once(data):
+    proteins, terms, scores = read_predictions(data)
+    results, report = main.run_all_arrays(proteins, terms, scores, profile=True)
+
+    assert report['stages']['map_proteins']['calls'] == 1
+    for (namespace, mode), ns_results in results.items():
+        ref = main.run_arrays(*read_predictions(data, namespace), mode, namespace)
+        np.testing.assert_allclose(ns_results, ref, rtol=1e-12)
+
+@pytest.mark.parametrize('matrix_type', ('dense', 'csr'))
+def test_run_matrix_options(data, matrix_type):
+    namespace = 'molecular_function'
+    matrix, row_labels, col_labels = as_matrix(*read_predictions(data))
+    if matrix_type == 'csr':
+        matrix = CSRMatrix.from_dense(matrix)
+    ref = main.run_arrays(*read_predictions(data, namespace), 'partial', namespace,
+                          weighted=True)
+
+    for block_size in (None, 17):
+        results = main.run_matrix(matrix, row_labels, col_labels, 'partial', namespace,
+                                  block_size=block_size, weighted=True)
+        np.testing.assert_allclose(results, ref, rtol=1e-12)
+
+def test_scores_options(pred):
+    namespace = 'biological_process'
+    results = main.run(pred, 'full', namespace, weighted=True, taxa=[9606])
+
+    assert main.f1max_score(pred, 'full', namespace, threads=1, taxa=[9606],
+                            block_size=50) == pytest.approx(results[:, 1].max())
+    assert main.smin_score(pred, 'full', namespace, threads=1,
+                           taxa=[9606]) == pytest.approx(results[:, 9].min())
+    assert main.term_scores(pred, 'full', namespace, threads=1, taxa=[9606]) \
+        == main.term_scores(pred, 'full', namespace)
+
+def test_f1max_bootstrap(pred):
+    namespace = 'molecular_function'
+    intervals = main.f1max_bootstrap(pred, 'full', namespace, n_replicates=50, seed=0)
+
+    value, low, high = intervals['fmax']
+    assert value == pytest.approx(main.f1max_score(pred, 'full', namespace))
+    assert low <= value <= high
+    with pytest.raises(ValueError):
+        main.f1max_bootstrap(pred, 'full', namespace, thresholds='exact')
+
+def test_permutation_test(pred):
+    namespace = 'molecular_function'
+    test = main.permutation_test(pred, pred, 'full', namespace, n_permutations=50, seed=0)
+
+    assert test['fmax_a'] == test['fmax_b'] == pytest.approx(
+        main.f1max_score(pred, 'full', namespace))
+    assert test['difference'] == 0. and test['p_value'] == 1.
+    with pytest.raises(ValueError):
+        main.permutation_test(pred, pred, 'full', namespace, thresholds='exact')
+
+@pytest.mark.parametrize('sparse', (False, True))
+def test_run_thresholds(pred, sparse):
+    namespace = 'molecular_function'
+    default = main.run(pred, 'full', namespace, sparse=sparse)
+    grid = main.run(pred, 'full', namespace, sparse=sparse, thresholds=[0.5, 0.1, 0.3])
+    np.testing.assert_allclose(grid, default[[10, 30, 50]], rtol=1e-12)
+
+    # exact thresholds are the distinct predicted scores (with 2 decimals)
+    exact = main.run(pred, 'full', namespace, sparse=sparse, thresholds='exact')
+    assert 0 < exact.shape[0] < default.shape[0]
+    np.testing.assert_array_equal(exact[:, 0], np.round(exact[:, 0], 2))
+    np.testing.assert_allclose(
+        exact, main.run(pred, 'full', namespace, sparse=sparse, thresholds=exact[:, 0]),
+        rtol=1e-12)
+    with pytest.raises(ValueError):
+        main.run(pred, 'full', namespace, thresholds='other')
+
+@pytest.mark.parametrize('block_size', (None, 40))
+def test_run_all(data, pred, block_size):
+    results = main.run_all(pred, weighted=True, block_size=block_size)
+
+    assert sorted(results) == sorted([ (namespace, mode) for namespace in onto.NAMESPACES.values()
+                                       for mode in ('full', 'partial') ])
+    for (namespace, mode), ns_results in results.items():
+        # proteins are only predicted in the namespaces of their predictions
+        ref = main.run_arrays(*read_predictions(data, namespace), mode, namespace,
+                              weighted=True)
+        np.testing.assert_allclose(ns_results, ref, rtol=1e-12)
+
+def test_run_arrays_inputs(data, pred):
+    namespace = 'biological_process'
+    ref = main.run(pred, 'full', namespace)
+    proteins, prot_idx, terms, scores = inou.read_predictions_arrays(data['pred'])
+
+    inputs = [
+        # unique proteins and indices, integer terms
+        (proteins, terms, scores, prot_idx),
+        # one accession per prediction, as str or bytes, and string terms
+        (np.array(proteins)[prot_idx], onto.int_to_go(terms), scores, None),
+        (np.array(proteins, dtype=np.bytes_)[prot_idx], terms, scores, None),
+    ]
+    for proteins, terms, scores, prot_idx in inputs:
+        np.testing.assert_array_equal(
+            main.run_arrays(proteins, terms, scores, 'full', namespace, prot_idx=prot_idx),
+            ref)
+
+@pytest.mark.parametrize('sparse', (False, True))
+@pytest.mark.parametrize('thresholds', (None, 'exact'))
+def test_run_blocks(pred, sparse, thresholds):
+    namespace = 'biological_process'
+    for mode in ('full', 'partial'):
+        ref = main.run(pred, mode, namespace, sparse=sparse, thresholds=thresholds,
+                       weighted=True)
+        for block_size in (1, 23, 10000):
+            np.testing.assert_allclose(
+                main.run(pred, mode, namespace, sparse=sparse, thresholds=thresholds,
+                         weighted=True, block_size=block_size),
+                ref, rtol=1e-12, atol=1e-15)
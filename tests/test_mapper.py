@@ -0,0 +1,79 @@
+import os
+import gzip
+
+import numpy as np
+import pytest
+
+from catool import cache
+from catool.conversion import mapper
+
+def write_mapping(dirname, taxon, pairs):
+    """Write the mapping files of a taxon for (accession, CAFA id) pairs."""
+    with gzip.open(os.path.join(dirname, 'uniprot_ac_to_id_{}.map.gz'.format(taxon)), 'wt') as f:
+        for acc, cafa_id in pairs:
+            f.write('{}\t{}\tID_{}\n'.format(acc, acc, cafa_id))
+    with gzip.open(os.path.join(dirname, 'sp_species.{}.map.gz'.format(taxon)), 'wt') as f:
+        for _, cafa_id in pairs:
+            f.write('{}\tID_{}\n'.format(cafa_id, cafa_id))
+
+@pytest.fixture
+def mapping_dir(tmp_path, monkeypatch):
+    """Point the mapper at an empty directory of mapping files."""
+    dirname = str(tmp_path)
+    monkeypatch.setattr(mapper, 'MAPPING_DIR', dirname)
+    monkeypatch.setattr(mapper, 'INDEX_FILE', os.path.join(dirname, 'index.cache'))
+    monkeypatch.setattr(mapper, '__CATALOG__', [None])
+    monkeypatch.setattr(mapper, '__INDEX__', [None])
+    return dirname
+
+def test_lookup(data):
+    accs = [ acc for acc, _ in data['proteins'] ]
+    cafa_ids, found = mapper.lookup(accs + ['UNKNOWN'])
+    assert found.tolist() == [True] * len(accs) + [False]
+    assert cafa_ids[:-1].tolist() == [ cafa_id.encode() for _, cafa_id in data['proteins'] ]
+    assert cafa_ids[-1] == b''
+
+    acc, cafa_id = data['proteins'][0]
+    assert mapper.map({acc: [1], 'UNKNOWN': [2]}) == {cafa_id: [1]}
+
+    # proteins of other species are not mapped
+    assert mapper.lookup(accs, [9606])[1].all()
+    with pytest.raises(ValueError):
+        mapper.lookup(accs, [10090])
+
+def test_index_cache(mapping_dir):
+    write_mapping(mapping_dir, 9606, [('P1', 'T1'), ('P2', 'T2')])
+    assert mapper.lookup(['P2', 'P1'])[0].tolist() == [b'T2', b'T1']
+    header = cache.load_header(mapper.INDEX_FILE)
+    assert header is not None
+
+    # the saved index is used as long as the files don't change
+    mapper.__INDEX__[0] = None
+    assert mapper.lookup(['P1'])[0].tolist() == [b'T1']
+    assert cache.load_header(mapper.INDEX_FILE) == header
+
+    write_mapping(mapping_dir, 9606, [('P1', 'T3')])
+    mapper.__INDEX__[0] = None
+    cafa_ids, found = mapper.lookup(['P1', 'P2'])
+    assert cafa_ids.tolist() == [b'T3', b''] and found.tolist() == [True, False]
+
+def test_taxa(mapping_dir):
+    write_mapping(mapping_dir, 9606, [('P1', 'T1'), ('P2', 'T2')])
+    write_mapping(mapping_dir, 10090, [('M1', 'U1'), ('P1', 'U2')])
+    # a species with a single mapping file is ignored
+    write_mapping(mapping_dir, 7227, [('D1', 'F1')])
+    os.remove(os.path.join(mapping_dir, 'sp_species.7227.map.gz'))
+    assert mapper.get_taxa() == [9606, 10090]
+
+    # accessions of several species, the first taxon winning
+    query = ['M1', 'P1', 'D1', 'P2']
+    assert mapper.lookup(query)[0].tolist() == [b'U1', b'T1', b'', b'T2']
+    assert mapper.lookup(query, [9606, 10090])[0].tolist() == [b'U1', b'T1', b'', b'T2']
+    cafa_ids, found = mapper.lookup(query, 10090)
+    assert cafa_ids.tolist() == [b'U1', b'', b'', b'']
+    assert found.tolist() == [True, False, False, False]
+    assert mapper.map({'M1': [1], 'P1': [2]}, taxa=[9606]) == {'T1': [2]}
+
+    for taxa in ([7227], [9606, 1], 'human'):
+        with pytest.raises(ValueError):
+            mapper.lookup(query, taxa)
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from catool import metrics
+from catool.sparse import CSRMatrix
+
+def random_arrays(seed, shape=(40, 30)):
+    """Return random (true, pred) arrays where every protein has a true term
+and a nonzero prediction."""
+    rng = np.random.RandomState(seed)
+    true = rng.rand(*shape) < 0.2
+    true[:, 0] = True
+    pred = np.round(rng.rand(*shape), 2) * (rng.rand(*shape) < 0.3)
+    pred[:, 1] = 0.99
+    return true, pred
+
+@pytest.mark.parametrize('sparse', (False, True))
+def test_sweep_same_as_each_threshold(sparse):
+    true, pred = random_arrays(0)
+    thresholds = 0.01 * np.arange(100)
+    results = np.empty((len(thresholds), 4))
+    if sparse:
+        metrics.precision_recall_curve(CSRMatrix.from_dense(true), CSRMatrix.from_dense(pred),
+                                       true.shape[0], results, thresholds)
+    else:
+        metrics.precision_recall_curve(true, pred, true.shape[0], results, thresholds)
+
+    for k, thr in enumerate(thresholds):
+        pr, re = metrics.precision_and_recall_at_thr(true, pred, true.shape[0], thr)
+        np.testing.assert_allclose(results[k, 2:], [pr, re], rtol=1e-12)
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from catool import onto
+
+NAMESPACES = ('biological_process', 'molecular_function', 'cellular_component')
+
+@pytest.mark.parametrize('namespace', NAMESPACES)
+def test_get_ancestors(data, ancestors, namespace):
+    go = onto.get_go()
+    for term in data['terms'][namespace]:
+        assert go.get_ancestors(term) == {term} | ancestors[term]
+
+@pytest.mark.parametrize('namespace', NAMESPACES)
+def test_topological_order(data, namespace):
+    go = onto.get_go()
+    order = go.topological_order(namespace)
+    indptr, indices = go.get_parents_index(namespace)
+    assert sorted(order) == list(range(go.counts[namespace]))
+
+    # parents come before their children
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    for i in range(len(order)):
+        assert np.all(rank[indices[indptr[i]:indptr[i + 1]]] < rank[i])
+
+def test_snapshot(data, tmp_path):
+    obo_file = str(tmp_path / 'go.obo')
+    with open(data['obo']) as f:
+        obo = f.read()
+    with open(obo_file, 'w') as f:
+        f.write(obo)
+    parsed = onto.Ontology(obo_file, with_rels=True, include_alt_ids=False)
+
+    built = onto.load_ontology(obo_file, with_rels=True, include_alt_ids=False)
+    loaded = onto.load_ontology(obo_file, with_rels=True, include_alt_ids=False)
+    assert built._snapshot is None
+    assert loaded._snapshot is not None
+    assert loaded.key == parsed.key
+    assert loaded.counts == parsed.counts
+    assert loaded.term2index == parsed.term2index
+    assert loaded.ont.keys() == parsed.ont.keys()
+    for term in parsed.ont:
+        assert loaded.get_ancestors(term) == parsed.get_ancestors(term)
+
+    # the snapshot is rebuilt when the obo file changes
+    with open(obo_file, 'w') as f:
+        f.write(obo.replace('[Typedef]', '[Term]\nid: GO:0000001\nname: new\n'
+                            'namespace: molecular_function\nis_a: GO:0003674\n\n[Typedef]'))
+    changed = onto.load_ontology(obo_file, with_rels=True, include_alt_ids=False)
+    assert changed.key != loaded.key
+    assert changed.counts['molecular_function'] == parsed.counts['molecular_function'] + 1
+    assert onto.load_ontology(obo_file, with_rels=True, include_alt_ids=False).key == changed.key
+
+def test_go_to_int():
+    terms = ['GO:0008150', 'GO:1234567', 'GO:123456', 'GO:12345678', 'go:0008150',
+             'GO:00081x0', '']
+    expected = [8150, 1234567, -1, -1, -1, -1, -1]
+    for array in (terms, np.array(terms), np.array(terms, dtype=np.bytes_),
+                  np.array(terms, dtype=object)):
+        assert onto.go_to_int(array, strict=False).tolist() == expected
+    assert onto.int_to_go(np.array(expected[:2])) == terms[:2]
+    with pytest.raises(ValueError):
+        onto.go_to_int(terms)
+
+def test_lookup_terms(data):
+    go = onto.get_go()
+    terms = [ t for namespace in NAMESPACES for t in data['terms'][namespace][:5] ]
+    ns_codes, indices = go.lookup_terms(terms + ['GO:9999999', 'other'])
+    for term, code, index in zip(terms, ns_codes.tolist(), indices.tolist()):
+        namespace = onto.NAMESPACE_CODES[code]
+        assert go.ont[term]['namespace'] == namespace
+        assert go.term2index[namespace][term] == index
+    assert ns_codes[-2:].tolist() == indices[-2:].tolist() == [-1, -1]
+    np.testing.assert_array_equal(go.lookup_terms(onto.go_to_int(terms))[1], indices[:-2])
@@ -0,0 +1,58 @@
+import numba as nb
+import pytest
+
+from catool import main
+from catool import parallel
+
+def test_threads(pred):
+    budget = parallel.get_threads()
+    with parallel.threads(1):
+        assert parallel.get_threads() == 1
+        with parallel.kernel(10 ** 9):
+            assert parallel.get_threads() == 1
+    assert parallel.get_threads() == budget
+    # the budget is capped to the threads of numba
+    with parallel.threads(nb.config.NUMBA_NUM_THREADS + 1):
+        assert parallel.get_threads() == nb.config.NUMBA_NUM_THREADS
+    with pytest.raises(ValueError):
+        parallel.set_threads(0)
+    assert parallel.get_threads() == budget
+
+    # small kernels run on a single thread
+    with parallel.kernel(10, 10):
+        assert parallel.get_threads() == 1
+    assert parallel.get_threads() == budget
+
+    assert (main.run(pred, 'full', 'molecular_function', threads=1)
+            == main.run(pred, 'full', 'molecular_function')).all()
+
+def test_same_results(data, run_python):
+    # results of every kernel, with parallel loops run whatever their size
+    code = (
+        "import hashlib, pickle\n"
+        "import numpy as np\n"
+        "from catool import inou, parallel\n"
+        "parallel.MIN_WORK_PER_THREAD = 1\n"
+        "proteins, prot_idx, terms, scores = inou.read_predictions_arrays({!r})\n"
+        "proteins = np.asarray(proteins)[prot_idx]\n"
+        "pred = (proteins, terms, scores)\n"
+        "half = (proteins[::2], terms[::2], scores[::2])\n"
+        "results = []\n"
+        "for namespace in ('biological_process', 'molecular_function'):\n"
+        "    for sparse in (False, True):\n"
+        "        results.append(main.run_arrays(*pred, 'full', namespace, sparse=sparse,\n"
+        "                                       weighted=True, block_size=50))\n"
+        "        results.append(main.run_arrays(*pred, 'partial', namespace, sparse=sparse,\n"
+        "                                       thresholds='exact'))\n"
+        "        results.append(main.run_terms_arrays(*pred, 'full', namespace,\n"
+        "                                             sparse=sparse))\n"
+        "    results.append(main.f1max_bootstrap_arrays(*pred, 'full', namespace,\n"
+        "                                               n_replicates=50, seed=0))\n"
+        "    results.append(main.permutation_test_arrays(pred, half, 'full', namespace,\n"
+        "                                                n_permutations=50, seed=0))\n"
+        "print(parallel.get_threads())\n"
+        "print(hashlib.sha1(pickle.dumps(results)).hexdigest())\n").format(data['pred'])
+    outputs = dict([ (n, run_python(code, NUMBA_NUM_THREADS='4', CATOOL_THREADS=str(n)))
+                     for n in (1, 2, 4) ])
+    assert [ out.split()[0] for out in outputs.values() ] == ['1', '2', '4']
+    assert len(set([ out.split()[1] for out in outputs.values() ])) == 1
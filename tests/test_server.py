@@ -0,0 +1,93 @@
+import os
+import stat
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener
+
+import numpy as np
+import pytest
+
+from catool import main
+from catool import server
+
+@pytest.fixture
+def runtime_dir(tmp_path, monkeypatch):
+    dirname = str(tmp_path / 'run')
+    monkeypatch.setattr(server, 'RUNTIME_DIR', dirname)
+    monkeypatch.setattr(server, 'KEY_FILE', os.path.join(dirname, 'catool.key'))
+    return dirname
+
+def test_key(runtime_dir):
+    authkey = server._write_key()
+    assert len(authkey) == 32
+    assert server._read_key() == authkey
+    assert server._read_key(b'other') == b'other'
+    assert stat.S_IMODE(os.stat(runtime_dir).st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(server.KEY_FILE).st_mode) == 0o600
+    assert server._write_key() != authkey
+
+    # a directory other users can read is refused
+    os.chmod(runtime_dir, 0o755)
+    with pytest.raises(RuntimeError):
+        server._read_key()
+
+class InlinePool(object):
+    """Evaluates requests in the calling thread: workers can't see the
+synthetic inputs of the tests, and parallel kernels launched from other
+threads than the main one can hang the exit of the interpreter."""
+    def apply_async(self, fn, args):
+        self.result = fn(*args)
+        return self
+
+    def get(self):
+        return self.result
+
+def test_requests(data, pred, runtime_dir):
+    address = os.path.join(server._runtime_dir(), 'catool.sock')
+    authkey = server._write_key()
+    listener = Listener(address, authkey=authkey)
+
+    answers = {}
+    def client():
+        try:
+            answers['ping'] = server.ping(address)
+            answers['run'] = server.request('run', pred, 'full', 'molecular_function',
+                                            address=address)
+            answers['run_file'] = server.run_file(data['pred'], 'partial',
+                                                  'biological_process',
+                                                  address=address, weighted=True)
+            for key, args in (('unknown', ('get_go',)),
+                              ('error', ('run', pred, 'full', 'unknown'))):
+                try:
+                    server.request(*args, address=address)
+                except RuntimeError as e:
+                    answers[key] = str(e)
+            try:
+                server.ping(address, authkey=b'other')
+            except AuthenticationError:
+                answers['authkey'] = False
+        finally:
+            server.shutdown(address)
+    thread = threading.Thread(target=client)
+    thread.start()
+
+    stopped = threading.Event()
+    try:
+        while not stopped.is_set():
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, EOFError, ConnectionError):
+                continue
+            server._handle(conn, InlinePool(), stopped.set)
+    finally:
+        listener.close()
+    thread.join()
+
+    assert answers['ping']
+    np.testing.assert_array_equal(answers['run'], main.run(pred, 'full', 'molecular_function'))
+    np.testing.assert_array_equal(
+        answers['run_file'],
+        main.run_file(data['pred'], 'partial', 'biological_process', weighted=True))
+    assert 'unknown command' in answers['unknown']
+    assert answers['error'].startswith('ValueError')
+    assert answers['authkey'] is False
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from catool import main
+from catool.sparse import CSRMatrix
+from catool.sparse import vstack
+
+def random_matrix(seed, shape=(7, 11), density=0.3):
+    rng = np.random.RandomState(seed)
+    return np.round(rng.rand(*shape), 2) * (rng.rand(*shape) < density)
+
+def test_csr_matrix():
+    mat = random_matrix(0)
+    csr = CSRMatrix.from_dense(mat)
+    np.testing.assert_array_equal(csr.toarray(), mat)
+    np.testing.assert_array_equal(csr.take_rows([4, 0, 4]).toarray(), mat[[4, 0, 4]])
+    np.testing.assert_array_equal(csr.row_block(2, 5).toarray(), mat[2:5])
+    np.testing.assert_array_equal(csr.transpose().toarray(), mat.T)
+    np.testing.assert_array_equal(csr.drop_column(3).toarray()[:, 3], 0.)
+    np.testing.assert_array_equal(
+        vstack([csr, CSRMatrix.from_dense(random_matrix(1))], mat.shape[1]).toarray(),
+        np.vstack([mat, random_matrix(1)]))
+
+def test_from_coo_keeps_last_value():
+    csr = CSRMatrix.from_coo([1, 0, 1], [2, 1, 2], [0.5, 0.2, 0.7], (2, 3))
+    np.testing.assert_array_equal(csr.toarray(), [[0., 0.2, 0.], [0., 0., 0.7]])
+
+@pytest.mark.parametrize('namespace', ('biological_process', 'molecular_function'))
+def test_run_sparse_same_as_dense(pred, namespace):
+    for mode in ('full', 'partial'):
+        np.testing.assert_array_equal(main.run(pred, mode, namespace, sparse=True),
+                                      main.run(pred, mode, namespace))
@@ -0,0 +1,71 @@
+import gzip
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+import synthetic
+
+from catool import onto
+from catool.conversion import mapper
+
+def test_make_obo(data, parents, tmp_path):
+    go = onto.get_go()
+    for namespace, terms in data['terms'].items():
+        assert terms[0] == synthetic.ROOTS[namespace]
+        assert len(set(terms)) == len(terms)
+        assert sorted(go.term2index[namespace]) == sorted(terms)
+
+        # terms are at most depth = 6 levels below the root, with at most
+        # fan_in = 3 parents
+        levels = { terms[0]: 0 }
+        for term in terms[1:]:
+            assert 1 <= len(parents[term]) <= 3
+            assert parents[term] <= set(terms)
+            levels[term] = 1 + max([ levels[p] for p in parents[term] ])
+        assert max(levels.values()) == 6
+    assert sum([ len(terms) - 1 for terms in data['terms'].values() ]) \
+        == pytest.approx(400, abs=3)
+
+    # the same seed writes the same ontology
+    fout = str(tmp_path / 'go.obo')
+    assert synthetic.make_obo(fout, n_terms=400, depth=6, seed=1) == data['terms']
+    with open(fout) as f, open(data['obo']) as g:
+        assert f.read() == g.read()
+
+def test_make_benchmark(data):
+    cafa_ids = dict(data['proteins'])
+    assert len(cafa_ids) == 300
+    assert len(set(cafa_ids.values())) == 300
+
+    # accessions are mapped to the CAFA ids of the benchmark
+    mapped, found = mapper.lookup(np.array(list(cafa_ids)))
+    assert found.all()
+    assert [ a.decode() for a in mapped.tolist() ] == list(cafa_ids.values())
+
+    annotations = defaultdict(lambda: defaultdict(int))
+    namespaces = dict([ (t, ns) for ns, terms in data['terms'].items() for t in terms[1:] ])
+    with gzip.open(data['true'], 'rt') as f:
+        for a in f:
+            cafa_id, term = a.rstrip('\n').split('\t')
+            annotations[cafa_id][namespaces[term]] += 1
+    assert sorted(annotations) == sorted(cafa_ids.values())
+    for counts in annotations.values():
+        assert sorted(counts) == sorted(data['terms'])
+        assert all([ 1 <= n <= 5 for n in counts.values() ])
+
+    with pytest.raises(ValueError):
+        synthetic.make_benchmark(data['true'] + '.tmp', data['terms'],
+                                 n_proteins=len(synthetic.protein_pairs()) + 1)
+
+def test_make_predictions(data, pred):
+    cafa_ids = dict(data['proteins'])
+    assert set(pred) <= set(cafa_ids)
+    assert len(pred) == pytest.approx(0.7 * len(cafa_ids), abs=30)
+
+    terms = set([ t for terms in data['terms'].values() for t in terms[1:] ])
+    for predictions in pred.values():
+        assert 1 <= len(predictions) <= 19
+        for term, score in predictions:
+            assert term in terms
+            assert 0. <= score <= 1. and round(score, 2) == score
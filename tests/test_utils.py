@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from catool import onto
+from catool import utils
+from catool.sparse import CSRMatrix
+
+@pytest.mark.parametrize('namespace', ('biological_process', 'molecular_function'))
+def test_propagate_terms(data, ancestors, namespace):
+    go = onto.get_go()
+    index2term = go.index2term[namespace]
+    root = onto.namespace2go[namespace]
+    rng = np.random.RandomState(0)
+    m = np.round(rng.rand(20, go.counts[namespace]), 2) \
+        * (rng.rand(20, go.counts[namespace]) < 0.05)
+
+    # each term receives the maximum value of its descendants, but roots
+    # aren't propagated to
+    expected = m.copy()
+    for i, j in zip(*np.nonzero(m)):
+        for term in ancestors[index2term[j]] - {root}:
+            k = go.term2index[namespace][term]
+            expected[i, k] = max(expected[i, k], m[i, j])
+
+    parents = utils.load_parents(namespace)
+    propagated = m.copy()
+    utils.propagate_terms(propagated, *parents)
+    np.testing.assert_array_equal(propagated, expected)
+    propagated = utils.propagate_terms_csr(CSRMatrix.from_dense(m), *parents, block_size=7)
+    np.testing.assert_array_equal(propagated.toarray(), expected)
@@ -0,0 +1,35 @@
+def test_lazy_import(run_python):
+    out = run_python(
+        "import sys, catool\n"
+        "print('numba' in sys.modules, 'catool.main' in sys.modules)\n"
+        "catool.f1max_score\n"
+        "print('catool.main' in sys.modules, catool.onto.__name__)\n"
+        "try:\n"
+        "    catool.unknown\n"
+        "except AttributeError:\n"
+        "    print('AttributeError')\n", synthetic=False)
+    assert out.split('\n') == ['False False', 'True catool.onto', 'AttributeError', '']
+
+# kernels only called from other kernels, which are compiled with them
+INLINED = {'inou._is_space', 'metrics._fmax_from_sums', 'metrics._protein_sweep',
+           'metrics._term_ranking'}
+# kernels only run to build caches, which may already exist
+CACHE_BUILDERS = {'utils._count_parent_annotations'}
+
+def test_warm_up(data, run_python):
+    # a new process, where the kernels of the package are not compiled yet
+    out = run_python(
+        "from catool import instrument\n"
+        "main.warm_up()\n"
+        "for name, (n_compiled, _) in sorted(instrument._kernels().items()):\n"
+        "    print(name, n_compiled)\n"
+        "_, report = main.run_file({!r}, 'full', 'biological_process',\n"
+        "                          weighted=True, profile=True)\n"
+        "print(report['kernels'])\n".format(data['pred']))
+    lines = out.strip().split('\n')
+    assert lines[-1] == '{}'
+    kernels = dict([ a.split() for a in lines[:-1] ])
+    assert len(kernels) > len(INLINED)
+    for name, n_compiled in kernels.items():
+        if name not in CACHE_BUILDERS:
+            assert (int(n_compiled) == 0) == (name in INLINED), name